@@ -0,0 +1,150 @@
+from typing import NamedTuple
+
+import numpy as np
+import numpy.typing as npt
+
+from atmosphere import Atmosphere
+from rocket import Rocket
+from trajectory import Trajectory
+from forces import g, G, M, r0
+from storage import get_columns
+
+
+MU = G * M
+
+
+class Orbit(NamedTuple):
+    a: float
+    e: float
+    period: float
+    apoapsis: float
+    periapsis: float
+    energy: float
+
+
+class FlightAnalytics(NamedTuple):
+    burnout_t: tuple[float, ...]
+    cutoff_t: float
+    cutoff_v: float
+    apogee_t: float
+    apogee: float
+    perigee_t: float
+    perigee: float
+    max_q_t: float
+    max_q: float
+    max_mach_t: float
+    max_mach: float
+    max_accel_t: float
+    max_accel: float
+    gravity_loss: float
+    drag_loss: float
+    orbit: Orbit
+    indices: dict[str, int]
+
+
+def get_orbit(
+    h: float,
+    v: float,
+    tetha: float
+)-> Orbit:
+    # элементы кеплеровой орбиты по высоте, скорости и углу наклона траектории
+    r = r0 + h
+    energy = v ** 2 / 2 - MU / r
+    c = r * v * np.cos(tetha)
+    e = np.sqrt(max(0., 1 + 2 * energy * c ** 2 / MU ** 2))
+    if energy < 0:
+        a = - MU / (2 * energy)
+        period = 2 * np.pi * np.sqrt(a ** 3 / MU)
+        apoapsis = a * (1 + e) - r0
+    else:
+        a = np.inf if energy == 0 else - MU / (2 * energy)
+        period = np.inf
+        apoapsis = np.inf
+    periapsis = c ** 2 / MU / (1 + e) - r0
+    return Orbit(a, e, period, apoapsis, periapsis, energy)
+
+
+def analyze(
+    solution,
+    rt: Rocket,
+    atm: Atmosphere,
+    t: npt.NDArray = None
+)-> FlightAnalytics:
+    # все величины считаются векторно за несколько проходов по сетке решения
+    trajectory = solution if isinstance(solution, Trajectory) else None
+    if t is None:
+        t = solution.t
+        y = solution.y
+    else:
+        y = solution(t)
+    n = len(t)
+    cols = get_columns(t, y, rt, atm, trajectory)
+    h, _, v, tetha, tau = y
+
+    # tau не убывает, поэтому первые индексы достижения уровней находятся двоичным поиском
+    burnouts = np.searchsorted(tau, rt.timeline.t_end[:-1], side="left")
+    burnouts = burnouts[burnouts < n]
+    # выключение - первый шаг, на котором tau растет медленнее времени (двигатель выключен или дросселирован)
+    throttled = np.nonzero(np.diff(tau) < (1 - 1e-6) * np.diff(t))[0]
+    i_cut = int(throttled[0]) if throttled.size else n - 1
+
+    i_apo = int(np.argmax(h))
+    i_peri = i_cut + int(np.argmin(h[i_cut:]))
+    q = cols["rho"] * v ** 2 / 2
+    i_q = int(np.argmax(q))
+    mach = np.where(np.isnan(cols["mach"]), -np.inf, cols["mach"])
+    i_mach = int(np.argmax(mach))
+    accel = (cols["thrust"] - cols["drag"]) / cols["mass"]
+    i_accel = int(np.argmax(accel))
+
+    # потери скорости на активном участке
+    burn = slice(0, i_cut + 1)
+    gravity_loss = np.trapezoid(g(h[burn]) * np.sin(tetha[burn]), t[burn])
+    drag_loss = np.trapezoid(cols["drag"][burn] / cols["mass"][burn], t[burn])
+
+    indices = {
+        "cutoff": i_cut,
+        "apogee": i_apo,
+        "perigee": i_peri,
+        "max_q": i_q,
+        "max_mach": i_mach,
+        "max_accel": i_accel,
+    }
+    for k, i in enumerate(burnouts):
+        indices[f"burnout_{k + 1}"] = int(i)
+
+    return FlightAnalytics(
+        burnout_t=tuple(float(t[i]) for i in burnouts),
+        cutoff_t=float(t[i_cut]),
+        cutoff_v=float(v[i_cut]),
+        apogee_t=float(t[i_apo]),
+        apogee=float(h[i_apo]),
+        perigee_t=float(t[i_peri]),
+        perigee=float(h[i_peri]),
+        max_q_t=float(t[i_q]),
+        max_q=float(q[i_q]),
+        max_mach_t=float(t[i_mach]),
+        max_mach=float(mach[i_mach]),
+        max_accel_t=float(t[i_accel]),
+        max_accel=float(accel[i_accel]),
+        gravity_loss=float(gravity_loss),
+        drag_loss=float(drag_loss),
+        orbit=get_orbit(h[-1], v[-1], tetha[-1]),
+        indices=indices,
+    )
+
+
+if __name__ == "__main__":
+    import time
+    from main import solver
+
+    rt = Rocket()
+    atm = Atmosphere(fast=True)
+    tr = solver(rt, atm, (0, 2000), segmented=True, dense=True)
+
+    t = np.linspace(0, 2000, 1000000)
+    start = time.time()
+    res = analyze(tr, rt, atm, t)
+    print(f"10^6 points, time = {time.time() - start:.3f} s")
+    for name, val in res._asdict().items():
+        print(name, val)
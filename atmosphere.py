@@ -1,5 +1,9 @@
+import bisect
+import math
+
 import numpy as np
-from matplotlib import pyplot as plt
+import numpy.typing as npt
+from typing import NamedTuple
 
 r0 = 6371 * (10 ** 3)
 
@@ -112,7 +116,71 @@ class Atmosphere:
           393., 403., 413., 423., 433., 443., 453., 463., 473., 483., 
           573., 623., 673., 723., 773., 823., 873., 923., 973., 1023.]
 
+    H_arr = np.array(H_table)
+    h_arr = np.array(h_tab)
+    T120_tab = np.array(list(T120.values()))
+    beta120_tab = np.array(list(beta120.values()))
+    P120_tab = np.array(list(P120.values()))
+    T1200_tab = np.array(list(T1200.values()))
+    beta1200_tab = np.array(list(beta1200.values()))
+    Cp_tab = np.array(list(Cp.values()))
+    Cp_vals = Cp_tab.tolist()
+    T120_vals = T120_tab.tolist()
+    beta120_vals = beta120_tab.tolist()
+    logP120_vals = np.log(P120_tab).tolist()
+    T1200_vals = T1200_tab.tolist()
+    beta1200_vals = beta1200_tab.tolist()
+    Cp_slopes = (np.diff(Cp_tab) / np.diff(Tc)).tolist()
+
+    # кусочно-полиномиальные M(h) и n(h): верхние границы участков и коэффициенты a0..a4
+    M_bounds = np.array([94000., 97000., 97500., 120000., 250000., 400000., 650000., 900000., 1050000., 1200000.])
+    M_coefs = np.array([
+        [46.9083, -29.71210 / (10 ** 5), 12.08693 / (10 ** 10), -1.85675 / (10 ** 15)],
+        [40.4668, -15.52722 / (10 ** 5), 3.55735 / (10 ** 10), -3.02340 / (10 ** 16)],
+        [6.3770, 6.25497 / (10 ** 5), -1.10144 / (10 ** 10), 3.36907 / (10 ** 17)],
+        [75.6896, -17.61243 / (10 ** 5), 1.33603 / (10 ** 10), -2.87884 / (10 ** 17)],
+        [112.4838, -30.68086 / (10 ** 5), 2.90329 / (10 ** 10), -9.20616 / (10 ** 17)],
+        [9.8970, -1.19732 / (10 ** 5), 7.78247 / (10 ** 12), -1.77541 / (10 ** 18)],
+    ])
+    n_bounds = np.array([150000., 200000., 250000., 350000., 450000., 600000., 800000., 1000000., 1200000.])
+    n_coefs = np.array([
+        [0.210005867 * (10 ** 4), -0.5618444757 / 10, 0.5663986231 / (10 ** 6), -0.2547466858 / (10 ** 11), 0.4309844119 / (10 ** 17)],
+        [0.10163937 * (10 ** 4), -0.2119530830 / 10, 0.1671627815 / (10 ** 6), -0.5894237068 / (10 ** 12), 0.7826684089 / (10 ** 18)],
+        [0.7631575 * (10 ** 3), -0.1150600844 / 10, 0.6612598428 / (10 ** 7), -0.1708736137 / (10 ** 12), 0.1669823114 / (10 ** 18)],
+        [0.1882203 * (10 ** 3), -0.2265999519 / 100, 0.1041726141 / (10 ** 7), -0.2155574922 / (10 ** 13), 0.1687430962 / (10 ** 19)],
+        [0.2804823 * (10 ** 3), -0.2432231125 / 100, 0.8055024663 / (10 ** 8), -0.1202418519 / (10 ** 13), 0.6805101379 / (10 ** 20)],
+        [0.5599362 * (10 ** 3), -0.3714141392 / 100, 0.9358870345 / (10 ** 8), -0.1058591881 / (10 ** 13), 0.4525531532 / (10 ** 20)],
+        [0.8358756 * (10 ** 3), -0.4265393073 / 100, 0.8252842085 / (10 ** 8), -0.7150127437 / (10 ** 14), 0.2335744331 / (10 ** 20)],
+        [0.8364965 * (10 ** 2), -0.3162492458 / (10 ** 3), 0.4602064246 / (10 ** 9), -0.3021858469 / (10 ** 15), 0.7512304301 / (10 ** 22)],
+        [0.383220 * (10 ** 2), -0.50980 / (10 ** 4), 0.18100 / (10 ** 10), 0., 0.],
+    ])
+    n_scale = np.array([10. ** 17, 10. ** 16, 10. ** 15, 10. ** 15, 10. ** 14, 10. ** 13, 10. ** 12, 10. ** 12, 10. ** 11])
+
     
+    _tables = {}
+
+
+    def __init__(
+        self,
+        fast: bool = False,
+        rtol: float = 1e-6,
+        rho_scale: float = 1.
+    )-> None:
+        self.fast = fast
+        self.rtol = rtol
+        self.rho_scale = rho_scale
+
+
+    def get_table(
+        self
+    )-> "AtmosphereTable":
+        table = Atmosphere._tables.get(self.rtol)
+        if table is None:
+            table = AtmosphereTable.build(Atmosphere(), self.rtol)
+            Atmosphere._tables[self.rtol] = table
+        return table
+
+
     @staticmethod
     def get_H(
         h: float
@@ -203,6 +271,8 @@ class Atmosphere:
         self,
         h: float
     )-> float:
+        if self.fast:
+            return self.get_table().get_P(h)
         if h < 120000:
             H = self.get_H(h)
             ir = self.get_upper_ids(self.H_table, H)
@@ -275,29 +345,29 @@ class Atmosphere:
         self,
         h: float
     )-> float:
-        return self.get_P(h) * self.get_M(h) / (self.R * self.get_T(h))
+        if self.fast:
+            return self.rho_scale * self.get_table().get_rho(h)
+        return self.rho_scale * self.get_P(h) * self.get_M(h) / (self.R * self.get_T(h))
 
 
     def get_Cp(
         self,
         h: float
     )-> float:
-        T = self.get_T(h)
+        return self.Cp_from_T(self.get_T(h))
 
-        buffer = []
 
-        for i in range(len(self.Tc) - 1):
-            buffer.append((self.Cp[self.Tc[i+1]] - self.Cp[self.Tc[i]])/(self.Tc[i+1] - self.Tc[i]))
-        buffer.append(buffer[-1])
-
-        if T < self.Tc[0]:
-            return self.Cp[self.Tc[0]]
-        
-        for i in range(len(self.Tc) - 1):
-            if (self.Tc[i] <= T and T < self.Tc[i+1]):
-                return self.Cp[self.Tc[i]] + buffer[i] * (T - self.Tc[i])
-            
-        return self.Cp[self.Tc[-1]]
+    @classmethod
+    def Cp_from_T(
+        cls,
+        T: float
+    )-> float:
+        if T < cls.Tc[0]:
+            return cls.Cp_vals[0]
+        i = bisect.bisect_right(cls.Tc, T) - 1
+        if i >= len(cls.Cp_slopes):
+            return cls.Cp_vals[-1]
+        return cls.Cp_vals[i] + cls.Cp_slopes[i] * (T - cls.Tc[i])
     
 
     def get_Cv(
@@ -321,11 +391,336 @@ class Atmosphere:
         self,
         h: float
     ) -> float:
+        if self.fast:
+            return self.get_table().get_Vs(h)
         return np.sqrt(self.get_gamma(h) * self.R * self.get_T(h) / self.Mc)
 
 
+    @staticmethod
+    def polyval(
+        coefs: np.ndarray,
+        h: np.ndarray
+    )-> np.ndarray:
+        res = coefs[:, -1].copy()
+        for j in range(coefs.shape[1] - 2, -1, -1):
+            res = res * h + coefs[:, j]
+        return res
+
+
+    def get_M_array(
+        self,
+        h: np.ndarray
+    )-> np.ndarray:
+        seg = np.searchsorted(self.M_bounds, h, side="left")
+        M = np.full(h.shape, self.Mc)
+
+        m = seg == 1
+        hs = h[m]
+        M[m] = 28.82 + 0.158 * np.sqrt(1 - 7.5 / (10 ** 8) * ((hs - 94000) ** 2)) - (2.479 / (10 ** 4)) * np.sqrt(97000 - hs)
+        m = seg == 2
+        M[m] = self.M97 - 0.00012 * (97500 - h[m])
+        m = seg == 3
+        M[m] = self.M975 - 0.0001511 * (120000 - h[m])
+        m = seg >= 4
+        M[m] = self.polyval(self.M_coefs[seg[m] - 4], h[m])
+        return M
+
+
+    def get_n_array(
+        self,
+        h: np.ndarray
+    )-> np.ndarray:
+        seg = np.searchsorted(self.n_bounds, h, side="left")
+        n = np.zeros(h.shape)
+        m = seg < len(self.n_bounds)
+        n[m] = self.polyval(self.n_coefs[seg[m]], h[m]) * self.n_scale[seg[m]]
+        return n
+
+
+    def get_state(
+        self,
+        h: npt.ArrayLike
+    )-> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        h = np.asarray(h, dtype=float)
+        shape = h.shape
+        h = h.ravel()
+        if h.size and h.max() > 1200000.:
+            raise KeyboardInterrupt("h > 1200km", h.max())
+
+        M = self.get_M_array(h)
+        T = np.empty(h.shape)
+        P = np.empty(h.shape)
+
+        lo = h < 120000
+        H = self.get_H(h[lo])
+        ir = np.searchsorted(self.H_table, H, side="left")
+        T0 = self.T120_tab[ir]
+        beta = self.beta120_tab[ir]
+        TM = T0 + beta * (H - self.H_arr[ir])
+        T[lo] = TM * M[lo] / self.Mc
+        logP0 = np.log(self.P120_tab[ir])
+        grad = beta != 0
+        Plo = np.empty(H.shape)
+        Plo[grad] = np.exp(logP0[grad] - 9.81 * np.log(TM[grad] / T0[grad]) /
+                           (beta[grad] * self.R / M[lo][grad]))
+        iso = ~grad
+        Plo[iso] = np.exp(logP0[iso] - 9.81 * 0.434294 * M[lo][iso] * (H[iso] - self.H_arr[ir[iso]]) /
+                          self.R / T[lo][iso])
+        P[lo] = Plo
+
+        hi = ~lo
+        ir = np.searchsorted(self.h_tab, h[hi], side="left")
+        T[hi] = self.T1200_tab[ir] + self.beta1200_tab[ir] * (h[hi] - self.h_arr[ir])
+        P[hi] = self.get_n_array(h[hi]) * self.R * T[hi] / self.Na
+
+        rho = self.rho_scale * P * M / (self.R * T)
+        Cp = np.interp(T, self.Tc, self.Cp_tab)
+        gamma = Cp / (Cp - self.R / self.Mc)
+        Vs = np.sqrt(gamma * self.R * T / self.Mc)
+
+        return tuple(x.reshape(shape) for x in (T, P, rho, M, Vs))
+
+
+    def evaluate(
+        self,
+        h: float
+    )-> "AtmosphereState":
+        M = self.get_M(h)
+        if h < 120000:
+            H = self.get_H(h)
+            ir = self.get_upper_ids(self.H_table, H)
+            Hk = self.H_table[ir]
+            T0 = self.T120_vals[ir]
+            beta = self.beta120_vals[ir]
+            TM = T0 + beta * (H - Hk)
+            T = TM * M / self.Mc
+            if beta != 0:
+                P = math.exp(self.logP120_vals[ir] - 9.81 * math.log(TM / T0) / (beta * self.R / M))
+            else:
+                P = math.exp(self.logP120_vals[ir] - 9.81 * 0.434294 * M * (H - Hk) / self.R / T)
+            n = P * self.Na / (self.R * T)
+        else:
+            H = self.get_H(h)
+            ir = self.get_upper_ids(self.h_tab, h)
+            T = self.T1200_vals[ir] + self.beta1200_vals[ir] * (h - self.h_tab[ir])
+            n = self.get_n(h)
+            P = n * self.R * T / self.Na
+        rho = self.rho_scale * P * M / (self.R * T)
+        Cp = self.Cp_from_T(T)
+        gamma = Cp / (Cp - self.R / self.Mc)
+        Vs = math.sqrt(gamma * self.R * T / self.Mc)
+        return AtmosphereState(h, H, ir, M, T, P, n, rho, Cp, gamma, Vs)
+
+
+    def get_flow_vals(
+        self,
+        h: float
+    )-> tuple[float, float, float]:
+        if self.fast:
+            P, rho, Vs = self.get_table().get_vals(h)
+            return (P, self.rho_scale * rho, Vs)
+        st = self.evaluate(h)
+        return (st.P, st.rho, st.Vs)
+
+
+    def get_flow_grad(
+        self,
+        h: float,
+        dh: float = 1.
+    )-> tuple[float, float, float, float, float, float]:
+        # P, rho, Vs и их производные по высоте центральной разностью на +-dh:
+        # скачки модели в узлах таблиц попадают в производную, а не теряются, как при дифференцировании по участку
+        P, rho, Vs = self.get_flow_vals(h)
+        lo = max(h - dh, 0.)
+        hi = min(h + dh, AtmosphereTable.h_max)
+        P_lo, rho_lo, Vs_lo = self.get_flow_vals(lo)
+        P_hi, rho_hi, Vs_hi = self.get_flow_vals(hi)
+        return (P, rho, Vs, (P_hi - P_lo) / (hi - lo), (rho_hi - rho_lo) / (hi - lo), (Vs_hi - Vs_lo) / (hi - lo))
+
+
+class AtmosphereState(NamedTuple):
+    h: float
+    H: float
+    ir: int
+    M: float
+    T: float
+    P: float
+    n: float
+    rho: float
+    Cp: float
+    gamma: float
+    Vs: float
+
+
+class AtmosphereTable:
+    h_max = 1200000.
+    h_step = 1000.
+    min_width = 1e-3 #м
+
+    def __init__(
+        self,
+        h: npt.NDArray,
+        P: npt.NDArray,
+        rho: npt.NDArray,
+        Vs: npt.NDArray,
+        rtol: float,
+        max_err: float
+    )-> None:
+        self.h = h
+        self.rtol = rtol
+        self.max_err = max_err
+        # давление и плотность интерполируются в логарифмах, скорость звука - линейно
+        self.log_P = np.log(P)
+        self.log_rho = np.log(rho)
+        self.Vs = Vs
+
+        dh = np.diff(h)
+        with np.errstate(divide="ignore", over="ignore", invalid="ignore"):
+            k_P = np.diff(self.log_P) / dh
+            k_rho = np.diff(self.log_rho) / dh
+            k_Vs = np.diff(Vs) / dh
+        # интервалы нулевой ширины в точках разрыва
+        jump = ~(np.isfinite(k_P) & np.isfinite(k_rho) & np.isfinite(k_Vs))
+        k_P[jump] = k_rho[jump] = k_Vs[jump] = 0.
+
+        self._h = h.tolist()
+        self._log_P = self.log_P.tolist()
+        self._log_rho = self.log_rho.tolist()
+        self._Vs = Vs.tolist()
+        self._k_P = k_P.tolist()
+        self._k_rho = k_rho.tolist()
+        self._k_Vs = k_Vs.tolist()
+        self._last = len(h) - 2
+
+
+    @classmethod
+    def get_breakpoints(
+        cls,
+        atm: Atmosphere
+    )-> npt.NDArray:
+        # узлы таблицы по геопотенциальной высоте переводятся в геометрическую с точностью до ulp
+        lower = []
+        for H in atm.H_table:
+            h = r0 * H / (r0 - H)
+            while h > 0 and atm.get_H(h) > H:
+                h = np.nextafter(h, -np.inf)
+            while atm.get_H(np.nextafter(h, np.inf)) <= H:
+                h = np.nextafter(h, np.inf)
+            lower.append(h)
+        points = np.concatenate([
+            lower,
+            atm.h_arr,
+            atm.M_bounds,
+            atm.n_bounds,
+        ])
+        points = points[(points >= 0) & (points < cls.h_max)]
+        # модель разрывна в узлах таблиц, причем не везде значение в узле относится к нижнему участку
+        points = np.concatenate([np.nextafter(points, -np.inf), points, np.nextafter(points, np.inf)])
+        return points[points >= 0]
+
+
+    @classmethod
+    def build(
+        cls,
+        atm: Atmosphere,
+        rtol: float
+    )-> "AtmosphereTable":
+        h = np.unique(np.concatenate([
+            np.arange(0., cls.h_max, cls.h_step),
+            [cls.h_max],
+            cls.get_breakpoints(atm),
+        ]))
+        _, P, rho, _, Vs = atm.get_state(h)
+
+        while True:
+            err = np.zeros(len(h) - 1)
+            # ошибка оценивается в середине и четвертях каждого интервала
+            for q in (0.25, 0.75, 0.5):
+                mid = h[:-1] + q * (h[1:] - h[:-1])
+                _, Pm, rhom, _, Vsm = atm.get_state(mid)
+                err = np.maximum.reduce([
+                    err,
+                    np.abs(np.exp(np.interp(mid, h, np.log(P))) / Pm - 1),
+                    np.abs(np.exp(np.interp(mid, h, np.log(rho))) / rhom - 1),
+                    np.abs(np.interp(mid, h, Vs) / Vsm - 1),
+                ])
+            bad = (err > rtol) & (np.diff(h) > cls.min_width)
+            if not bad.any():
+                break
+            order = np.argsort(np.concatenate([h, mid[bad]]), kind="stable")
+            h = np.concatenate([h, mid[bad]])[order]
+            P = np.concatenate([P, Pm[bad]])[order]
+            rho = np.concatenate([rho, rhom[bad]])[order]
+            Vs = np.concatenate([Vs, Vsm[bad]])[order]
+
+        return cls(h, P, rho, Vs, rtol, float(err.max()))
+
+
+    def get_idx(
+        self,
+        h: float
+    )-> int:
+        if h > self.h_max:
+            raise KeyboardInterrupt("h > 1200km", h)
+        i = bisect.bisect_left(self._h, h) - 1
+        if i < 0:
+            return 0
+        if i > self._last:
+            return self._last
+        return i
+
+
+    def get_P(
+        self,
+        h: float
+    )-> float:
+        i = self.get_idx(h)
+        return math.exp(self._log_P[i] + self._k_P[i] * (h - self._h[i]))
+
+
+    def get_rho(
+        self,
+        h: float
+    )-> float:
+        i = self.get_idx(h)
+        return math.exp(self._log_rho[i] + self._k_rho[i] * (h - self._h[i]))
+
+
+    def get_Vs(
+        self,
+        h: float
+    )-> float:
+        i = self.get_idx(h)
+        return self._Vs[i] + self._k_Vs[i] * (h - self._h[i])
+
+
+    def get_vals(
+        self,
+        h: float
+    )-> tuple[float, float, float]:
+        i = self.get_idx(h)
+        dh = h - self._h[i]
+        return (math.exp(self._log_P[i] + self._k_P[i] * dh),
+                math.exp(self._log_rho[i] + self._k_rho[i] * dh),
+                self._Vs[i] + self._k_Vs[i] * dh)
+
+
+    def get_state(
+        self,
+        h: npt.ArrayLike
+    )-> tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+        h = np.asarray(h, dtype=float)
+        if h.size and h.max() > self.h_max:
+            raise KeyboardInterrupt("h > 1200km", h.max())
+        P = np.exp(np.interp(h, self.h, self.log_P))
+        rho = np.exp(np.interp(h, self.h, self.log_rho))
+        Vs = np.interp(h, self.h, self.Vs)
+        return (P, rho, Vs)
+
 
 if __name__ == "__main__":
+    from matplotlib import pyplot as plt
+
     H = np.linspace(0, 1200000, 10000)
     atm = Atmosphere()
 
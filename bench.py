@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# высоты и числа Маха для микротестов, одинаковые между запусками
+H_POINTS = np.linspace(0., 1200000., 257).tolist()
+H_LOW = np.linspace(0., 100000., 257).tolist()
+MACH_POINTS = np.linspace(0., 12., 257).tolist()
+TAU_POINTS = np.linspace(0., 600., 257).tolist()
+
+
+def measure(
+    fn,
+    number: int,
+    repeat: int = 15,
+    timed: bool = False
+)-> float:
+    # минимум по повторам времени одного вызова: наименее зашумленная оценка;
+    # timed - случай сам возвращает измеренное время в секундах
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        total = 0.
+        for _ in range(number):
+            res = fn()
+            if timed:
+                total += res
+        times.append((total if timed else time.perf_counter() - start) / number)
+    return min(times)
+
+
+def get_micro(
+):
+    from atmosphere import Atmosphere
+    from rocket import Rocket
+    from main import get_vals
+
+    atm = Atmosphere()
+    atm_fast = Atmosphere(fast=True)
+    atm_fast.get_table()
+    rt = Rocket()
+
+    def loop(f, points):
+        def run():
+            for x in points:
+                f(x)
+        return run
+
+    cases = {
+        "atmosphere.get_rho": loop(atm.get_rho, H_POINTS),
+        "atmosphere.get_P": loop(atm.get_P, H_POINTS),
+        "atmosphere.get_Vs": loop(atm.get_Vs, H_POINTS),
+        "atmosphere.get_Cp": loop(atm.get_Cp, H_POINTS),
+        "atmosphere.get_flow_vals": loop(atm.get_flow_vals, H_POINTS),
+        "atmosphere.get_flow_vals[fast]": loop(atm_fast.get_flow_vals, H_POINTS),
+        "atmosphere.get_state[257]": lambda: atm.get_state(H_POINTS),
+        "rocket.get_aero_cf": loop(lambda m: rt.get_aero_cf(m, 30000.), MACH_POINTS),
+        "rocket.get_current_total_m": loop(rt.get_current_total_m, TAU_POINTS),
+        "main.get_vals": loop(lambda h: get_vals(100., 2000., h, rt, atm), H_LOW),
+        "main.get_vals[fast]": loop(lambda h: get_vals(100., 2000., h, rt, atm_fast), H_LOW),
+    }
+    # время приводится к одной точке
+    return {name: (fn, 257, False) for name, fn in cases.items()}
+
+
+def get_macro(
+):
+    from atmosphere import Atmosphere
+    from rocket import Rocket
+    from main import solver, find_active_idx, find_geecentrical_coords
+
+    rt = Rocket()
+    atm = Atmosphere()
+    atm_fast = Atmosphere(fast=True)
+    atm_fast.get_table()
+    t_span = (0, 1000)
+    solution = solver(rt, atm, (0, 700))
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def startup(module):
+        # накопленное время импорта модуля по -X importtime в новом интерпретаторе, без запуска самого
+        # интерпретатора; модуль верхнего уровня выводится последним
+        def run():
+            out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=here,
+                                 check=True, capture_output=True, text=True)
+            return int(out.stderr.splitlines()[-1].split("|")[1]) * 1e-6
+        return run
+
+    timed = {
+        "startup[import main]": startup("main"),
+        "startup[import cli]": startup("cli"),
+    }
+    cases = {
+        "solver[default,0-700]": lambda: solver(rt, atm, (0, 700)),
+        "solver[segmented]": lambda: solver(rt, atm, t_span, segmented=True, dense=True),
+        "solver[segmented,fast]": lambda: solver(rt, atm_fast, t_span, segmented=True, dense=True),
+        "solver[segmented,dopri5]": lambda: solver(rt, atm_fast, t_span, segmented=True, dense=True,
+                                                    backend="dopri5"),
+        "find_geecentrical_coords[10^6]": lambda: find_geecentrical_coords(solution.y[0], solution.y[1]),
+        "find_active_idx[10^6]": lambda: find_active_idx(solution),
+    }
+    res = {name: (fn, 1, True) for name, fn in timed.items()}
+    res.update((name, (fn, 1, False)) for name, fn in cases.items())
+    return res
+
+
+def run_suite(
+    names: list[str] = None,
+    quick: bool = False,
+    macro: bool = True,
+    rounds: int = 1
+)-> tuple[dict[str, float], dict[str, float]]:
+    # rounds проходов по всему набору: дрейф скорости машины попадает в разброс между проходами;
+    # результат - минимум по проходам и относительный разброс max/min - 1
+    suites = [get_micro()]
+    if macro:
+        suites.append(get_macro())
+    cases = {name: case for suite in suites for name, case in suite.items()
+             if not names or any(pattern in name for pattern in names)}
+
+    plans = {}
+    for name, (fn, _, timed) in cases.items():
+        fn()
+        # число вызовов подбирается так, чтобы один повтор занимал ~0.05 с
+        t_one = measure(fn, 1, 1, timed)
+        number = max(1, int(0.05 / max(t_one, 1e-9)))
+        plans[name] = (number, 3 if quick else (3 if t_one > 1. else 15), timed)
+
+    times = {name: [] for name in cases}
+    for k in range(rounds):
+        for name, (fn, scale, _) in cases.items():
+            times[name].append(measure(fn, *plans[name]) / scale)
+            print(f"{name:40s} {times[name][-1] * 1e6:14.3f} us" + (f"  (round {k + 1})" if rounds > 1 else ""))
+    res = {name: min(ts) for name, ts in times.items()}
+    noise = {name: max(ts) / min(ts) - 1 for name, ts in times.items()}
+    return (res, noise)
+
+
+def compare(
+    results: dict[str, float],
+    baseline: dict[str, float],
+    threshold: float,
+    noise: dict[str, float] = None
+)-> list[str]:
+    # допустимое замедление - threshold плюс разброс случая, записанный вместе с базовой линией; разброс ограничен
+    # threshold, иначе на шумной машине допуск доходит до x2 и регрессии проходят незамеченными
+    noise = {} if noise is None else noise
+    regressions = []
+    for name, t in results.items():
+        if name not in baseline:
+            continue
+        ratio = t / baseline[name]
+        limit = 1 + threshold + min(noise.get(name, 0.), threshold)
+        flag = ""
+        if ratio > limit:
+            flag = "REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 / limit:
+            flag = "faster"
+        print(f"{name:40s} {baseline[name] * 1e6:14.3f} -> {t * 1e6:14.3f} us  x{ratio:6.3f} (limit x{limit:5.2f}) "
+              f"{flag}")
+    return regressions
+
+
+def get_machine(
+)-> dict:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарки атмосферы, аэродинамики и интегрирования траектории")
+    parser.add_argument("-k", dest="names", action="append", help="выполнять только тесты, содержащие подстроку")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="записать результаты как новую базовую линию")
+    parser.add_argument("--threshold", type=float, default=0.25, help="допустимое относительное замедление")
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--micro", action="store_true", help="только микротесты")
+    parser.add_argument("--rounds", type=int, help="число проходов по набору (по умолчанию 3 при --save, иначе 1)")
+    args = parser.parse_args()
+
+    rounds = args.rounds if args.rounds is not None else (3 if args.save else 1)
+    results, noise = run_suite(args.names, args.quick, not args.micro, rounds)
+
+    if args.save:
+        baseline = {"results": {}, "noise": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline.update(json.load(f))
+        baseline["results"].update(results)
+        baseline.setdefault("noise", {}).update(noise)
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": get_machine(), "results": baseline["results"], "noise": baseline["noise"]}, f,
+                      indent=1, sort_keys=True)
+        print(f"baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != get_machine():
+            print("warning: baseline was recorded on a different machine or environment")
+        base_noise = baseline.get("noise", {})
+        regressions = compare(results, baseline["results"], args.threshold, base_noise)
+        if regressions:
+            # замедление засчитывается, только если повторяется в трех новых проходах с полным числом повторов
+            print("re-measuring: " + ", ".join(regressions))
+            again, _ = run_suite(regressions, False, not args.micro, 3)
+            results.update({name: min(results[name], again[name]) for name in again})
+            regressions = compare({name: results[name] for name in again}, baseline["results"], args.threshold,
+                                  base_noise)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond the noise band: {', '.join(regressions)}")
+            sys.exit(1)
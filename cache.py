@@ -0,0 +1,298 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # без fcntl (Windows) блокировки не ставятся, запись остается атомарной за счет os.replace
+    fcntl = None
+
+from atmosphere import Atmosphere, AtmosphereTable
+from rocket import Rocket
+from guidance import Guidance, GUIDANCE
+
+
+CACHE_DIR = os.environ.get("ROCKET_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "TwoStageRocketFlight"))
+
+# модули, от которых зависит результат расчета: изменение любого из них меняет версию кеша
+MODEL_MODULES = ("main", "rocket", "atmosphere", "forces", "guidance", "integrators", "kepler", "trajectory")
+
+SUFFIX = ".pkl"
+
+_code_version = None
+
+
+def get_code_version(
+)-> str:
+    global _code_version
+    if _code_version is None:
+        import importlib.util
+        import scipy
+
+        h = hashlib.sha256()
+        h.update(f"numpy {np.__version__}, scipy {scipy.__version__}".encode())
+        for name in MODEL_MODULES:
+            with open(importlib.util.find_spec(name).origin, "rb") as f:
+                h.update(f.read())
+        _code_version = h.hexdigest()
+    return _code_version
+
+
+def describe(
+    obj
+):
+    # каноническое представление входных данных для ключа: все атрибуты объекта и его класса
+    if obj is None or isinstance(obj, (bool, str)):
+        return obj
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    # целые и вещественные значения одной величины (42000 и 42000.0 из файла описания) дают один ключ
+    if isinstance(obj, (int, float, np.integer, np.floating)):
+        return float(obj).hex()
+    if isinstance(obj, np.ndarray):
+        return ["ndarray", obj.dtype.str, obj.shape, hashlib.sha256(np.ascontiguousarray(obj).tobytes()).hexdigest()]
+    if isinstance(obj, tuple) and hasattr(obj, "_fields"):
+        return [type(obj).__name__, {name: describe(val) for name, val in obj._asdict().items()}]
+    if isinstance(obj, (list, tuple)):
+        return [describe(val) for val in obj]
+    if isinstance(obj, dict):
+        return {str(k): describe(v) for k, v in sorted(obj.items(), key=lambda kv: str(kv[0]))}
+    if hasattr(obj, "__dict__"):
+        attrs = {}
+        for cls in reversed(type(obj).__mro__[:-1]):
+            for name, val in vars(cls).items():
+                if not name.startswith("__") and not callable(val) and not isinstance(val, (classmethod,
+                                                                                           staticmethod, property)):
+                    attrs[name] = val
+        # таблицы, построенные по классу при первом обращении, не входят в описание
+        attrs.pop("_tables", None)
+        attrs.update(vars(obj))
+        return [type(obj).__name__, describe(attrs)]
+    raise TypeError(f"cannot build cache key from {type(obj).__name__}")
+
+
+def get_key(
+    *parts
+)-> str:
+    data = json.dumps([get_code_version(), describe(list(parts))], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class ResultCache:
+    # записи - сжатые pickle-файлы с именем по ключу; порядок LRU - по времени изменения файла,
+    # которое обновляется при каждом попадании; запись атомарна (временный файл и os.replace)
+
+    def __init__(
+        self,
+        path: str = CACHE_DIR,
+        max_bytes: int = 1 << 30,
+        level: int = 1,
+        compress_limit: int = 1 << 23
+    )-> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.level = level
+        # большие сетки (10^6 точек) сжимаются дольше расчета и записываются без сжатия
+        self.compress_limit = compress_limit
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.join(path, "locks"), exist_ok=True)
+
+
+    def get_file(
+        self,
+        key: str
+    )-> str:
+        return os.path.join(self.path, key + SUFFIX)
+
+
+    @contextmanager
+    def lock(
+        self,
+        name: str
+    ):
+        # блокировки по полосам: процессы, считающие один ключ, ждут друг друга
+        with open(os.path.join(self.path, "locks", name), "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+    def get(
+        self,
+        key: str,
+        default = None
+    ):
+        path = self.get_file(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return default
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        if data[:1] == b"z":
+            data = zlib.decompress(data[1:])
+        return pickle.loads(data[1:] if data[:1] == b"r" else data)
+
+
+    def put(
+        self,
+        key: str,
+        value
+    )-> None:
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        data = b"z" + zlib.compress(data, self.level) if len(data) <= self.compress_limit else b"r" + data
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.get_file(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.evict()
+
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute
+    ):
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self.lock(key[:2]):
+            # пока ждали блокировку, значение мог записать другой процесс
+            value = self.get(key)
+            if value is None:
+                self.misses -= 1
+                value = compute()
+                self.put(key, value)
+        return value
+
+
+    def get_entries(
+        self
+    )-> list[tuple[float, int, str]]:
+        res = []
+        for name in os.listdir(self.path):
+            if name.endswith(SUFFIX):
+                try:
+                    st = os.stat(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    continue
+                res.append((st.st_mtime, st.st_size, name))
+        return sorted(res)
+
+
+    def evict(
+        self
+    )-> int:
+        # удаление давно не использованных записей до размера max_bytes
+        with self.lock("evict"):
+            entries = self.get_entries()
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, name in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+        return removed
+
+
+    def clear(
+        self
+    )-> None:
+        with self.lock("evict"):
+            for _, _, name in self.get_entries():
+                try:
+                    os.unlink(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    pass
+
+
+    def stats(
+        self
+    )-> dict:
+        entries = self.get_entries()
+        return {"entries": len(entries), "bytes": sum(size for _, size, _ in entries), "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses}
+
+
+def load_table(
+    atm: Atmosphere,
+    cache: ResultCache
+)-> AtmosphereTable:
+    # таблица быстрой атмосферы берется с диска, если ее еще нет в памяти процесса
+    table = Atmosphere._tables.get(atm.rtol)
+    if table is None:
+        key = get_key("atmosphere-table", atm.rtol, Atmosphere())
+        table = cache.get_or_compute(key, lambda: AtmosphereTable.build(Atmosphere(), atm.rtol))
+        Atmosphere._tables[atm.rtol] = table
+    return table
+
+
+def cached_solve(
+    cache: ResultCache,
+    rt: Rocket,
+    atm: Atmosphere,
+    t_span: tuple[float, float],
+    segmented: bool = False,
+    dense: bool = False,
+    guidance: Guidance = GUIDANCE,
+    **options
+):
+    from main import solver
+
+    if atm.fast:
+        load_table(atm, cache)
+    if any(callable(val) for val in options.values()):
+        # обратные вызовы (progress) не входят в ключ: такой расчет не кешируется
+        return solver(rt, atm, t_span, segmented, dense, guidance, **options)
+    key = get_key("solver", rt, atm, [float(t) for t in t_span], segmented, dense, guidance, options)
+    return cache.get_or_compute(key, lambda: solver(rt, atm, t_span, segmented, dense, guidance, **options))
+
+
+if __name__ == "__main__":
+    from main import solver
+
+    rt = Rocket()
+    atm = Atmosphere(fast=True)
+    t_span = (0, 2000)
+
+    with tempfile.TemporaryDirectory() as root:
+        cache = ResultCache(root, max_bytes=1 << 22)
+        for label in ("cold", "warm"):
+            start = time.perf_counter()
+            tr = solver(rt, atm, t_span, segmented=True, dense=True, cache=cache)
+            print(f"{label}: {1e3 * (time.perf_counter() - start):.2f} ms, h(1000) = {tr(1000.)[0]}")
+
+        # другой вариант ракеты - другой ключ
+        start = time.perf_counter()
+        solver(Rocket(cx_scale=1.1), atm, t_span, segmented=True, dense=True, cache=cache)
+        print(f"cx_scale = 1.1: {1e3 * (time.perf_counter() - start):.2f} ms")
+        for cx_scale in np.linspace(0.8, 1.2, 20):
+            solver(Rocket(cx_scale=cx_scale), atm, t_span, segmented=True, dense=True, cache=cache)
+        print(cache.stats())
@@ -0,0 +1,227 @@
+import time
+
+START = time.perf_counter()
+
+import argparse
+import json
+import os
+import sys
+import warnings
+
+import numpy as np
+
+from atmosphere import Atmosphere
+from rocket import Rocket, get_stage_one, get_stage_two
+from vehicle import read_spec, build_rocket
+from main import solver, find_active_idx, find_geecentrical_coords
+
+IMPORT_TIME = time.perf_counter() - START
+
+# параметры решателя по участкам; с --direct действуют значения по умолчанию solve_ivp
+SEGMENTED_DEFAULTS = {"method": "RK45", "rtol": 1e-8, "atol": 1e-6}
+
+
+def get_parser(
+)-> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Расчет выведения ракеты без дисплея")
+    vehicle = parser.add_argument_group("vehicle")
+    vehicle.add_argument("--vehicle", help="описание ракеты в JSON/TOML или имя из vehicles/ (vehicle.py); "
+                                           "параметры ступеней ниже заменяют значения из описания")
+    vehicle.add_argument("--fuel-m1", type=float, help="масса топлива первой ступени, кг")
+    vehicle.add_argument("--fuel-m2", type=float, help="масса топлива второй ступени, кг")
+    vehicle.add_argument("--dot-m1", type=float, help="расход первой ступени, кг/с")
+    vehicle.add_argument("--dot-m2", type=float, help="расход второй ступени, кг/с")
+    vehicle.add_argument("--v-a1", type=float, help="скорость истечения первой ступени, м/с")
+    vehicle.add_argument("--v-a2", type=float, help="скорость истечения второй ступени, м/с")
+    vehicle.add_argument("--payload", action="store_true", help="полезная нагрузка 21000 кг (с --vehicle - из описания)")
+    vehicle.add_argument("--cx-scale", type=float, default=1.)
+    vehicle.add_argument("--rho-scale", type=float, default=1.)
+
+    run = parser.add_argument_group("solver")
+    run.add_argument("--t-start", type=float, default=0.)
+    run.add_argument("--t-end", type=float, help="по умолчанию как в main.py: 32900 с после выключения двигателей")
+    run.add_argument("--direct", action="store_true", help="без разбиения на участки (solve_ivp с max_step=0.1)")
+    run.add_argument("--backend", default="scipy", choices=("scipy", "dopri5", "rk4"))
+    run.add_argument("--method", help="метод solve_ivp для --backend scipy (по умолчанию RK45)")
+    run.add_argument("--rtol", type=float, help="по умолчанию 1e-8, с --direct 1e-3 (как в solve_ivp)")
+    run.add_argument("--atol", type=float, help="по умолчанию 1e-6")
+    run.add_argument("--step", type=float, help="шаг для --backend rk4")
+    run.add_argument("--fast-atm", action="store_true", help="табличная атмосфера")
+    run.add_argument("--coast", action="store_true", help="пассивный полет выше 1200 км по формулам Кеплера")
+    run.add_argument("--profile", action="store_true", help="добавить отчет профилирования в summary.json")
+    run.add_argument("--cache", metavar="DIR", help="каталог кеша результатов (cache.py); повторный расчет читается с диска")
+
+    out = parser.add_argument_group("output")
+    out.add_argument("-o", "--out", default=".", help="каталог для результатов")
+    out.add_argument("--data", action="store_true", help="записать столбцы траектории (storage.py)")
+    out.add_argument("--samples", type=int, default=100000, help="число точек для --data и графиков")
+    out.add_argument("--float32", action="store_true")
+    out.add_argument("--plot", action=argparse.BooleanOptionalAction, default=False,
+                     help="записать графики в PNG (matplotlib, backend Agg)")
+    return parser
+
+
+def build_vehicle(
+    args: argparse.Namespace,
+    description: dict = None
+)-> tuple[Rocket, Atmosphere]:
+    # description - уже прочитанное описание --vehicle (service.py), файл тогда не читается
+    if args.vehicle is None:
+        st1 = get_stage_one(fuel_m=args.fuel_m1, dot_m=args.dot_m1, v_a=args.v_a1)
+        st2 = get_stage_two(fuel_m=args.fuel_m2, dot_m=args.dot_m2, v_a=args.v_a2)
+        rt = Rocket(stage_one=st1, stage_two=st2, payload=args.payload, cx_scale=args.cx_scale)
+    else:
+        spec = read_spec(args.vehicle) if description is None else description
+        stages = [dict(st) for st in spec.get("stages", ())]
+        overrides = ((args.fuel_m1, args.dot_m1, args.v_a1), (args.fuel_m2, args.dot_m2, args.v_a2))
+        for k, vals in enumerate(overrides):
+            vals = {name: val for name, val in zip(("fuel_m", "dot_m", "v_a"), vals) if val is not None}
+            if vals and k >= len(stages):
+                raise ValueError(f"vehicle {args.vehicle} has no stage {k + 1}")
+            if vals:
+                stages[k].update(vals)
+        rt = build_rocket({**spec, "stages": stages}, cx_scale=args.cx_scale)
+    atm = Atmosphere(fast=args.fast_atm, rho_scale=args.rho_scale)
+    return (rt, atm)
+
+
+def get_options(
+    args: argparse.Namespace
+)-> dict:
+    # с --direct передаются только заданные явно параметры, остальные - по умолчанию solve_ivp
+    defaults = {} if args.direct else SEGMENTED_DEFAULTS
+    given = {"method": args.method, "rtol": args.rtol, "atol": args.atol}
+    options = {**defaults, **{name: val for name, val in given.items() if val is not None}}
+    if not args.direct and args.coast:
+        options["coast"] = True
+    if args.backend != "scipy":
+        options.pop("method", None)
+        options["backend"] = args.backend
+        if args.step is not None:
+            options["step"] = args.step
+    return options
+
+
+def get_summary(
+    tr
+)-> dict:
+    from dispersion import SUMMARY, FAILURES, summarize
+
+    vals = summarize(0, tr)
+    res = {name: float(val) for name, val in zip(SUMMARY.names[1:-1], vals[1:-1])}
+    res["failure"] = FAILURES[vals[-1]] or None
+    return res
+
+
+def get_analytics(
+    tr,
+    rt: Rocket,
+    atm: Atmosphere
+)-> dict:
+    from analytics import analyze
+
+    res = analyze(tr, rt, atm)._asdict()
+    res["orbit"] = {name: float(val) for name, val in res["orbit"]._asdict().items()}
+    return res
+
+
+def plot(
+    tr,
+    n: int,
+    out: str
+)-> list[str]:
+    import matplotlib
+    matplotlib.use("Agg")
+    from main import plot_portrait, plot_trajectory_geocentrical
+    from decimate import get_event_indices
+
+    t, y = tr.resample(n)
+    solution = argparse.Namespace(t=t, y=y, switches=tr.switches)
+    paths = [os.path.join(out, "portrait.png"), os.path.join(out, "trajectory.png")]
+    plot_portrait(solution, paths[0])
+    x, y_geo = find_geecentrical_coords(y[0], y[1])
+    keep = get_event_indices(t, [ts for ts, _ in tr.switches])
+    plot_trajectory_geocentrical(x, y_geo, find_active_idx(solution), paths[1], keep)
+    return paths
+
+
+def main(
+    argv: list[str] = None
+)-> int:
+    args = get_parser().parse_args(argv)
+    rt, atm = build_vehicle(args)
+    t_end = args.t_end if args.t_end is not None else 32900 + int(np.ceil(rt.engine_time))
+    t_span = (args.t_start, t_end)
+    options = get_options(args)
+    os.makedirs(args.out, exist_ok=True)
+
+    summary = {
+        "vehicle": {
+            **{f"{name}{k + 1}": getattr(st, name) for name in ("fuel_m", "dot_m", "v_a")
+               for k, st in enumerate(rt.stages)},
+            "payload": args.payload, "cx_scale": args.cx_scale, "rho_scale": args.rho_scale,
+            "file": args.vehicle, "payload_m": rt.payload_m, "boosters": len(rt.boosters),
+        },
+        "t_span": list(t_span),
+        "segmented": not args.direct,
+        "options": options,
+        "import_time": IMPORT_TIME,
+    }
+
+    profile = None
+    if args.profile:
+        from profiling import Profile
+        profile = Profile()
+
+    cache = None
+    if args.cache:
+        from cache import ResultCache
+        cache = ResultCache(args.cache)
+
+    start = time.perf_counter()
+    try:
+        # как и в main.py, численные предупреждения модели прерывают расчет
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            tr = solver(rt, atm, t_span, segmented=not args.direct, dense=True, profile=profile, cache=cache,
+                        **options)
+    except (KeyboardInterrupt, ArithmeticError, ValueError, RuntimeWarning) as e:
+        summary.update(status=-2, message=f"{type(e).__name__}: {e}", elapsed=time.perf_counter() - start)
+        with open(os.path.join(args.out, "summary.json"), "w") as f:
+            json.dump(summary, f, indent=1)
+        print(summary["message"], file=sys.stderr)
+        return 2
+
+    summary.update(
+        elapsed=time.perf_counter() - start,
+        status=int(tr.status),
+        message=tr.message,
+        nfev=int(tr.nfev),
+        switches=[(float(t), name) for t, name in tr.switches],
+        result=get_summary(tr),
+        analytics=get_analytics(tr, rt, atm),
+        final_state=dict(zip(tr.names, map(float, tr(t_span[1])))),
+    )
+    if profile is not None:
+        summary["profile"] = tr.profile
+
+    files = {}
+    if args.data:
+        from storage import save_trajectory
+        files["data"] = os.path.join(args.out, "trajectory")
+        t = np.linspace(t_span[0], t_span[1], args.samples)
+        save_trajectory(files["data"], rt, atm, tr, t, dtype=np.float32 if args.float32 else np.float64)
+    if args.plot:
+        files["plots"] = plot(tr, args.samples, args.out)
+    summary["files"] = files
+    summary["total_time"] = time.perf_counter() - START
+
+    with open(os.path.join(args.out, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=1)
+    print(f"status = {tr.status}, elapsed = {summary['elapsed']:.3f} s, import = {IMPORT_TIME:.3f} s, "
+          f"summary: {os.path.join(args.out, 'summary.json')}")
+    return 0 if tr.status >= 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+import asyncio
+import json
+
+from service import HOST, PORT
+
+
+class ServiceError(Exception):
+    pass
+
+
+class AsyncClient:
+    # клиент service.py: одно соединение, запросы выполняются по очереди
+
+    def __init__(
+        self,
+        host: str = HOST,
+        port: int = PORT
+    )-> None:
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+
+    async def connect(
+        self
+    )-> "AsyncClient":
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        return self
+
+
+    async def close(
+        self
+    )-> None:
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.reader = self.writer = None
+
+
+    async def __aenter__(
+        self
+    )-> "AsyncClient":
+        return await self.connect()
+
+
+    async def __aexit__(
+        self,
+        *exc
+    )-> None:
+        await self.close()
+
+
+    async def request(
+        self,
+        msg: dict
+    )-> dict:
+        await self.connect()
+        self.writer.write(json.dumps(msg).encode() + b"\n")
+        await self.writer.drain()
+        return await self.receive()
+
+
+    async def receive(
+        self
+    )-> dict:
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("service closed the connection")
+        msg = json.loads(line)
+        if msg["type"] == "error":
+            raise ServiceError(msg["message"])
+        return msg
+
+
+    async def stream(
+        self,
+        spec: dict
+    ):
+        # сообщения accepted, progress ... result одного задания
+        msg = await self.request({"op": "submit", "spec": spec})
+        yield msg
+        while msg["type"] != "result":
+            msg = await self.receive()
+            yield msg
+
+
+    async def run(
+        self,
+        spec: dict,
+        on_progress = None
+    )-> dict:
+        # итог расчета; on_progress(msg) вызывается для каждого сообщения о ходе расчета
+        async for msg in self.stream(spec):
+            if msg["type"] == "progress" and on_progress is not None:
+                on_progress(msg)
+            elif msg["type"] == "result":
+                return msg
+
+
+    async def submit(
+        self,
+        spec: dict
+    )-> str:
+        # постановка в очередь без ожидания результата
+        return (await self.request({"op": "submit", "spec": spec, "wait": False}))["job"]
+
+
+    async def status(
+        self,
+        job: str
+    )-> dict:
+        return await self.request({"op": "status", "job": job})
+
+
+    async def stats(
+        self
+    )-> dict:
+        return await self.request({"op": "stats"})
+
+
+async def run_many(
+    specs: list[dict],
+    host: str = HOST,
+    port: int = PORT,
+    on_progress = None
+)-> list[dict]:
+    # по соединению на задание, задания считаются сервисом параллельно
+    async def run_one(spec):
+        async with AsyncClient(host, port) as client:
+            return await client.run(spec, on_progress)
+
+    return list(await asyncio.gather(*(run_one(spec) for spec in specs)))
+
+
+class Client:
+    # блокирующий вариант для скриптов: каждый вызов открывает свое соединение
+
+    def __init__(
+        self,
+        host: str = HOST,
+        port: int = PORT
+    )-> None:
+        self.host = host
+        self.port = port
+
+
+    def call(
+        self,
+        method: str,
+        *args
+    ):
+        async def main():
+            async with AsyncClient(self.host, self.port) as client:
+                return await getattr(client, method)(*args)
+
+        return asyncio.run(main())
+
+
+    def run(
+        self,
+        spec: dict,
+        on_progress = None
+    )-> dict:
+        return self.call("run", spec, on_progress)
+
+
+    def run_many(
+        self,
+        specs: list[dict],
+        on_progress = None
+    )-> list[dict]:
+        return asyncio.run(run_many(specs, self.host, self.port, on_progress))
+
+
+    def submit(
+        self,
+        spec: dict
+    )-> str:
+        return self.call("submit", spec)
+
+
+    def status(
+        self,
+        job: str
+    )-> dict:
+        return self.call("status", job)
+
+
+    def stats(
+        self
+    )-> dict:
+        return self.call("stats")
+
+
+if __name__ == "__main__":
+    import time
+
+    client = Client()
+    specs = [{"fast_atm": True, "t_end": 2000., "cx_scale": scale} for scale in (0.9, 1., 1.1)]
+    # повтор первого задания не считается заново
+    specs.append(dict(specs[0]))
+
+    start = time.time()
+    res = client.run_many(specs, on_progress=lambda msg: print(msg["job"], msg["t"], msg["switch"]))
+    print(f"{len(specs)} jobs, time = {time.time() - start:.2f} s")
+    for spec, msg in zip(specs, res):
+        print(spec["cx_scale"], msg["state"], msg["result"]["result"])
+    print(client.stats())
@@ -0,0 +1,304 @@
+import argparse
+import json
+import time
+import warnings
+from contextlib import contextmanager
+from typing import NamedTuple
+
+import numpy as np
+from scipy.optimize import brentq
+
+import main
+from main import solver, V1
+from atmosphere import Atmosphere
+from rocket import Rocket
+from profiling import RHS_FUNCS
+
+
+METHODS = ("RK45", "DOP853", "LSODA", "Radau")
+MODES = ("direct", "segmented")
+# пары (rtol, atol); (1e-3, 1e-6) - значения solve_ivp по умолчанию, с ними считает прямой расчет solver
+TOLERANCES = ((1e-3, 1e-6), (1e-5, 1e-6), (1e-6, 1e-6), (1e-8, 1e-6), (1e-10, 1e-8))
+MAX_STEPS = (np.inf, 1., 0.1)
+
+# настройки solver и cli.py: прямой расчет (RK45, max_step=0.1) и расчет по участкам (rtol=1e-8, atol=1e-6)
+PRODUCTION = (("direct", "RK45", 1e-3, 1e-6, 0.1), ("segmented", "RK45", 1e-8, 1e-6, np.inf))
+
+# эталон - расчет по участкам с жесткими допусками; второй, чуть менее точный, оценивает погрешность эталона
+REFERENCE = ("segmented", "DOP853", 1e-12, 1e-10, np.inf)
+REFERENCE_CHECK = ("segmented", "DOP853", 1e-11, 1e-9, np.inf)
+
+# масштабы погрешностей для сводной оценки error = max |ошибка| / масштаб;
+# ошибки 1e-3 м/с по скорости и 1e-6 рад по углу меняют высоту апоцентра на единицы метров
+SCALES = {"h": 1., "v": 1e-3, "tetha": 1e-6, "cutoff_t": 1e-2}
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class Outcome(NamedTuple):
+    h: float
+    v: float
+    tetha: float
+    cutoff_t: float
+
+
+class Run(NamedTuple):
+    mode: str
+    method: str
+    rtol: float
+    atol: float
+    max_step: float
+    time: float # лучшее время из repeat запусков, с
+    nfev: int # вызовы правой части, включая вычисления для численного якобиана
+    status: int
+    message: str
+    outcome: Outcome
+    errors: Outcome # абсолютные отклонения от эталона
+    error: float
+
+
+@contextmanager
+def counting(
+    deadline: float
+):
+    # счетчик вызовов правой части main.func и main.func_phase; расчет дольше deadline прерывается
+    calls = [0]
+    perf_counter = time.perf_counter
+
+    def counted(fn):
+        def wrapper(*args, **kwargs):
+            calls[0] += 1
+            if not calls[0] & 255 and perf_counter() > deadline:
+                raise BudgetExceeded(f"stopped after {calls[0]} RHS calls")
+            return fn(*args, **kwargs)
+        return wrapper
+
+    saved = {name: getattr(main, name) for name in RHS_FUNCS}
+    try:
+        for name, fn in saved.items():
+            setattr(main, name, counted(fn))
+        yield calls
+    finally:
+        for name, fn in saved.items():
+            setattr(main, name, fn)
+
+
+def find_cutoff(
+    tr,
+    t_end: float
+)-> float:
+    # первое достижение v = V1(h) + 5: в расчете по участкам - событие cutoff, в прямом расчете
+    # (двигатель выключается на шаге после этого момента) - корень по плотному выводу
+    for ts, name in tr.switches:
+        if name == "cutoff" and ts <= t_end:
+            return ts
+    t = tr.t[tr.t <= t_end]
+    h, _, v, _, _ = tr(t)
+    f = v - V1(h) - 5
+    idx = np.nonzero((f[:-1] < 0) & (f[1:] >= 0))[0]
+    if not idx.size:
+        return np.nan
+    i = idx[0]
+
+    def excess(ts):
+        y = tr(ts)
+        return y[2] - V1(y[0]) - 5
+    return brentq(excess, t[i], t[i+1], xtol=1e-10)
+
+
+def get_outcome(
+    tr,
+    t_end: float
+)-> Outcome:
+    h, _, v, tetha, _ = tr(t_end)
+    return Outcome(float(h), float(v), float(tetha), float(find_cutoff(tr, t_end)))
+
+
+def get_options(
+    mode: str,
+    method: str,
+    rtol: float,
+    atol: float,
+    max_step: float
+)-> dict:
+    options = {"method": method, "rtol": rtol, "atol": atol}
+    # в прямом расчете solver по умолчанию ограничивает шаг 0.1 с, np.inf это ограничение снимает
+    if mode == "direct" or np.isfinite(max_step):
+        options["max_step"] = max_step
+    return options
+
+
+def run_case(
+    rt: Rocket,
+    atm: Atmosphere,
+    t_end: float,
+    case: tuple,
+    budget: float = 30.,
+    repeat: int = 1
+)-> tuple:
+    # (траектория, время, число вызовов правой части, статус, сообщение); траектория None при отказе
+    mode, method, rtol, atol, max_step = case
+    options = get_options(*case)
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with counting(start + budget) as calls:
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("error")
+                    tr = solver(rt, atm, (0., t_end), segmented=mode == "segmented", dense=True, **options)
+            except BudgetExceeded as e:
+                return (None, budget, calls[0], -3, f"budget of {budget:g} s exceeded, {e}")
+            except (KeyboardInterrupt, ArithmeticError, ValueError, RuntimeWarning) as e:
+                return (None, time.perf_counter() - start, calls[0], -2, f"{type(e).__name__}: {e}")
+        best = min(best, time.perf_counter() - start)
+    return (tr, best, calls[0], int(tr.status), tr.message)
+
+
+def get_errors(
+    outcome: Outcome,
+    reference: Outcome
+)-> tuple[Outcome, float]:
+    errors = Outcome(*(abs(a - b) for a, b in zip(outcome, reference)))
+    error = np.max([err / SCALES[name] for name, err in zip(Outcome._fields, errors)])
+    return (errors, float(error))
+
+
+def get_cases(
+    modes: tuple[str, ...] = MODES,
+    methods: tuple[str, ...] = METHODS,
+    tolerances: tuple[tuple[float, float], ...] = TOLERANCES,
+    max_steps: tuple[float, ...] = MAX_STEPS
+)-> list[tuple]:
+    return [(mode, method, rtol, atol, max_step) for mode in modes for method in methods
+            for rtol, atol in tolerances for max_step in max_steps]
+
+
+def run_grid(
+    rt: Rocket,
+    atm: Atmosphere,
+    t_end: float = 1000.,
+    cases: list[tuple] = None,
+    budget: float = 30.,
+    repeat: int = 1,
+    log = None
+)-> dict:
+    # эталон, оценка его погрешности и прогоны по сетке настроек с отклонениями от эталона
+    cases = get_cases() if cases is None else cases
+    ref_tr = run_case(rt, atm, t_end, REFERENCE, budget=np.inf)[0]
+    reference = get_outcome(ref_tr, t_end)
+    check_tr = run_case(rt, atm, t_end, REFERENCE_CHECK, budget=np.inf)[0]
+    reference_error = get_errors(get_outcome(check_tr, t_end), reference)
+
+    runs = []
+    for case in cases:
+        tr, elapsed, nfev, status, message = run_case(rt, atm, t_end, case, budget, repeat)
+        if tr is None:
+            outcome = errors = Outcome(np.nan, np.nan, np.nan, np.nan)
+            error = np.inf
+        else:
+            outcome = get_outcome(tr, t_end)
+            errors, error = get_errors(outcome, reference)
+            if not np.isfinite(error):
+                error = np.inf
+        run = Run(*case, elapsed, nfev, status, message, outcome, errors, error)
+        runs.append(run)
+        if log is not None:
+            log(run)
+    return {"reference": reference, "reference_error": reference_error, "runs": runs}
+
+
+def get_pareto_front(
+    runs: list[Run],
+    cost: str = "nfev"
+)-> list[Run]:
+    # недоминируемые прогоны: каждый следующий дороже и точнее предыдущего
+    ok = sorted((run for run in runs if run.status >= 0 and np.isfinite(run.error)),
+                key=lambda run: (getattr(run, cost), run.error))
+    front = []
+    for run in ok:
+        if not front or run.error < front[-1].error:
+            front.append(run)
+    return front
+
+
+def format_run(
+    run: Run
+)-> str:
+    tag = " *" if run[:5] in PRODUCTION else ""
+    errors = " ".join(f"{err:9.2e}" for err in run.errors)
+    return (f"{run.mode:9s} {run.method:6s} {run.rtol:7.0e} {run.atol:7.0e} {run.max_step:5g} "
+            f"{run.time:8.3f} {run.nfev:9d} {errors} {run.error:9.2e}{tag}"
+            + (f"  {run.message}" if run.status < 0 else ""))
+
+
+HEADER = (f"{'mode':9s} {'method':6s} {'rtol':>7s} {'atol':>7s} {'step':>5s} {'time, s':>8s} {'nfev':>9s} "
+          + " ".join(f"{name:>9s}" for name in Outcome._fields) + f" {'error':>9s}")
+
+
+def to_json(
+    res: dict,
+    cost: str
+)-> dict:
+    def run_dict(run):
+        d = run._asdict()
+        d["outcome"] = run.outcome._asdict()
+        d["errors"] = run.errors._asdict()
+        d["production"] = run[:5] in PRODUCTION
+        return d
+
+    errors, error = res["reference_error"]
+    return {
+        "scales": SCALES,
+        "reference": {"case": REFERENCE, "outcome": res["reference"]._asdict(),
+                      "errors": errors._asdict(), "error": error},
+        "runs": [run_dict(run) for run in res["runs"]],
+        "pareto": {"cost": cost, "runs": [run_dict(run) for run in get_pareto_front(res["runs"], cost)]},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Точность и стоимость расчета выведения при разных настройках решателя")
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--methods", nargs="+", default=METHODS)
+    parser.add_argument("--max-steps", nargs="+", type=float, default=MAX_STEPS)
+    parser.add_argument("--quick", action="store_true", help="допуски 1e-3, 1e-6 и 1e-8 без max_step=1")
+    parser.add_argument("--t-end", type=float, default=1000.)
+    parser.add_argument("--vehicle", help="описание ракеты (vehicle.py)")
+    parser.add_argument("--fast-atm", action="store_true")
+    parser.add_argument("--budget", type=float, default=30., help="предельное время одного прогона, с")
+    parser.add_argument("--repeat", type=int, default=1, help="число повторов для оценки времени")
+    parser.add_argument("--cost", default="nfev", choices=("nfev", "time"), help="ось стоимости фронта Парето")
+    parser.add_argument("-o", "--out", help="файл JSON с результатами")
+    args = parser.parse_args()
+
+    if args.vehicle is None:
+        rt = Rocket()
+    else:
+        from vehicle import load_vehicle
+        rt = load_vehicle(args.vehicle)
+    atm = Atmosphere(fast=args.fast_atm)
+    tolerances = TOLERANCES
+    max_steps = tuple(args.max_steps)
+    if args.quick:
+        tolerances = ((1e-3, 1e-6), (1e-6, 1e-6), (1e-8, 1e-6))
+        max_steps = tuple(step for step in max_steps if step != 1.)
+    cases = get_cases(tuple(args.modes), tuple(args.methods), tolerances, max_steps)
+
+    print(HEADER)
+    start = time.perf_counter()
+    res = run_grid(rt, atm, args.t_end, cases, args.budget, args.repeat, log=lambda run: print(format_run(run)))
+    print(f"{len(cases)} runs in {time.perf_counter() - start:.1f} s; * - production settings")
+
+    ref = res["reference"]
+    errors, error = res["reference_error"]
+    print(f"reference {REFERENCE}: h = {ref.h:.6f}, v = {ref.v:.9f}, tetha = {ref.tetha:.3e}, "
+          f"cutoff_t = {ref.cutoff_t:.9f}; error estimate = {error:.2e} (smaller errors are not resolved)")
+    print(f"Pareto front, cost = {args.cost}:")
+    for run in get_pareto_front(res["runs"], args.cost):
+        print(format_run(run))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(to_json(res, args.cost), f, indent=1)
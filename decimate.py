@@ -0,0 +1,89 @@
+import numpy as np
+import numpy.typing as npt
+
+
+def get_buckets(
+    n: int,
+    n_buckets: int
+)-> tuple[npt.NDArray, int]:
+    # равные по числу точек корзины; последняя дополняется повтором последнего индекса
+    size = int(np.ceil(n / n_buckets))
+    idx = np.arange(size * int(np.ceil(n / size)))
+    idx[idx >= n] = n - 1
+    return (idx.reshape(-1, size), size)
+
+
+def minmax_indices(
+    ys: list[npt.NDArray],
+    n_buckets: int,
+    keep: npt.ArrayLike = None
+)-> npt.NDArray:
+    # в каждой корзине сохраняются точки минимума и максимума каждой из кривых ys
+    n = len(ys[0])
+    keep = np.asarray([] if keep is None else keep, dtype=int)
+    if n <= 2 * len(ys) * n_buckets:
+        return np.arange(n)
+
+    buckets, _ = get_buckets(n, n_buckets)
+    rows = np.arange(len(buckets))
+    res = [np.array([0, n - 1]), keep[(keep >= 0) & (keep < n)]]
+    for y in ys:
+        vals = y[buckets]
+        res.append(buckets[rows, vals.argmin(axis=1)])
+        res.append(buckets[rows, vals.argmax(axis=1)])
+    return np.unique(np.concatenate(res))
+
+
+def lttb_indices(
+    x: npt.NDArray,
+    y: npt.NDArray,
+    n_out: int,
+    keep: npt.ArrayLike = None
+)-> npt.NDArray:
+    # largest-triangle-three-buckets: из корзины берется точка с наибольшей площадью треугольника
+    # с выбранной точкой предыдущей корзины и средним следующей
+    n = len(x)
+    keep = np.asarray([] if keep is None else keep, dtype=int)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    mean_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / np.diff(edges)
+    mean_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / np.diff(edges)
+
+    res = np.empty(n_out, dtype=int)
+    res[0] = 0
+    res[-1] = n - 1
+    a = 0
+    for k in range(n_out - 2):
+        lo, hi = edges[k], edges[k + 1]
+        nx, ny = (mean_x[k + 1], mean_y[k + 1]) if k + 1 < len(mean_x) else (x[-1], y[-1])
+        area = np.abs((x[a] - nx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (ny - y[a]))
+        a = lo + int(area.argmax())
+        res[k + 1] = a
+    return np.unique(np.concatenate((res, keep[(keep >= 0) & (keep < n)])))
+
+
+def decimate(
+    t: npt.NDArray,
+    ys: list[npt.NDArray],
+    n_buckets: int = 1000,
+    keep: npt.ArrayLike = None,
+    method: str = "minmax"
+)-> npt.NDArray:
+    if method == "lttb":
+        return lttb_indices(t, ys[0], 2 * n_buckets, keep)
+    return minmax_indices(ys, n_buckets, keep)
+
+
+def get_event_indices(
+    t: npt.NDArray,
+    times: npt.ArrayLike
+)-> npt.NDArray:
+    # индексы ближайших к моментам событий точек сетки t
+    times = np.asarray(times, dtype=float)
+    if not times.size:
+        return np.array([], dtype=int)
+    idx = np.clip(np.searchsorted(t, times), 1, len(t) - 1)
+    idx -= np.abs(times - t[idx - 1]) < np.abs(t[idx] - times)
+    return idx
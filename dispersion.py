@@ -0,0 +1,242 @@
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import numpy.typing as npt
+
+from atmosphere import Atmosphere
+from rocket import Rocket, get_stage_one, get_stage_two
+from forces import G, M, r0
+
+
+# относительные среднеквадратичные отклонения параметров
+SIGMAS = {
+    "fuel_m_1": 0.005,
+    "fuel_m_2": 0.005,
+    "dot_m_1": 0.01,
+    "dot_m_2": 0.01,
+    "v_a_1": 0.005,
+    "v_a_2": 0.005,
+    "cx_scale": 0.05,
+    "rho_scale": 0.10,
+}
+
+FAILURES = ("", "suborbital", "crash", "solver", "error")
+
+SUMMARY = np.dtype([
+    ("run", np.int64),
+    ("apogee", np.float64),
+    ("cutoff_v", np.float64),
+    ("cutoff_t", np.float64),
+    ("final_h", np.float64),
+    ("final_v", np.float64),
+    ("failure", np.int8),
+])
+
+STATS_FIELDS = ("apogee", "cutoff_v", "cutoff_t", "final_h", "final_v")
+
+
+def sample_params(
+    seed: int,
+    run: int,
+    sigmas: dict = None
+)-> dict[str, float]:
+    # генератор определяется парой (seed, run) и не зависит от распределения запусков по процессам
+    sigmas = SIGMAS if sigmas is None else sigmas
+    rng = np.random.default_rng([seed, run])
+    return {name: 1. + sigma * rng.standard_normal() for name, sigma in sigmas.items()}
+
+
+def build_vehicle(
+    params: dict[str, float],
+    payload: bool = False,
+    fast: bool = True
+)-> tuple[Rocket, Atmosphere]:
+    # ступени строятся один раз, отклонения вносятся заменой полей
+    st1, st2 = (
+        st._replace(
+            fuel_m=st.fuel_m * params.get(f"fuel_m_{k}", 1.),
+            dot_m=st.dot_m * params.get(f"dot_m_{k}", 1.),
+            v_a=st.v_a * params.get(f"v_a_{k}", 1.),
+        )
+        for k, st in ((1, get_stage_one()), (2, get_stage_two()))
+    )
+    rt = Rocket(stage_one=st1, stage_two=st2, payload=payload, cx_scale=params.get("cx_scale", 1.))
+    atm = Atmosphere(fast=fast, rho_scale=params.get("rho_scale", 1.))
+    return (rt, atm)
+
+
+def summarize(
+    run: int,
+    trajectory
+)-> tuple:
+    h = trajectory.y[0]
+    v = trajectory.y[2]
+
+    # выключение двигателя или, если его не было, выгорание последней ступени
+    cutoff_t = trajectory.t[-1]
+    for t, name in trajectory.switches:
+        if name == "burnout":
+            cutoff_t = t
+        elif name == "cutoff":
+            cutoff_t = t
+            break
+
+    h_end = h[-1]
+    v_end = v[-1]
+    failure = 0 if v_end >= np.sqrt(G * M / (r0 + h_end)) else FAILURES.index("suborbital")
+    return (run, h.max(), trajectory(cutoff_t)[2], cutoff_t, h_end, v_end, failure)
+
+
+def run_chunk(
+    runs: list[int],
+    seed: int,
+    sigmas: dict,
+    t_span: tuple[float, float],
+    payload: bool,
+    options: dict
+)-> npt.NDArray:
+    from main import solver
+
+    res = np.zeros(len(runs), dtype=SUMMARY)
+    for k, run in enumerate(runs):
+        rt, atm = build_vehicle(sample_params(seed, run, sigmas), payload)
+        try:
+            # численные предупреждения модели считаются отказом запуска
+            with warnings.catch_warnings():
+                warnings.simplefilter("error")
+                tr = solver(rt, atm, t_span, segmented=True, dense=True, **options)
+            if tr.status < 0:
+                res[k] = (run, np.nan, np.nan, np.nan, np.nan, np.nan, FAILURES.index("solver"))
+            else:
+                res[k] = summarize(run, tr)
+        except KeyboardInterrupt as e:
+            # модель сообщает о выходе из области определения через KeyboardInterrupt
+            reason = "crash" if e.args and e.args[0].startswith("Negative H") else "error"
+            res[k] = (run, np.nan, np.nan, np.nan, np.nan, np.nan, FAILURES.index(reason))
+        except Exception:
+            # любая другая ошибка одного запуска не прерывает всю серию
+            res[k] = (run, np.nan, np.nan, np.nan, np.nan, np.nan, FAILURES.index("error"))
+    return res
+
+
+class RunningStats:
+    # онлайн-оценка среднего и дисперсии по порциям (объединение по Чану)
+
+    def __init__(
+        self,
+        fields: tuple[str, ...] = STATS_FIELDS
+    )-> None:
+        self.fields = fields
+        self.n = 0
+        self.mean = np.zeros(len(fields))
+        self.m2 = np.zeros(len(fields))
+        self.min = np.full(len(fields), np.inf)
+        self.max = np.full(len(fields), -np.inf)
+        self.failures = np.zeros(len(FAILURES), dtype=np.int64)
+
+
+    def update(
+        self,
+        chunk: npt.NDArray
+    )-> None:
+        self.failures += np.bincount(chunk["failure"], minlength=len(FAILURES))
+        ok = chunk[chunk["failure"] == 0]
+        if not ok.size:
+            return
+        x = np.stack([ok[name] for name in self.fields], axis=1)
+        n_b = len(x)
+        mean_b = x.mean(axis=0)
+        m2_b = ((x - mean_b) ** 2).sum(axis=0)
+
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean = self.mean + delta * n_b / n
+        self.m2 = self.m2 + m2_b + delta ** 2 * self.n * n_b / n
+        self.n = n
+        self.min = np.minimum(self.min, x.min(axis=0))
+        self.max = np.maximum(self.max, x.max(axis=0))
+
+
+    @property
+    def std(
+        self
+    )-> npt.NDArray:
+        if self.n < 2:
+            return np.full(len(self.fields), np.nan)
+        return np.sqrt(self.m2 / (self.n - 1))
+
+
+    def report(
+        self
+    )-> dict:
+        std = self.std
+        return {
+            "n": self.n,
+            "failures": {name or "ok": int(c) for name, c in zip(FAILURES, self.failures)},
+            "fields": {
+                name: {
+                    "mean": float(self.mean[i]),
+                    "std": float(std[i]),
+                    "min": float(self.min[i]),
+                    "max": float(self.max[i]),
+                }
+                for i, name in enumerate(self.fields)
+            },
+        }
+
+
+def run_dispersion(
+    n_runs: int,
+    seed: int = 0,
+    sigmas: dict = None,
+    t_span: tuple[float, float] = (0., 2000.),
+    payload: bool = False,
+    workers: int = None,
+    chunk_size: int = 16,
+    keep_results: bool = False,
+    callback = None,
+    **options
+)-> dict:
+    # итоги запусков приходят порциями структурированных массивов, траектории в родительский процесс не передаются
+    sigmas = SIGMAS if sigmas is None else sigmas
+    workers = os.cpu_count() if workers is None else workers
+    stats = RunningStats()
+    results = np.zeros(n_runs, dtype=SUMMARY) if keep_results else None
+
+    start = time.time()
+    chunks = [list(range(i, min(i + chunk_size, n_runs))) for i in range(0, n_runs, chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_chunk, runs, seed, sigmas, t_span, payload, options): runs for runs in chunks}
+        for future in as_completed(futures):
+            try:
+                chunk = future.result()
+            except Exception:
+                # процесс пула завершился аварийно: запуски порции считаются отказами
+                chunk = np.zeros(len(futures[future]), dtype=SUMMARY)
+                chunk["run"] = futures[future]
+                for name in STATS_FIELDS:
+                    chunk[name] = np.nan
+                chunk["failure"] = FAILURES.index("error")
+            stats.update(chunk)
+            if results is not None:
+                results[chunk["run"]] = chunk
+            if callback is not None:
+                callback(chunk, stats)
+
+    report = stats.report()
+    report["elapsed"] = time.time() - start
+    report["workers"] = workers
+    report["results"] = results
+    return report
+
+
+if __name__ == "__main__":
+    for workers in (1, os.cpu_count()):
+        report = run_dispersion(64, workers=workers, chunk_size=4)
+        print(f"workers = {workers}, time = {report['elapsed']}")
+    print(report["failures"])
+    for name, vals in report["fields"].items():
+        print(name, vals)
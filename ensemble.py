@@ -0,0 +1,533 @@
+import numpy as np
+import numpy.typing as npt
+from scipy.optimize import OptimizeResult
+
+from atmosphere import Atmosphere
+from rocket import Rocket, BurnTimeline
+from guidance import Guidance, GUIDANCE
+from forces import g, aerodynamic_force, thirst_force, r0
+from integrators import A, C, E, P, SAFETY, MIN_FACTOR, MAX_FACTOR
+from main import V1, Phase, get_dot_tetha
+
+
+# события участков в порядке строк get_event_values и их направления (как в main.get_phase_events)
+EVENTS = ("cutoff", "ignition", "saturate", "release", "burnout", "circular", "circular", "noncircular",
+          "noncircular")
+DIRECTIONS = np.array([1, -1, 1, -1, 1, -1, 1, 1, -1])[:, None]
+PITCH = -1
+
+
+class EnsembleParams:
+    # параметры N аппаратов в массивах длины N; участки работы двигателей - строки rt.timeline,
+    # дополненные до общего числа строк последней строкой (полет без тяги)
+
+    def __init__(
+        self,
+        rockets: list[Rocket],
+        atms: list[Atmosphere],
+        guidance: Guidance = GUIDANCE
+    )-> None:
+        if not rockets:
+            raise ValueError("ensemble has no vehicles")
+        if len(atms) != len(rockets):
+            raise ValueError("ensemble needs one atmosphere per vehicle")
+        if any((atm.fast, atm.rtol) != (atms[0].fast, atms[0].rtol) for atm in atms):
+            raise ValueError("ensemble members must share the atmosphere model, only rho_scale may differ")
+
+        def col(get):
+            return np.array([get(rt) for rt in rockets], dtype=float)
+
+        self.n = len(rockets)
+        self.S = col(lambda rt: rt.S)
+        self.cx_scale = col(lambda rt: rt.cx_scale)
+        self.rho_scale = np.array([atm.rho_scale for atm in atms], dtype=float)
+        self.nburns = np.array([rt.nburns for rt in rockets])
+        rows = max(len(rt.timeline.t_end) for rt in rockets)
+        for name in BurnTimeline._fields:
+            setattr(self, name, np.array([np.pad(getattr(rt.timeline, name), (0, rows - len(rt.timeline.t_end)),
+                                                 mode="edge") for rt in rockets]))
+
+        self.guidance = guidance
+        self.t1 = guidance.t1
+        self.t2 = col(guidance.get_t2)
+        self.t3 = col(guidance.get_t3)
+        # конец участка по времени для каждой ветви тангажа
+        self.t_branch = np.stack([np.full(self.n, self.t1), self.t2, self.t3, np.full(self.n, np.inf),
+                                  np.full(self.n, np.inf)], axis=1)
+        # атмосфера без масштаба плотности, масштаб применяется поэлементно
+        self.atm = Atmosphere(fast=atms[0].fast, rtol=atms[0].rtol)
+
+
+    def get_flow_vals(
+        self,
+        h: npt.NDArray
+    )-> tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+        if self.atm.fast:
+            return self.atm.get_table().get_state(h)
+        _, P_atm, rho, _, Vs = self.atm.get_state(h)
+        return (P_atm, rho, Vs)
+
+
+def get_subset(
+    phase: Phase,
+    mask: npt.NDArray
+)-> Phase:
+    return Phase(*(field[mask] for field in phase))
+
+
+def get_forces(
+    vals: npt.NDArray,
+    p: EnsembleParams,
+    idx: npt.NDArray,
+    stage: npt.NDArray
+)-> tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+    # main.get_phase_forces для аппаратов idx на участках stage
+    h = vals[0]
+    v = vals[2]
+    P_atm = np.zeros(len(idx))
+    D = np.zeros(len(idx))
+    air = h <= 1200000.
+    if air.any():
+        ha = h[air]
+        ia = idx[air]
+        Pa, rho, Vs = p.get_flow_vals(ha)
+        Cx = p.cx_scale[ia] * Rocket.get_base_cf_array(v[air] / Vs, ha)
+        P_atm[air] = Pa
+        D[air] = aerodynamic_force(Cx, p.rho_scale[ia] * rho, v[air], p.S[ia])
+    m = p.m_start[idx, stage] - p.dot_m[idx, stage] * (vals[4] - p.t_start[idx, stage])
+    F = thirst_force(p.dot_m[idx, stage], p.v_a[idx, stage], p.F_a[idx, stage], p.p_a[idx, stage], P_atm)
+    return (m, F, D)
+
+
+def get_throttle(
+    vals: npt.NDArray,
+    m: npt.NDArray,
+    F: npt.NDArray,
+    D: npt.NDArray
+)-> npt.NDArray:
+    # main.get_throttle для массивов: без тяги доля равна нулю
+    h = vals[0]
+    v = vals[2]
+    sin_t = np.sin(vals[3])
+    dot_V1 = - V1(h) / (2 * (r0 + h)) * v * sin_t
+    need = m * (dot_V1 + g(h) * sin_t) + D
+    return np.divide(need, F, out=np.zeros_like(need), where=F > 0.)
+
+
+def func_ensemble(
+    t: npt.NDArray,
+    vals: npt.NDArray,
+    p: EnsembleParams,
+    idx: npt.NDArray,
+    phase: Phase
+)-> npt.NDArray:
+    # main.func_phase для аппаратов idx: t - время каждого аппарата, vals - состояние формы (5, n),
+    # поля phase - массивы участков
+    h = vals[0]
+    v = vals[2]
+    tetha = vals[3]
+
+    m, F, D = get_forces(vals, p, idx, phase.stage)
+    u = phase.is_active.astype(float)
+    sl = phase.is_sliding
+    if sl.any():
+        u[sl] = get_throttle(vals[:, sl], m[sl], F[sl], D[sl])
+
+    sin_t = np.sin(tetha)
+    dot_tetha = np.zeros(len(idx))
+    for branch in range(1, 5):
+        b = phase.branch == branch
+        if b.any():
+            dot_tetha[b] = get_dot_tetha(branch, t[b], h[b], v[b], tetha[b], p.guidance)
+    return np.array([
+        v * sin_t,
+        r0 / (r0 + h) * v * np.cos(tetha),
+        (u * F - D) / m - g(h) * sin_t,
+        dot_tetha,
+        u,
+    ])
+
+
+def get_event_values(
+    vals: npt.NDArray,
+    p: EnsembleParams,
+    idx: npt.NDArray,
+    phase: Phase
+)-> npt.NDArray:
+    # значения функций событий EVENTS, форма (9, n); доля тяги считается только в скользящем режиме
+    h = vals[0]
+    tetha = vals[3]
+    res = np.empty((len(EVENTS), len(idx)))
+    res[0] = res[1] = vals[2] - V1(h) - 5
+    u = np.full(len(idx), np.nan)
+    sl = phase.is_sliding
+    if sl.any():
+        u[sl] = get_throttle(vals[:, sl], *get_forces(vals[:, sl], p, idx[sl], phase.stage[sl]))
+    res[2] = u - 1
+    res[3] = u
+    res[4] = vals[4] - p.t_end[idx, phase.stage]
+    res[5] = res[7] = tetha - 1e-3
+    res[6] = res[8] = tetha + 1e-3
+    return res
+
+
+def get_enabled(
+    p: EnsembleParams,
+    idx: npt.NDArray,
+    phase: Phase
+)-> npt.NDArray:
+    # события, завершающие участок каждого аппарата (main.get_phase_events)
+    burning = phase.stage < p.nburns[idx]
+    off = ~phase.is_active & ~phase.is_sliding
+    res = np.empty((len(EVENTS), len(idx)), dtype=bool)
+    res[0] = burning & phase.is_active
+    res[1] = burning & off
+    res[2] = res[3] = burning & phase.is_sliding
+    res[4] = burning & ~off
+    res[5] = res[6] = phase.branch == 3
+    res[7] = res[8] = phase.branch == 4
+    return res
+
+
+def get_phase(
+    t: npt.NDArray,
+    stage: npt.NDArray,
+    is_active: npt.NDArray,
+    is_sliding: npt.NDArray,
+    is_circular: npt.NDArray,
+    p: EnsembleParams,
+    idx: npt.NDArray
+)-> Phase:
+    branch = np.select(
+        [t < p.t1, t < p.t2[idx], (t < p.t3[idx]) & (is_active | is_sliding) & (stage < p.nburns[idx]),
+         ~is_circular],
+        [0, 1, 2, 3], 4)
+    return Phase(stage, is_active, is_sliding, is_circular, branch)
+
+
+def get_engine_mode(
+    vals: npt.NDArray,
+    p: EnsembleParams,
+    idx: npt.NDArray,
+    stage: npt.NDArray
+)-> tuple[npt.NDArray, npt.NDArray]:
+    burning = stage < p.nburns[idx]
+    u = get_throttle(vals, *get_forces(vals, p, idx, stage))
+    return (burning & (u >= 1.), burning & (u > 0.) & (u < 1.))
+
+
+def get_next_phase(
+    t: npt.NDArray,
+    vals: npt.NDArray,
+    kind: npt.NDArray,
+    phase: Phase,
+    p: EnsembleParams,
+    idx: npt.NDArray
+)-> Phase:
+    # main.get_next_phase; kind - номер события в EVENTS или PITCH для конца участка по времени
+    stage = phase.stage.copy()
+    is_active = phase.is_active.copy()
+    is_sliding = phase.is_sliding.copy()
+    is_circular = phase.is_circular.copy()
+
+    mode = (kind == 0) | (kind == 1)
+    if mode.any():
+        is_active[mode], is_sliding[mode] = get_engine_mode(vals[:, mode], p, idx[mode], stage[mode])
+    is_active[kind == 2] = True
+    is_sliding[kind == 2] = False
+    is_active[kind == 3] = False
+    is_sliding[kind == 3] = False
+
+    burnout = kind == 4
+    stage[burnout] += 1
+    over = burnout & (stage >= p.nburns[idx])
+    is_active[over] = False
+    is_sliding[over] = False
+    mode = burnout & ~over & phase.is_sliding
+    if mode.any():
+        is_active[mode], is_sliding[mode] = get_engine_mode(vals[:, mode], p, idx[mode], stage[mode])
+
+    is_circular[(kind == 5) | (kind == 6)] = True
+    is_circular[(kind == 7) | (kind == 8)] = False
+    return get_phase(t, stage, is_active, is_sliding, is_circular, p, idx)
+
+
+def get_dense(
+    t_old: npt.NDArray,
+    y_old: npt.NDArray,
+    h: npt.NDArray,
+    Q: npt.NDArray,
+    t: npt.NDArray
+)-> npt.NDArray:
+    # продолжение Дормана-Принса на шаге каждого аппарата: y(t_old + x h) = y_old + h Q @ (x, x^2, x^3, x^4)
+    x = (t - t_old) / h
+    powers = np.stack([x, x ** 2, x ** 3, x ** 4])
+    return y_old + h * np.einsum("jkn,kn->jn", Q, powers)
+
+
+def find_roots(
+    t_old: npt.NDArray,
+    t_new: npt.NDArray,
+    g_old: npt.NDArray,
+    g_new: npt.NDArray,
+    fun,
+    max_iter: int = 100
+)-> npt.NDArray:
+    # корни fun(t) на [t_old, t_new] методом Иллинойс сразу для всех пар (аппарат, событие);
+    # точность по t та же, что у brentq в solve_ivp (4 eps)
+    a = t_old.copy()
+    b = t_new.copy()
+    fa = g_old.copy()
+    fb = g_new.copy()
+    root = np.where(fa == 0., a, b)
+    live = np.flatnonzero((fa != 0.) & (fb != 0.))
+    tol = 4 * np.finfo(float).eps
+    for _ in range(max_iter):
+        if not live.size:
+            break
+        al, bl, fal, fbl = a[live], b[live], fa[live], fb[live]
+        c = (al * fbl - bl * fal) / (fbl - fal)
+        bad = ~((c > np.minimum(al, bl)) & (c < np.maximum(al, bl)))
+        c[bad] = (al[bad] + bl[bad]) / 2
+        fc = fun(live, c)
+        flip = fc * fbl < 0
+        a[live] = np.where(flip, bl, al)
+        fa[live] = np.where(flip, fbl, fal / 2)
+        b[live] = c
+        fb[live] = fc
+        root[live] = c
+        conv = (fc == 0.) | (np.abs(c - a[live]) <= tol * (1 + np.abs(c)))
+        live = live[~conv]
+    return root
+
+
+def select_initial_step(
+    fun,
+    t: npt.NDArray,
+    y: npt.NDArray,
+    f0: npt.NDArray,
+    t_bound: npt.NDArray,
+    rtol: float,
+    atol: float
+)-> npt.NDArray:
+    # integrators.DOPRI5.select_initial_step для каждого аппарата
+    scale = atol + np.abs(y) * rtol
+    d0 = np.sqrt(np.mean((y / scale) ** 2, axis=0))
+    d1 = np.sqrt(np.mean((f0 / scale) ** 2, axis=0))
+    small = (d0 < 1e-5) | (d1 < 1e-5)
+    h0 = np.where(small, 1e-6, 0.01 * d0 / np.where(small, 1., d1))
+    h0 = np.minimum(h0, t_bound - t)
+    f1 = fun(t + h0, y + h0 * f0)
+    d2 = np.sqrt(np.mean(((f1 - f0) / scale) ** 2, axis=0)) / h0
+    flat = (d1 <= 1e-15) & (d2 <= 1e-15)
+    h1 = np.where(flat, np.maximum(1e-6, h0 * 1e-3), (0.01 / np.where(flat, 1., np.maximum(d1, d2))) ** (1 / 5))
+    return np.minimum(np.minimum(100 * h0, h1), t_bound - t)
+
+
+def solve_ensemble(
+    rockets: list[Rocket],
+    atm: Atmosphere | list[Atmosphere],
+    t_span: tuple[float, float],
+    guidance: Guidance = GUIDANCE,
+    rtol: float = 1e-8,
+    atol: float = 1e-6,
+    save_dt: float = 1.,
+    t_eval: npt.NDArray = None
+)-> OptimizeResult:
+    # расчет по участкам (main.solver_segmented, RK45) для N аппаратов сразу: у каждого аппарата свои время,
+    # шаг и участок, один шаг всех аппаратов - одно векторное вычисление правой части на стадию;
+    # события находятся по плотному выводу шага, после события шаг выбирается заново, как при новом вызове solve_ivp
+    atms = atm if isinstance(atm, list) else [atm] * len(rockets)
+    p = EnsembleParams(rockets, atms, guidance)
+    n = p.n
+    rows = np.arange(n)
+    t0, t_final = float(t_span[0]), float(t_span[1])
+    if t_eval is None:
+        t_eval = np.append(np.arange(t0, t_final, save_dt), t_final)
+    # после отказа аппарата его точки вывода остаются NaN
+    y_eval = np.full((len(t_eval), 5, n), np.nan)
+    i_eval = np.full(n, np.searchsorted(t_eval, t0, side="right"))
+
+    t = np.full(n, t0)
+    y = np.zeros((5, n))
+    y[3] = np.pi / 2
+    y_eval[:i_eval[0]] = y
+    phase = get_phase(t, np.array([rt.get_stage(0.) for rt in rockets]), np.ones(n, dtype=bool),
+                      np.zeros(n, dtype=bool), np.abs(y[3]) < 1e-3, p, rows)
+
+    f = np.empty((5, n))
+    g_old = np.empty((len(EVENTS), n))
+    h_abs = np.empty(n)
+    t_bound = np.empty(n)
+    rejected = np.zeros(n, dtype=bool)
+    done = np.zeros(n, dtype=bool)
+    status = np.zeros(n, dtype=int)
+    crash_t = np.full(n, np.nan)
+    switches = [[] for _ in range(n)]
+    nfev = 0
+    nfev_members = 0
+
+    def rhs(tt, yy, idx, ph):
+        nonlocal nfev, nfev_members
+        nfev += 1
+        nfev_members += len(idx)
+        return func_ensemble(tt, yy, p, idx, ph)
+
+    def restart(idx):
+        ph = get_subset(phase, idx)
+        tt = t[idx]
+        yy = y[:, idx]
+        t_bound[idx] = np.minimum(p.t_branch[idx, ph.branch], t_final)
+        f0 = rhs(tt, yy, idx, ph)
+        h_abs[idx] = select_initial_step(lambda ts, ys: rhs(ts, ys, idx, ph), tt, yy, f0, t_bound[idx], rtol, atol)
+        f[:, idx] = f0
+        g_old[:, idx] = get_event_values(yy, p, idx, ph)
+        rejected[idx] = False
+
+    def record(idx, t_a, y_a, h, Q, t_b):
+        # точки t_eval на (t_a, t_b] по плотному выводу шагов аппаратов idx
+        hi = np.searchsorted(t_eval, t_b, side="right")
+        counts = hi - i_eval[idx]
+        total = counts.sum()
+        if total:
+            k = np.repeat(np.arange(len(idx)), counts)
+            j = i_eval[idx][k] + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            y_eval[j, :, idx[k]] = get_dense(t_a[k], y_a[:, k], h[k], Q[:, :, k], t_eval[j]).T
+        i_eval[idx] = hi
+
+    restart(rows)
+    while True:
+        act = np.flatnonzero(~done)
+        if not act.size:
+            break
+        tt = t[act]
+        min_step = 10 * np.abs(np.nextafter(tt, np.inf) - tt)
+        small = rejected[act] & (h_abs[act] < min_step)
+        if small.any():
+            bad = act[small]
+            status[bad] = -1
+            done[bad] = True
+            act = act[~small]
+            tt = tt[~small]
+            min_step = min_step[~small]
+            if not act.size:
+                continue
+
+        ph = get_subset(phase, act)
+        yy = y[:, act]
+        t_new = np.minimum(tt + np.maximum(h_abs[act], min_step), t_bound[act])
+        hs = t_new - tt
+
+        K = np.empty((7, 5, len(act)))
+        K[0] = f[:, act]
+        negative = np.zeros(len(act), dtype=bool)
+        for s in range(1, 7):
+            ys = yy + hs * np.einsum("s,sjn->jn", A[s, :s], K[:s])
+            negative |= ys[0] < 0.
+            K[s] = rhs(tt + C[s] * hs, ys, act, ph)
+        y_new = ys
+
+        # отрицательная высота - отказ аппарата, как KeyboardInterrupt в main.get_phase_forces
+        if negative.any():
+            bad = act[negative]
+            status[bad] = -2
+            done[bad] = True
+            crash_t[bad] = tt[negative]
+
+        scale = atol + np.maximum(np.abs(yy), np.abs(y_new)) * rtol
+        err = np.sqrt(np.mean((hs * np.einsum("s,sjn->jn", E, K) / scale) ** 2, axis=0))
+        with np.errstate(divide="ignore"):
+            factor = SAFETY * err ** (-1 / 5)
+        ok = (err < 1) & ~negative
+        retry = ~ok & ~negative
+        h_abs[act[retry]] = hs[retry] * np.maximum(MIN_FACTOR, factor[retry])
+        rejected[act[retry]] = True
+        grow = np.where(err == 0, MAX_FACTOR, np.minimum(MAX_FACTOR, factor))
+        grow = np.where(rejected[act], np.minimum(1., grow), grow)
+        h_abs[act[ok]] = hs[ok] * grow[ok]
+        rejected[act[ok]] = False
+        if not ok.any():
+            continue
+
+        acc = act[ok]
+        t_a = tt[ok]
+        y_a = yy[:, ok]
+        h = hs[ok]
+        t_b = t_new[ok]
+        y_b = y_new[:, ok]
+        K = K[:, :, ok]
+        Q = np.einsum("sjn,sk->jkn", K, P)
+        ph = get_subset(ph, ok)
+
+        g_new = get_event_values(y_b, p, acc, ph)
+        go = g_old[:, acc]
+        hit = get_enabled(p, acc, ph) & (((go <= 0) & (g_new >= 0) & (DIRECTIONS > 0)) |
+                                         ((go >= 0) & (g_new <= 0) & (DIRECTIONS < 0)))
+        kind = np.full(len(acc), PITCH)
+        if hit.any():
+            ev, m = np.nonzero(hit)
+
+            def event_at(sel, ts):
+                ms = m[sel]
+                ys = get_dense(t_a[ms], y_a[:, ms], h[ms], Q[:, :, ms], ts)
+                return get_event_values(ys, p, acc[ms], get_subset(ph, ms))[ev[sel], np.arange(len(sel))]
+
+            roots = find_roots(t_a[m], t_b[m], go[ev, m], g_new[ev, m], event_at)
+            # первое по времени событие каждого аппарата
+            order = np.lexsort((roots, m))
+            first = order[np.unique(m[order], return_index=True)[1]]
+            mf = m[first]
+            kind[mf] = ev[first]
+            t_b[mf] = roots[first]
+            y_b[:, mf] = get_dense(t_a[mf], y_a[:, mf], h[mf], Q[:, :, mf], roots[first])
+
+        record(acc, t_a, y_a, h, Q, t_b)
+        t[acc] = t_b
+        y[:, acc] = y_b
+        f[:, acc] = K[6]
+        g_old[:, acc] = g_new
+
+        switch = (kind != PITCH) | (t_b >= t_bound[acc])
+        if not switch.any():
+            continue
+        sw = acc[switch]
+        kind = kind[switch]
+        t_sw = t[sw]
+        for i, ts, k in zip(sw.tolist(), t_sw.tolist(), kind.tolist()):
+            name = EVENTS[k] if k != PITCH else ("end" if ts >= t_final else "pitch")
+            switches[i].append((ts, name))
+        new = get_next_phase(t_sw, y[:, sw], kind, get_subset(phase, sw), p, sw)
+        for field, vals in zip(phase, new):
+            field[sw] = vals
+        finished = t_sw >= t_final
+        done[sw[finished]] = True
+        if not finished.all():
+            restart(sw[~finished])
+
+    return OptimizeResult(
+        t=t_eval, y=y_eval, t_last=t, y_last=y, phase_last=phase, switches=switches,
+        alive=status != -2, crash_t=crash_t, status=status, nfev=nfev, nfev_members=nfev_members,
+        success=bool((status >= 0).all()),
+        message="The solver successfully reached the end of the integration interval." if (status >= 0).all()
+        else f"{int((status < 0).sum())} of {n} members failed.",
+    )
+
+
+if __name__ == "__main__":
+    import time
+    from main import solver
+    from dispersion import build_vehicle, sample_params
+
+    t_span = (0, 700)
+    for n in (8, 200):
+        vehicles = [build_vehicle(sample_params(0, i), fast=True) for i in range(n)]
+        start = time.time()
+        sol = solve_ensemble([rt for rt, _ in vehicles], [atm for _, atm in vehicles], t_span)
+        ensemble_time = time.time() - start
+
+        start = time.time()
+        ref = np.array([solver(rt, atm, t_span, segmented=True, dense=True)(t_span[1]) for rt, atm in vehicles]).T
+        separate_time = time.time() - start
+        dev = np.abs(sol.y_last - ref).max(axis=1)
+        print(f"N = {n}: ensemble {ensemble_time:.2f} s ({sol.nfev} RHS calls), separate {separate_time:.2f} s; "
+              f"max |dh| = {dev[0]:.2e} m, |ds| = {dev[1]:.2e} m, |dv| = {dev[2]:.2e} m/s")
@@ -25,4 +25,32 @@ def thirst_force(
     p_a: float,
     p_h: float
 )-> float:
-    return dot_m * v_a + F_a * (p_a - p_h)
\ No newline at end of file
+    return dot_m * v_a + F_a * (p_a - p_h)
+
+
+def dg_dh(
+    h: float
+)-> float:
+    return -2 * G * M / ((r0 + h) ** 3)
+
+
+def aerodynamic_force_partials(
+    Cx: float,
+    rho: float,
+    v: float,
+    S: float
+)-> tuple[float, float, float, float]:
+    # производные по Cx, rho, v, S
+    q = (v ** 2) / 2
+    return (rho * q * S, Cx * q * S, Cx * rho * v * S, Cx * rho * q)
+
+
+def thirst_force_partials(
+    dot_m: float,
+    v_a: float,
+    F_a: float,
+    p_a: float,
+    p_h: float
+)-> tuple[float, float, float, float, float]:
+    # производные по dot_m, v_a, F_a, p_a, p_h
+    return (v_a, dot_m, p_a - p_h, F_a, -F_a)
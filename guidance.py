@@ -0,0 +1,33 @@
+from typing import NamedTuple
+
+
+class Guidance(NamedTuple):
+    # константы программы тангажа
+    t1: float = 30.2 # конец вертикального участка, с
+    arc_time: float = 200. # dot_tetha = -1/arc_time / sqrt(1 - (t/arc_time - arc_offset)^2)
+    arc_offset: float = 1.15
+    exp_rate: float = 77 / 109 # dot_tetha = -exp_rate / sqrt(2500 exp(2t/exp_time) - exp_c)
+    exp_time: float = 109.
+    exp_c: float = 5929.
+    t3_fraction: float = 0.2 # t3 = t2 + t3_fraction * время работы второй ступени
+    h_target: float = 270000. # высота круговой орбиты, м
+
+
+    def get_t2(
+        self,
+        rt
+    )-> float:
+        return rt.stages[0].engine_time
+
+
+    def get_t3(
+        self,
+        rt
+    )-> float:
+        # у одноступенчатой ракеты участка 2 нет
+        if len(rt.stages) < 2:
+            return self.get_t2(rt)
+        return rt.stages[1].engine_time * self.t3_fraction + rt.stages[0].engine_time
+
+
+GUIDANCE = Guidance()
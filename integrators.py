@@ -0,0 +1,407 @@
+import numpy as np
+import numpy.typing as npt
+from scipy.optimize import OptimizeResult, brentq
+
+
+# таблица Бутчера метода Дормана-Принса 5(4)
+C = np.array([0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1, 1])
+A = np.array([
+    [0, 0, 0, 0, 0, 0, 0],
+    [1 / 5, 0, 0, 0, 0, 0, 0],
+    [3 / 40, 9 / 40, 0, 0, 0, 0, 0],
+    [44 / 45, -56 / 15, 32 / 9, 0, 0, 0, 0],
+    [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729, 0, 0, 0],
+    [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656, 0, 0],
+    [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84, 0],
+])
+B = A[6]
+E = np.array([71 / 57600, 0, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40])
+# коэффициенты непрерывного продолжения 4-го порядка
+P = np.array([
+    [1, -8048581381 / 2820520608, 8663915743 / 2820520608, -12715105075 / 11282082432],
+    [0, 0, 0, 0],
+    [0, 131558114200 / 32700410799, -68118460800 / 10900136933, 87487479700 / 32700410799],
+    [0, -1754552775 / 470086768, 14199869525 / 1410260304, -10690763975 / 1880347072],
+    [0, 127303824393 / 49829197408, -318862633887 / 49829197408, 701980252875 / 199316789632],
+    [0, -282668133 / 205662961, 2019193451 / 616988883, -1453857185 / 822651844],
+    [0, 40617522 / 29380423, -110615467 / 29380423, 69997945 / 29380423],
+])
+
+SAFETY = 0.9
+MIN_FACTOR = 0.2
+MAX_FACTOR = 10.
+
+
+class DenseSolution:
+    # плотный вывод: на каждом шаге y(t_i + x h_i) = y_i + h_i * Q_i @ (x, x^2, x^3, x^4)
+
+    def __init__(
+        self,
+        n: int,
+        capacity: int = 256
+    )-> None:
+        self.n_steps = 0
+        self.ts = np.empty(capacity + 1)
+        self.ys = np.empty((capacity + 1, n))
+        self.Qs = np.empty((capacity, n, 4))
+
+
+    @property
+    def nbytes(
+        self
+    )-> int:
+        return self.ts.nbytes + self.ys.nbytes + self.Qs.nbytes
+
+
+    def reserve(
+        self
+    )-> None:
+        if self.n_steps + 1 < len(self.Qs):
+            return
+        cap = 2 * len(self.Qs)
+        self.ts = np.resize(self.ts, cap + 1)
+        self.ys = np.resize(self.ys, (cap + 1, self.ys.shape[1]))
+        self.Qs = np.resize(self.Qs, (cap, *self.Qs.shape[1:]))
+
+
+    def trim(
+        self
+    )-> "DenseSolution":
+        k = self.n_steps
+        self.ts = self.ts[:k + 1].copy()
+        self.ys = self.ys[:k + 1].copy()
+        self.Qs = self.Qs[:k].copy()
+        return self
+
+
+    def __call__(
+        self,
+        t: npt.ArrayLike
+    )-> npt.NDArray:
+        t = np.asarray(t, dtype=float)
+        k = self.n_steps
+        ts = self.ts[:k + 1]
+        i = np.clip(np.searchsorted(ts, t, side="right") - 1, 0, max(k - 1, 0))
+        if k == 0:
+            return np.repeat(self.ys[:1].T, t.size, axis=1).reshape((-1,) + t.shape)
+        h = ts[i + 1] - ts[i]
+        x = (t - ts[i]) / h
+        powers = np.stack([x, x ** 2, x ** 3, x ** 4], axis=-1)
+        res = self.ys[i] + h[..., None] * np.einsum("...nk,...k->...n", self.Qs[i], powers)
+        return np.moveaxis(res, -1, 0)
+
+
+class Stepper:
+    # общая часть шаговых методов: буферы стадий выделяются один раз
+
+    def __init__(
+        self,
+        fun,
+        y0: npt.NDArray,
+        args: tuple,
+        inplace: bool
+    )-> None:
+        self.n = len(y0)
+        self.args = args
+        self.inplace = inplace
+        self.fun = fun
+        self.nfev = 0
+        self.K = np.empty((7, self.n))
+        self.y_stage = np.empty(self.n)
+        self.dy = np.empty(self.n)
+        self.Q = np.empty((self.n, 4))
+
+
+    def eval(
+        self,
+        t: float,
+        y: npt.NDArray,
+        out: npt.NDArray
+    )-> None:
+        self.nfev += 1
+        if self.inplace:
+            self.fun(t, y, *self.args, out=out)
+        else:
+            out[:] = self.fun(t, y, *self.args)
+
+
+class DOPRI5(Stepper):
+    order = 5
+
+    def __init__(
+        self,
+        fun,
+        y0: npt.NDArray,
+        args: tuple = (),
+        rtol: float = 1e-8,
+        atol: float = 1e-6,
+        inplace: bool = False
+    )-> None:
+        super().__init__(fun, y0, args, inplace)
+        self.rtol = rtol
+        self.atol = atol
+        self.err = np.empty(self.n)
+        self.scale = np.empty(self.n)
+
+
+    def select_initial_step(
+        self,
+        t: float,
+        y: npt.NDArray,
+        f0: npt.NDArray,
+        t_bound: float
+    )-> float:
+        scale = self.atol + np.abs(y) * self.rtol
+        d0 = np.sqrt(np.mean((y / scale) ** 2))
+        d1 = np.sqrt(np.mean((f0 / scale) ** 2))
+        h0 = 1e-6 if d0 < 1e-5 or d1 < 1e-5 else 0.01 * d0 / d1
+        h0 = min(h0, abs(t_bound - t))
+        self.eval(t + h0, y + h0 * f0, self.K[1])
+        d2 = np.sqrt(np.mean(((self.K[1] - f0) / scale) ** 2)) / h0
+        if d1 <= 1e-15 and d2 <= 1e-15:
+            h1 = max(1e-6, h0 * 1e-3)
+        else:
+            h1 = (0.01 / max(d1, d2)) ** (1 / self.order)
+        return min(100 * h0, h1, abs(t_bound - t))
+
+
+    def step(
+        self,
+        t: float,
+        y: npt.NDArray,
+        h: float,
+        y_new: npt.NDArray
+    )-> float:
+        # K[0] уже содержит f(t, y); возвращает норму ошибки
+        K = self.K
+        for s in range(1, 7):
+            np.dot(A[s, :s], K[:s], out=self.dy)
+            np.multiply(self.dy, h, out=self.dy)
+            np.add(y, self.dy, out=self.y_stage if s < 6 else y_new)
+            self.eval(t + C[s] * h, self.y_stage if s < 6 else y_new, K[s])
+
+        np.dot(E, K, out=self.err)
+        np.multiply(self.err, h, out=self.err)
+        np.maximum(np.abs(y), np.abs(y_new), out=self.scale)
+        np.multiply(self.scale, self.rtol, out=self.scale)
+        np.add(self.scale, self.atol, out=self.scale)
+        np.divide(self.err, self.scale, out=self.err)
+        return np.sqrt(np.dot(self.err, self.err) / self.n)
+
+
+    def dense(
+        self
+    )-> npt.NDArray:
+        np.dot(self.K.T, P, out=self.Q)
+        return self.Q
+
+
+class RK4(Stepper):
+    order = 4
+
+    def step(
+        self,
+        t: float,
+        y: npt.NDArray,
+        h: float,
+        y_new: npt.NDArray
+    )-> float:
+        K = self.K
+        np.multiply(K[0], h / 2, out=self.dy)
+        np.add(y, self.dy, out=self.y_stage)
+        self.eval(t + h / 2, self.y_stage, K[1])
+        np.multiply(K[1], h / 2, out=self.dy)
+        np.add(y, self.dy, out=self.y_stage)
+        self.eval(t + h / 2, self.y_stage, K[2])
+        np.multiply(K[2], h, out=self.dy)
+        np.add(y, self.dy, out=self.y_stage)
+        self.eval(t + h, self.y_stage, K[3])
+
+        np.add(K[1], K[2], out=self.dy)
+        np.multiply(self.dy, 2, out=self.dy)
+        np.add(self.dy, K[0], out=self.dy)
+        np.add(self.dy, K[3], out=self.dy)
+        np.multiply(self.dy, h / 6, out=self.dy)
+        np.add(y, self.dy, out=y_new)
+        # f в конце шага нужна для эрмитова продолжения и становится K[0] следующего шага
+        self.eval(t + h, y_new, K[6])
+        self.h = h
+        self.y_old = y
+        self.y_new = y_new
+        return 0.
+
+
+    def dense(
+        self
+    )-> npt.NDArray:
+        # кубический эрмитов сплайн по значениям и производным на концах шага
+        f0 = self.K[0]
+        f1 = self.K[6]
+        np.subtract(self.y_new, self.y_old, out=self.dy)
+        np.divide(self.dy, self.h, out=self.dy)
+        Q = self.Q
+        Q[:, 0] = f0
+        Q[:, 1] = 3 * self.dy - 2 * f0 - f1
+        Q[:, 2] = f0 + f1 - 2 * self.dy
+        Q[:, 3] = 0.
+        return Q
+
+
+METHODS = {"DOPRI5": DOPRI5, "RK4": RK4}
+
+
+def find_events(
+    events: list,
+    g_old: list[float],
+    t_old: float,
+    t_new: float,
+    y_new: npt.NDArray,
+    sol: DenseSolution,
+    args: tuple
+)-> tuple[list[float], int]:
+    # значения событий в конце шага и первое сработавшее терминальное событие
+    g_new = [ev(t_new, y_new, *args) for ev in events]
+    hits = []
+    for k, ev in enumerate(events):
+        direction = getattr(ev, "direction", 0)
+        up = g_old[k] <= 0 <= g_new[k] and g_old[k] != g_new[k]
+        down = g_old[k] >= 0 >= g_new[k] and g_old[k] != g_new[k]
+        if (direction >= 0 and up) or (direction <= 0 and down):
+            root = brentq(lambda t: ev(t, sol(t), *args), t_old, t_new, xtol=4 * np.finfo(float).eps)
+            hits.append((root, k))
+    hits.sort()
+    return g_new, hits
+
+
+def solve(
+    fun,
+    t_span: tuple[float, float],
+    y0: npt.ArrayLike,
+    args: tuple = (),
+    method: str = "DOPRI5",
+    rtol: float = 1e-8,
+    atol: float = 1e-6,
+    first_step: float = None,
+    max_step: float = np.inf,
+    step: float = 0.05,
+    events: list = None,
+    inplace: bool = False
+)-> OptimizeResult:
+    # интерфейс повторяет scipy.integrate.solve_ivp для фиксированной размерности системы
+    t0, t_bound = float(t_span[0]), float(t_span[1])
+    y = np.array(y0, dtype=float)
+    y_new = np.empty_like(y)
+    events = [] if events is None else list(events)
+
+    method = method.upper()
+    if method == "RK4":
+        stepper = RK4(fun, y, args, inplace)
+    else:
+        stepper = METHODS[method](fun, y, args, rtol, atol, inplace)
+    adaptive = method != "RK4"
+
+    sol = DenseSolution(len(y))
+    sol.ts[0] = t0
+    sol.ys[0] = y
+    t_events = [[] for _ in events]
+    y_events = [[] for _ in events]
+    g_old = [ev(t0, y, *args) for ev in events]
+
+    stepper.eval(t0, y, stepper.K[0])
+    if adaptive:
+        h = first_step if first_step is not None else stepper.select_initial_step(t0, y, stepper.K[0], t_bound)
+        h = min(h, max_step)
+    else:
+        h = step
+
+    t = t0
+    nrejected = 0
+    status = 0
+    message = "The solver successfully reached the end of the integration interval."
+    while t < t_bound:
+        # как в solve_ivp, наименьший шаг - по расстоянию до соседнего числа от текущего t
+        min_step = 10 * np.abs(np.nextafter(t, np.inf) - t)
+        h = min(h, t_bound - t)
+        t_new = t + h
+        if t_bound - t_new < min_step:
+            t_new = t_bound
+            h = t_new - t
+
+        err = stepper.step(t, y, h, y_new)
+        # NaN в оценке ошибки (переполнение на шаге) - отказ от шага, как в solve_ivp
+        if adaptive and not err <= 1:
+            nrejected += 1
+            h *= max(MIN_FACTOR, SAFETY * err ** (-1 / stepper.order))
+            if h < min_step:
+                status = -1
+                message = "Required step size is less than spacing between numbers."
+                break
+            continue
+
+        sol.reserve()
+        k = sol.n_steps
+        sol.Qs[k] = stepper.dense()
+        sol.ts[k + 1] = t_new
+        sol.ys[k + 1] = y_new
+        sol.n_steps += 1
+
+        if events:
+            g_old, hits = find_events(events, g_old, t, t_new, y_new, sol, args)
+            terminal = None
+            for root, k_ev in hits:
+                t_events[k_ev].append(root)
+                y_events[k_ev].append(sol(root))
+                if getattr(events[k_ev], "terminal", False):
+                    terminal = root
+                    break
+            if terminal is not None:
+                status = 1
+                message = "A termination event occurred."
+                sol.ts[sol.n_steps] = terminal
+                sol.ys[sol.n_steps] = y_events[k_ev][-1]
+                # h шага не меняется: последнее продолжение остается верным внутри укороченного шага
+                last_h = t_new - t
+                x_end = (terminal - t) / last_h
+                Q = sol.Qs[sol.n_steps - 1]
+                Q[:] = Q * (x_end ** np.arange(1, 5)) / x_end if x_end > 0 else Q
+                t = terminal
+                break
+
+        # FSAL: последняя стадия шага равна f(t_new, y_new)
+        stepper.K[0] = stepper.K[6]
+        y, y_new = y_new, y
+        t = t_new
+        if adaptive:
+            factor = MAX_FACTOR if err == 0 else min(MAX_FACTOR, SAFETY * err ** (-1 / stepper.order))
+            h = min(h * factor, max_step)
+
+    sol.trim()
+    return OptimizeResult(
+        t=sol.ts, y=sol.ys.T, sol=sol, nfev=stepper.nfev, njev=0, nlu=0,
+        naccepted=sol.n_steps, nrejected=nrejected,
+        t_events=[np.array(te) for te in t_events], y_events=[np.array(ye) for ye in y_events],
+        status=status, message=message, success=status >= 0,
+    )
+
+
+if __name__ == "__main__":
+    import time
+    from main import solver, Rocket, Atmosphere
+
+    rt = Rocket()
+    atm = Atmosphere()
+    t_span = (0, 32900 + int(np.ceil(rt.engine_time)))
+    t_check = np.linspace(*t_span, 10000)
+
+    runs = {}
+    for name, options in (("solve_ivp", {}), ("DOPRI5", {"backend": "DOPRI5"}), ("RK4", {"backend": "RK4", "step": 0.5})):
+        start = time.time()
+        tr = solver(rt, atm, t_span, segmented=True, dense=True, **options)
+        runs[name] = (time.time() - start, tr)
+
+    ref_time, ref = runs["solve_ivp"]
+    ref_y = ref(t_check)
+    for name, (elapsed, tr) in runs.items():
+        dev = np.abs(tr(t_check) - ref_y).max(axis=1)
+        print(f"{name}: time = {elapsed:.3f} s, speedup = {ref_time / elapsed:.2f}, nfev = {tr.nfev}, "
+              f"max |dh| = {dev[0]:.3e} m, max |dv| = {dev[2]:.3e} m/s, max |dtetha| = {dev[3]:.3e}")
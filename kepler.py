@@ -0,0 +1,209 @@
+import numpy as np
+import numpy.typing as npt
+from scipy.optimize import brentq
+
+from forces import G, M, r0
+
+
+MU = G * M
+# выше этой высоты модель не учитывает атмосферу: сопротивление и противодавление равны нулю
+H_VACUUM = 1200000.
+
+
+def solve_kepler(
+    mean: npt.NDArray,
+    e: float,
+    hyperbolic: bool = False
+)-> npt.NDArray:
+    # эксцентрическая (гиперболическая) аномалия по средней методом Ньютона, векторно
+    if hyperbolic:
+        E = np.arcsinh(mean / e)
+        for _ in range(50):
+            d = (e * np.sinh(E) - E - mean) / (e * np.cosh(E) - 1)
+            E = E - d
+            if np.all(np.abs(d) < 1e-14 * np.maximum(1., np.abs(E))):
+                break
+        return E
+    E = mean + e * np.sin(mean) if e < 0.8 else mean + np.pi * np.sign(np.sin(mean))
+    for _ in range(50):
+        d = (E - e * np.sin(E) - mean) / (1 - e * np.cos(E))
+        E = E - d
+        if np.all(np.abs(d) < 1e-14 * np.maximum(1., np.abs(E))):
+            break
+    return E
+
+
+class KeplerCoast:
+    # пассивный полет в центральном поле: h, s, v, tetha в любой момент по замкнутым формулам;
+    # tetha - угол наклона траектории, s - дальность по поверхности радиуса r0
+
+    def __init__(
+        self,
+        t0: float,
+        y0: npt.NDArray
+    )-> None:
+        h, s, v, tetha, tau = y0
+        self.t0 = t0
+        self.s0 = s
+        self.tau = tau
+        r = r0 + h
+        v_r = v * np.sin(tetha)
+        self.c = r * v * np.cos(tetha)
+        self.p = self.c ** 2 / MU
+        self.energy = v ** 2 / 2 - MU / r
+        self.e = np.sqrt(max(0., 1 + 2 * self.energy * self.c ** 2 / MU ** 2))
+        self.a = - MU / (2 * self.energy)
+        self.hyperbolic = self.e >= 1.
+        e = self.e
+
+        # истинная аномалия и средняя аномалия в начальный момент
+        nu0 = np.arctan2(v_r * self.c / MU, self.p / r - 1)
+        if self.hyperbolic:
+            F = 2 * np.arctanh(np.sqrt((e - 1) / (e + 1)) * np.tan(nu0 / 2))
+            self.mean0 = e * np.sinh(F) - F
+            self.n = np.sqrt(MU / (- self.a) ** 3)
+            self.period = np.inf
+        else:
+            E = np.arctan2(np.sqrt(1 - e ** 2) * np.sin(nu0), e + np.cos(nu0))
+            self.mean0 = E - e * np.sin(E)
+            self.n = np.sqrt(MU / self.a ** 3)
+            self.period = 2 * np.pi / self.n
+        self.nu0 = self.get_nu(np.array([self.mean0]))[0][0]
+        # совместимость с участками плотного вывода solve_ivp
+        self.ts = np.array([t0])
+        self.interpolants = []
+
+
+    def get_nu(
+        self,
+        mean: npt.NDArray
+    )-> tuple[npt.NDArray, npt.NDArray]:
+        # непрерывная по времени истинная аномалия (без свертки в [-pi, pi]) и радиус
+        e = self.e
+        E = solve_kepler(mean, e, self.hyperbolic)
+        if self.hyperbolic:
+            nu = 2 * np.arctan(np.sqrt((e + 1) / (e - 1)) * np.tanh(E / 2))
+            r = self.a * (1 - e * np.cosh(E))
+        else:
+            beta = e / (1 + np.sqrt(1 - e ** 2))
+            nu = E + 2 * np.arctan2(beta * np.sin(E), 1 - beta * np.cos(E))
+            r = self.a * (1 - e * np.cos(E))
+        return (nu, r)
+
+
+    def __call__(
+        self,
+        t: npt.ArrayLike
+    )-> npt.NDArray:
+        t = np.asarray(t, dtype=float)
+        scalar = t.ndim == 0
+        t = np.atleast_1d(t)
+
+        nu, r = self.get_nu(self.mean0 + self.n * (t - self.t0))
+        k = np.sqrt(MU / self.p)
+        cos_nu = np.cos(nu)
+        v_r = k * self.e * np.sin(nu)
+        v_t = k * (1 + self.e * cos_nu)
+
+        res = np.empty((5, t.size))
+        res[0] = r - r0
+        res[1] = self.s0 + r0 * (nu - self.nu0)
+        res[2] = np.hypot(v_r, v_t)
+        res[3] = np.arctan2(v_r, v_t)
+        res[4] = self.tau
+        return res[:, 0] if scalar else res
+
+
+    def get_sample_times(
+        self,
+        t0: float,
+        t1: float,
+        n_min: int = 16
+    )-> npt.NDArray:
+        # сетка для поиска событий: не реже 256 точек на виток
+        dt = self.period / 256 if np.isfinite(self.period) else (t1 - t0) / 256
+        n = max(n_min, int(np.ceil((t1 - t0) / dt)) + 1)
+        return np.linspace(t0, t1, n)
+
+
+    def find_event(
+        self,
+        t1: float,
+        events: list
+    )-> tuple[float, int]:
+        # первое событие на [t0, t1]: смена знака на сетке с учетом direction, уточнение brentq
+        t = self.get_sample_times(self.t0, t1)
+        y = self(t)
+        t_first = np.inf
+        k_first = -1
+        for k, event in enumerate(events):
+            vals = event(t, y)
+            direction = getattr(event, "direction", 0)
+            crossed = np.sign(vals[:-1]) != np.sign(vals[1:])
+            if direction > 0:
+                crossed &= vals[1:] > vals[:-1]
+            elif direction < 0:
+                crossed &= vals[1:] < vals[:-1]
+            # начало участка на поверхности события не считается его срабатыванием
+            crossed &= vals[:-1] != 0
+            idx = np.nonzero(crossed)[0]
+            if not idx.size:
+                continue
+            i = idx[0]
+            root = brentq(lambda x: event(x, self(x)), t[i], t[i + 1], xtol=1e-10)
+            if root < t_first:
+                t_first = root
+                k_first = k
+        return (t_first, k_first)
+
+
+def reentry(
+    t: float,
+    vals: npt.NDArray,
+    *args
+)-> float:
+    return vals[0] - H_VACUUM
+
+
+reentry.direction = -1
+reentry.terminal = True
+
+
+def vacuum(
+    t: float,
+    vals: npt.NDArray,
+    *args
+)-> float:
+    return vals[0] - H_VACUUM
+
+
+vacuum.direction = 1
+vacuum.terminal = True
+
+
+if __name__ == "__main__":
+    import time
+    import scipy.integrate as integrate
+    from forces import g
+
+    def ballistic(t, vals):
+        h, s, v, tetha, tau = vals
+        r = r0 + h
+        return [v * np.sin(tetha), r0 / r * v * np.cos(tetha), - g(h) * np.sin(tetha),
+                (v / r - g(h) / v) * np.cos(tetha), 0.]
+
+    y0 = np.array([1500000., 0., 7300., 0.15, 500.])
+    t_span = (0., 32900.)
+    start = time.time()
+    ref = integrate.solve_ivp(ballistic, t_span, y0, rtol=1e-12, atol=1e-6, dense_output=True)
+    t_ref = time.time() - start
+
+    t = np.linspace(*t_span, 1000000)
+    start = time.time()
+    coast = KeplerCoast(t_span[0], y0)
+    y = coast(t)
+    t_kep = time.time() - start
+    err = np.abs(y - ref.sol(t)).max(axis=1)
+    print(f"solve_ivp: {t_ref:.3f} s, nfev = {ref.nfev}; Kepler, 10^6 points: {t_kep:.3f} s")
+    print(f"e = {coast.e:.5f}, period = {coast.period:.1f} s, max error h, s, v, tetha: {err}")
+    print("reentry at", coast.find_event(t_span[1], [reentry]))
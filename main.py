@@ -1,14 +1,22 @@
 import numpy as np
 import scipy.integrate as integrate
-import matplotlib.pyplot as plt
 import numpy.typing as npt
+import sys
 import time
 import warnings
-warnings.filterwarnings("error")
 
 from atmosphere import Atmosphere
-from rocket import Rocket, StageOne, StageTwo
+from rocket import Rocket, get_stage_one, get_stage_two
+from trajectory import Trajectory
+from guidance import Guidance, GUIDANCE
+import integrators
+import kepler
+from profiling import Profile
 from forces import g, aerodynamic_force, thirst_force, G, r0, M
+from typing import NamedTuple
+from types import SimpleNamespace
+from decimate import decimate, get_event_indices
+from scipy.optimize import OptimizeResult
 
 
 def get_mach_val(
@@ -24,90 +32,554 @@ def V1(
     return np.sqrt(G * M / (r0 + h))
 
 
+def is_engine_active(
+    v: float,
+    h: float
+)-> bool:
+    return not (v > (V1(h) + 5))
+
+
 def get_vals(
-    t: float, 
+    tau: float, 
     v: float, 
     h: float,
     rt: Rocket,
-    atm: Atmosphere
-) -> tuple[float]:
+    atm: Atmosphere,
+    is_active: bool = True
+) -> tuple[float, float, float]:
     if h < 0.0: 
         raise KeyboardInterrupt("Negative H, error", h)
     
     if h <= 1200000.:
-        mach = get_mach_val(v, atm.get_Vs(h))
+        P_atm, rho, Vs = atm.get_flow_vals(h)
+        mach = get_mach_val(v, Vs)
         Cx = rt.get_aero_cf(mach, h)
-        rho = atm.get_rho(h)
 
         D = aerodynamic_force(Cx, rho, v, rt.S)
-        P_atm = atm.get_P(h)
     else:
         D = 0.
         P_atm = 0.
 
-    if v > (V1(h) + 5) and rt.is_active:
-        rt.is_active = False
-        rt.inactive_time -= t
-    elif not (v > (V1(h) + 5)) and not rt.is_active:
-        rt.is_active = True
-        rt.inactive_time += t
+    m = rt.get_current_total_m(tau)
+    if is_active:
+        F = thirst_force(*rt.get_thirst_vals(tau), P_atm)
+    else:
+        F = 0.
+    return (m, F, D)
 
 
-    m = rt.get_current_total_m(t)
-    F = thirst_force(*rt.get_thirst_vals(t), P_atm)
+def get_branch(
+    t: float,
+    tetha: float,
+    F: float,
+    rt: Rocket,
+    guidance: Guidance = GUIDANCE
+)-> int:
+    # номер участка программы тангажа
+    t1 = guidance.t1
+    t2 = guidance.get_t2(rt)
+    t3 = guidance.get_t3(rt)
+    if 0. <= t <= t1:
+        return 0
+    elif t1 < t <= t2:
+        return 1
+    elif t2 < t <= t3 and F > 0.:
+        return 2
+    elif abs(tetha) >= 1e-3:
+        return 3
+    return 4
+
+
+def get_dot_tetha(
+    branch: int,
+    t: float,
+    h: float,
+    v: float,
+    tetha: float,
+    guidance: Guidance = GUIDANCE
+)-> float:
+    if branch == 0:
+        return 0.
+    elif branch == 1:
+        a = guidance.arc_time
+        return -1 / a / np.sqrt(1 - (t / a - guidance.arc_offset) ** 2)
+    elif branch == 2:
+        return - guidance.exp_rate / np.sqrt(2500 * np.exp(2 * t / guidance.exp_time) - guidance.exp_c)
+    elif branch == 3:
+        h_t = guidance.h_target
+        return - ((g(h) / v - V1(h_t) / (r0 + h_t)) * np.cos(tetha))
+    return - tetha / 10
+
+
+def func(
+    t: float,
+    vals: npt.NDArray,
+    rt: Rocket,
+    atm: Atmosphere,
+    guidance: Guidance = GUIDANCE
+)-> npt.NDArray:
+    # tau - накопленное время работы двигателей, двигатель выключен при v > V1(h) + 5
+    h = vals[0]
+    v = vals[2]
+    tetha = vals[3]
+    tau = vals[4]
+
+    is_active = is_engine_active(v, h)
+    m, F, D = get_vals(tau, v, h, rt, atm, is_active)
+
+    dot_h = v * np.sin(tetha)
+    dot_s = r0 / (r0 + h) * v * np.cos(tetha)
+    dot_v = (F - D) / m - g(h) * np.sin(tetha)
+    dot_tetha = get_dot_tetha(get_branch(t, tetha, F, rt, guidance), t, h, v, tetha, guidance)
+    dot_tau = 1. if is_active else 0.
+
+    return np.array([dot_h, dot_s, dot_v, dot_tetha, dot_tau])
+
+
+class Phase(NamedTuple):
+    stage: int # участок работы двигателей rt.timeline (ступень или связка блоков)
+    is_active: bool
+    is_sliding: bool
+    is_circular: bool
+    branch: int
+
+
+def get_phase(
+    t: float,
+    stage: int,
+    is_active: bool,
+    is_sliding: bool,
+    is_circular: bool,
+    rt: Rocket,
+    guidance: Guidance = GUIDANCE
+)-> Phase:
+    # участок определяется справа от t: переключения по времени уже пройдены
+    t1 = guidance.t1
+    t2 = guidance.get_t2(rt)
+    t3 = guidance.get_t3(rt)
+    if t < t1:
+        branch = 0
+    elif t < t2:
+        branch = 1
+    elif t < t3 and (is_active or is_sliding) and stage < rt.nburns:
+        branch = 2
+    elif not is_circular:
+        branch = 3
+    else:
+        branch = 4
+    return Phase(stage, is_active, is_sliding, is_circular, branch)
+
+
+def get_phase_end(
+    phase: Phase,
+    rt: Rocket,
+    guidance: Guidance = GUIDANCE
+)-> float:
+    t1 = guidance.t1
+    t2 = guidance.get_t2(rt)
+    t3 = guidance.get_t3(rt)
+    if phase.branch == 0:
+        return t1
+    elif phase.branch == 1:
+        return t2
+    elif phase.branch == 2:
+        return t3
+    return np.inf
+
+
+def get_phase_forces(
+    vals: npt.NDArray,
+    rt: Rocket,
+    atm: Atmosphere,
+    stage: int
+)-> tuple[float, float, float]:
+    # масса, полная тяга ступени и сила сопротивления
+    h = vals[0]
+    v = vals[2]
+    if h < 0.0: 
+        raise KeyboardInterrupt("Negative H, error", h)
+    if h <= 1200000.:
+        P_atm, rho, Vs = atm.get_flow_vals(h)
+        D = aerodynamic_force(rt.get_aero_cf(get_mach_val(v, Vs), h), rho, v, rt.S)
+    else:
+        D = 0.
+        P_atm = 0.
+    m = rt.get_stage_m(stage, vals[4])
+    F = thirst_force(*rt.get_stage_thirst_vals(stage), P_atm)
     return (m, F, D)
 
 
-def solver(
+def get_throttle(
+    vals: npt.NDArray,
+    m: float,
+    F: float,
+    D: float
+)-> float:
+    # доля тяги, удерживающая v = V1(h) + 5 (скользящий режим на поверхности выключения)
+    h = vals[0]
+    v = vals[2]
+    tetha = vals[3]
+    if F <= 0.:
+        return 0.
+    dot_V1 = - V1(h) / (2 * (r0 + h)) * v * np.sin(tetha)
+    return (m * (dot_V1 + g(h) * np.sin(tetha)) + D) / F
+
+
+def func_phase(
+    t: float,
+    vals: npt.NDArray,
     rt: Rocket,
     atm: Atmosphere,
-    t_span: tuple[float, float],
-):
-    t_ev = np.linspace(t_span[0], t_span[1], 1000000)
-    tetha1 = 0.
-
-    def func(t, vals):
-        h = vals[0]
-        s = vals[1]
-        v = vals[2]
-        tetha = vals[3]
-
-        nonlocal tetha1
-        t1 = 30.2
-        t2 = rt.stage_one.engine_time
-        t3 = rt.stage_two.engine_time / 5 + t2
-        m, F, D = get_vals(t, v, h, rt, atm)
-
-        dot_h = v * np.sin(tetha)
-        dot_s = r0 / (r0 + h) * v * np.cos(tetha)
-        dot_v = (F - D) / m - g(h) * np.sin(tetha)
-
-
-        if 0. <= t <= t1:
-            dot_tetha = 0.
-        elif t1 < t <= t2:
-            dot_tetha = -1 / 200 / np.sqrt(1 - (t / 200 - 1.15) ** 2)
-        elif t2 < t <= t3 and F > 0.:
-            dot_tetha = - 77 / 109 / np.sqrt(2500 * np.exp(2 * t / 109) - 5929)
-        elif abs(tetha) >= 1e-3:
-            dot_tetha = - ((g(h) / v - V1(270000) / (r0 + 270000)) * np.cos(tetha))
+    phase: Phase,
+    guidance: Guidance = GUIDANCE,
+    out: npt.NDArray = None
+)-> npt.NDArray:
+    # правая часть на одном участке: ступень, режим двигателя и ветвь тангажа фиксированы
+    h = vals[0]
+    v = vals[2]
+    tetha = vals[3]
+
+    m, F, D = get_phase_forces(vals, rt, atm, phase.stage)
+    if phase.is_sliding:
+        u = get_throttle(vals, m, F, D)
+    elif phase.is_active:
+        u = 1.
+    else:
+        u = 0.
+
+    dot_h = v * np.sin(tetha)
+    dot_s = r0 / (r0 + h) * v * np.cos(tetha)
+    dot_v = (u * F - D) / m - g(h) * np.sin(tetha)
+    dot_tetha = get_dot_tetha(phase.branch, t, h, v, tetha, guidance)
+
+    if out is None:
+        return np.array([dot_h, dot_s, dot_v, dot_tetha, u])
+    out[0] = dot_h
+    out[1] = dot_s
+    out[2] = dot_v
+    out[3] = dot_tetha
+    out[4] = u
+    return out
+
+
+def get_engine_mode(
+    vals: npt.NDArray,
+    rt: Rocket,
+    atm: Atmosphere,
+    stage: int
+)-> tuple[bool, bool]:
+    # режим двигателя на поверхности v = V1(h) + 5: включен, выключен или скользящий
+    if stage >= rt.nburns:
+        return (False, False)
+    u = get_throttle(vals, *get_phase_forces(vals, rt, atm, stage))
+    if u >= 1.:
+        return (True, False)
+    elif u <= 0.:
+        return (False, False)
+    return (False, True)
+
+
+def get_phase_events(
+    rt: Rocket,
+    atm: Atmosphere,
+    phase: Phase
+)-> list:
+    # терминальные события, завершающие участок
+    events = []
+
+    if phase.stage < rt.nburns:
+        if phase.is_active:
+            def cutoff(t, vals, *args):
+                return vals[2] - V1(vals[0]) - 5
+            cutoff.direction = 1
+            events.append((cutoff, "cutoff"))
+        elif phase.is_sliding:
+            def saturate(t, vals, *args):
+                return get_throttle(vals, *get_phase_forces(vals, rt, atm, phase.stage)) - 1
+            saturate.direction = 1
+            events.append((saturate, "saturate"))
+
+            def release(t, vals, *args):
+                return get_throttle(vals, *get_phase_forces(vals, rt, atm, phase.stage))
+            release.direction = -1
+            events.append((release, "release"))
         else:
-            tetha1 = tetha
-            dot_tetha = - tetha1 / 10
+            def ignition(t, vals, *args):
+                return vals[2] - V1(vals[0]) - 5
+            ignition.direction = -1
+            events.append((ignition, "ignition"))
+
+        if phase.is_active or phase.is_sliding:
+            t_stage = float(rt.timeline.t_end[phase.stage])
+            def burnout(t, vals, *args):
+                return vals[4] - t_stage
+            burnout.direction = 1
+            events.append((burnout, "burnout"))
+
+    # выход на |tetha| = 1e-3 проверяется по обеим границам: шаг может перескочить через ноль
+    if phase.branch == 3:
+        def circular_upper(t, vals, *args):
+            return vals[3] - 1e-3
+        circular_upper.direction = -1
+        def circular_lower(t, vals, *args):
+            return vals[3] + 1e-3
+        circular_lower.direction = 1
+        events.append((circular_upper, "circular"))
+        events.append((circular_lower, "circular"))
+    elif phase.branch == 4:
+        def noncircular_upper(t, vals, *args):
+            return vals[3] - 1e-3
+        noncircular_upper.direction = 1
+        def noncircular_lower(t, vals, *args):
+            return vals[3] + 1e-3
+        noncircular_lower.direction = -1
+        events.append((noncircular_upper, "noncircular"))
+        events.append((noncircular_lower, "noncircular"))
+
+    for event, _ in events:
+        event.terminal = True
+    return events
+
+
+def get_next_phase(
+    t: float,
+    vals: npt.NDArray,
+    name: str,
+    phase: Phase,
+    rt: Rocket,
+    atm: Atmosphere,
+    guidance: Guidance = GUIDANCE
+)-> Phase:
+    stage = phase.stage
+    is_active = phase.is_active
+    is_sliding = phase.is_sliding
+    is_circular = phase.is_circular
+
+    if name in ("cutoff", "ignition"):
+        is_active, is_sliding = get_engine_mode(vals, rt, atm, stage)
+    elif name == "saturate":
+        is_active, is_sliding = True, False
+    elif name == "release":
+        is_active, is_sliding = False, False
+    elif name == "burnout":
+        stage += 1
+        if stage >= rt.nburns:
+            is_active, is_sliding = False, False
+        elif is_sliding:
+            is_active, is_sliding = get_engine_mode(vals, rt, atm, stage)
+    elif name == "circular":
+        is_circular = True
+    elif name == "noncircular":
+        is_circular = False
+    return get_phase(t, stage, is_active, is_sliding, is_circular, rt, guidance)
+
+
+def get_initial_phase(
+    t: float,
+    y: npt.NDArray,
+    rt: Rocket,
+    guidance: Guidance = GUIDANCE
+)-> Phase:
+    return get_phase(t, rt.get_stage(y[4]), is_engine_active(y[2], y[0]), False, abs(y[3]) < 1e-3, rt, guidance)
+
+
+def integrate_phases(
+    rt: Rocket,
+    atm: Atmosphere,
+    t: float,
+    y: npt.NDArray,
+    phase: Phase,
+    t_final: float,
+    guidance: Guidance = GUIDANCE,
+    branches: set[int] = None,
+    t_ev: npt.NDArray = None,
+    rtol: float = 1e-8,
+    atol: float = 1e-6,
+    method: str = "RK45",
+    backend: str = "scipy",
+    coast: bool = False,
+    progress = None,
+    **backend_options
+)-> OptimizeResult:
+    # интегрирование по участкам из состояния (t, y, phase) до t_final;
+    # если задано branches, остановка при переходе на ветвь тангажа вне этого множества;
+    # coast=True: пассивный полет выше атмосферы считается по Кеплеру до входа в атмосферу или включения двигателя;
+    # progress(t, y, phase, name) вызывается после каждого участка с новым участком phase
+    ts = []
+    ys = []
+    segments = []
+    switches = []
+    nfev = 0
+    njev = 0
+    nlu = 0
+    status = 0
+    message = "The solver successfully reached the end of the integration interval."
+    first = True
+    name = None
+
+    while t < t_final and (branches is None or phase.branch in branches):
+        is_passive = coast and not phase.is_active and not phase.is_sliding and phase.branch >= 3
+        if is_passive and name != "reentry" and (name == "vacuum" or y[0] > kepler.H_VACUUM):
+            sol = kepler.KeplerCoast(t, y)
+            events = [ev for ev in get_phase_events(rt, atm, phase) if ev[1] not in ("circular", "noncircular")]
+            events.append((kepler.reentry, "reentry"))
+            t_next, k = sol.find_event(t_final, [e for e, _ in events])
+            name = events[k][1] if k >= 0 else "end"
+            t_next = min(t_next, t_final)
+            y = sol(t_next)
+
+            if t_ev is None:
+                seg_t = sol.get_sample_times(t, t_next, 2)[0 if first else 1:]
+            else:
+                seg_t = t_ev[((t_ev >= t) if first else (t_ev > t)) & (t_ev <= t_next)]
+            ts.append(seg_t)
+            ys.append(sol(seg_t))
+            segments.append((t, t_next, phase, sol))
+            switches.append((t_next, name))
+            first = False
+
+            t = t_next
+            if name == "reentry":
+                # после пассивного участка ветвь тангажа определяется по текущему углу
+                phase = get_phase(t, phase.stage, False, False, abs(y[3]) < 1e-3, rt, guidance)
+            else:
+                phase = get_next_phase(t, y, name, phase, rt, atm, guidance)
+            if progress is not None:
+                progress(t, y, phase, name)
+            continue
+
+        t_end = min(get_phase_end(phase, rt, guidance), t_final)
+        events = get_phase_events(rt, atm, phase)
+        if is_passive:
+            events.append((kepler.vacuum, "vacuum"))
+        if backend == "scipy":
+            sol = integrate.solve_ivp(
+                func_phase, t_span=(t, t_end), y0=y, method=method, rtol=rtol, atol=atol,
+                args=(rt, atm, phase, guidance), events=[e for e, _ in events], dense_output=True, **backend_options
+            )
+        else:
+            sol = integrators.solve(
+                func_phase, t_span=(t, t_end), y0=y, method=backend, rtol=rtol, atol=atol,
+                args=(rt, atm, phase, guidance), events=[e for e, _ in events], inplace=True, **backend_options
+            )
+        nfev += sol.nfev
+        njev += sol.njev
+        nlu += sol.nlu
+        if sol.status < 0:
+            status = sol.status
+            message = sol.message
+            break
+
+        fired = [k for k, te in enumerate(sol.t_events) if te.size]
+        if sol.status == 1 and fired:
+            k = fired[0]
+            t_next = sol.t_events[k][0]
+            y = sol.y_events[k][0]
+            name = events[k][1]
+        else:
+            t_next = t_end
+            y = sol.y[:, -1]
+            name = "pitch" if t_end < t_final else "end"
+
+        if t_ev is None:
+            ts.append(sol.t if first else sol.t[1:])
+            ys.append(sol.y if first else sol.y[:, 1:])
+        else:
+            lo = t_ev >= t if first else t_ev > t
+            seg_ev = t_ev[lo & (t_ev <= t_next)]
+            ts.append(seg_ev)
+            ys.append(sol.sol(seg_ev) if seg_ev.size else np.empty((len(y), 0)))
+        segments.append((t, t_next, phase, sol.sol))
+        switches.append((t_next, name))
+        first = False
+
+        t = t_next
+        phase = get_next_phase(t, y, name, phase, rt, atm, guidance)
+        if progress is not None:
+            progress(t, y, phase, name)
+
+    return OptimizeResult(
+        t=np.concatenate(ts) if ts else np.array([t]), y=np.concatenate(ys, axis=1) if ys else y[:, None],
+        phases=[seg[:3] for seg in segments], segments=segments, switches=switches,
+        t_last=t, y_last=y, phase_last=phase,
+        nfev=nfev, njev=njev, nlu=nlu, status=status, message=message, success=status >= 0,
+    )
+
+
+def solver_segmented(
+    rt: Rocket,
+    atm: Atmosphere,
+    t_span: tuple[float, float],
+    t_ev: npt.NDArray = None,
+    guidance: Guidance = GUIDANCE,
+    **options
+)-> OptimizeResult:
+    # интегрирование по участкам между точками переключения, найденными как события solve_ivp
+    t = t_span[0]
+    y = np.array([0, 0, 0, np.pi / 2, 0], dtype=float)
+    phase = get_initial_phase(t, y, rt, guidance)
+    return integrate_phases(rt, atm, t, y, phase, t_span[1], guidance, t_ev=t_ev, **options)
 
-        # print(f"t = {round(t, 2)}, h = {round(h, 1)}, v1 = {round(V1(h), 1)} v = {round(v, 1)}, theta = {round(tetha, 20)}, m = {round(m, 1)}, F = {round(F, 1)}, D = {round(D, 5)}")
-        
-        return np.array([dot_h, dot_s, dot_v, dot_tetha])
-    
-    sol = integrate.solve_ivp(func, t_span=t_span, y0=(0, 0, 0, np.pi / 2), t_eval = t_ev, max_step = 0.1)
 
+def solver(
+    rt: Rocket,
+    atm: Atmosphere,
+    t_span: tuple[float, float],
+    segmented: bool = False,
+    dense: bool = False,
+    guidance: Guidance = GUIDANCE,
+    profile: Profile = None,
+    cache = None,
+    **options
+):
+    # dense=True возвращает Trajectory с плотным выводом вместо сетки из 10^6 точек
+    if cache is not None and profile is None:
+        # cache - cache.ResultCache: повторный расчет с теми же входными данными читается с диска
+        from cache import cached_solve
+        return cached_solve(cache, rt, atm, t_span, segmented, dense, guidance, **options)
+    if profile is not None:
+        # без profile правая часть и интегратор вызываются напрямую, без оберток
+        with profile.instrument(sys.modules[__name__], rt, atm):
+            sol = solver(rt, atm, t_span, segmented, dense, guidance, **options)
+        sol.profile = profile.report()
+        return sol
+
+    t_ev = None if dense else np.linspace(t_span[0], t_span[1], 1000000)
+    if segmented:
+        sol = solver_segmented(rt, atm, t_span, t_ev, guidance, **options)
+    elif options.get("backend", "scipy") != "scipy":
+        y0 = (0, 0, 0, np.pi / 2, 0)
+        options.setdefault("max_step", 0.1)
+        sol = integrators.solve(func, t_span=t_span, y0=y0, args=(rt, atm, guidance), method=options.pop("backend"),
+                                **options)
+        if not dense:
+            sol.y = sol.sol(t_ev)
+            sol.t = t_ev
+    else:
+        # method, rtol, atol и max_step передаются в solve_ivp, по умолчанию RK45 с max_step=0.1
+        y0 = (0, 0, 0, np.pi / 2, 0)
+        options.pop("backend", None)
+        options.setdefault("max_step", 0.1)
+        sol = integrate.solve_ivp(func, t_span=t_span, y0=y0, t_eval = t_ev, args=(rt, atm, guidance),
+                                  dense_output=dense, **options)
+
+    if dense:
+        if not segmented:
+            sol.segments = [(sol.t[0], sol.t[-1], None, sol.sol)]
+            sol.switches = [(sol.t[-1], "end")]
+        return Trajectory.from_result(sol)
     return sol
 
 
 def find_active_idx(
     solution
 )-> int:
-    return np.where(solution.y[2] >= V1(solution.y[0][np.where(abs(solution.y[0] - max(solution.y[0])) <= 1e-2)[0][0]]))[0][0]
+    # первая точка с высотой в пределах 1 см от максимальной и первая точка со скоростью не ниже V1 на этой высоте
+    h = solution.y[0]
+    i_max = np.argmax(h >= h.max() - 1e-2)
+    above = solution.y[2] >= V1(h[i_max])
+    # первая космическая не достигнута: вся траектория считается активным участком
+    return int(np.argmax(above)) if above.any() else solution.y.shape[1]
     
 
 
@@ -131,8 +603,12 @@ def find_geecentrical_coords(
 
 
 def earth(
+    extent: float = 2 * r0,
+    pixels: int = 1200
 )-> tuple[float, float]:
-    angle = np.linspace(0, 2 * np.pi, 100000)
+    # число точек окружности по масштабу: отклонение хорды от дуги меньше пикселя extent / pixels
+    n = int(np.clip(np.ceil(np.pi * np.sqrt(r0 * pixels / extent)), 256, 100000))
+    angle = np.linspace(0, 2 * np.pi, n)
     x = r0 * np.cos(angle)
     y = r0 * np.sin(angle)
     return (x, y)
@@ -140,8 +616,19 @@ def earth(
 
 def plot_portrait(
     solution,
+    path: str = None,
+    n_buckets: int = 600
 ) -> None:
+    # matplotlib импортируется только при построении графиков; при заданном path рисунок пишется в файл
+    import matplotlib.pyplot as plt
+
     active = find_active_idx(solution)
+    # прореживание до ~n_buckets корзин на ось с сохранением экстремумов и точек переключений
+    keep = get_event_indices(solution.t, [t for t, _ in getattr(solution, "switches", None) or []])
+    ids = decimate(solution.t[:active], [solution.y[0][:active], solution.y[2][:active], solution.y[3][:active]],
+                   n_buckets, keep[keep < active])
+    solution = SimpleNamespace(t=solution.t[ids], y=solution.y[:, ids])
+    active = len(ids)
 
     fig = plt.figure(figsize=(12,12))
 
@@ -173,32 +660,59 @@ def plot_portrait(
     ax4.set_title("Зависимость скорости от высоты")
     ax4.grid(True)
 
-    plt.show()
+    show(fig, path)
 
 
 def plot_trajectory_geocentrical(
     x: npt.NDArray,
     y: npt. NDArray,
-    idx: int
+    idx: int,
+    path: str = None,
+    keep: npt.ArrayLike = None,
+    n_buckets: int = 1200
 )-> None:
+    import matplotlib.pyplot as plt
+
+    # граница активного участка и точки событий сохраняются при прореживании
+    keep = np.append([] if keep is None else keep, [idx - 1, idx]).astype(int)
+    ids = decimate(np.arange(len(x)), [x, y], n_buckets, keep)
+    idx = np.searchsorted(ids, idx)
+    x = x[ids]
+    y = y[ids]
+    extent = max(np.ptp(x), np.ptp(y), 2 * r0)
+
     fig = plt.figure(figsize=(12,12))
 
     ax1 = fig.add_subplot(1, 1, 1)
     ax1.plot(x[:idx], y[:idx], color='r', label="Активный участок траектории")
     ax1.plot(x[idx:], y[idx:], color='g', label="Пассивный участок траеткори")
-    ax1.plot(*earth(), color='b', linestyle="--", label="Планета Земля")
+    ax1.plot(*earth(extent, int(fig.get_figwidth() * fig.dpi)), color='b', linestyle="--", label="Планета Земля")
     ax1.set_xlabel('x')
     ax1.set_ylabel('y')
     ax1.set_title("Траектория полета")
     ax1.legend()
     ax1.grid(True)
 
-    plt.show()
+    show(fig, path)
+
+
+def show(
+    fig,
+    path: str = None
+)-> None:
+    import matplotlib.pyplot as plt
+
+    if path is None:
+        plt.show()
+    else:
+        fig.savefig(path)
+        plt.close(fig)
 
 
 if __name__ == "__main__":
-    st1 = StageOne()
-    st2 = StageTwo()
+    warnings.filterwarnings("error")
+    st1 = get_stage_one()
+    st2 = get_stage_two()
     rocket = Rocket(stage_one=st1, stage_two=st2)
     atmosphere = Atmosphere()
 
@@ -215,4 +729,4 @@ if __name__ == "__main__":
     x, y = find_geecentrical_coords(solution.y[0], solution.y[1])
     idx = find_active_idx(solution)
     plot_trajectory_geocentrical(x, y, idx)
-    
\ No newline at end of file
+    
\ No newline at end of file
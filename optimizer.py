@@ -0,0 +1,312 @@
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+import numpy.typing as npt
+
+from atmosphere import Atmosphere
+from rocket import Rocket
+from guidance import Guidance, GUIDANCE
+from analytics import get_orbit
+from dispersion import FAILURES
+
+
+# параметры программы тангажа и их допустимые диапазоны
+BOUNDS = {
+    "t1": (28., 40.),
+    "arc_time": (170., 240.),
+    "arc_offset": (1.05, 1.3),
+    "exp_rate": (0.5, 0.9),
+    "exp_time": (90., 130.),
+    "t3_fraction": (0.05, 0.5),
+}
+
+PARAMS = ("t1", "arc_time", "arc_offset", "exp_rate", "t3_fraction")
+
+OBJECTIVES = ("accuracy", "payload")
+
+# значение целевой функции для неудачных и недопустимых программ
+PENALTY = 1e9
+
+
+class Evaluation(NamedTuple):
+    error: float # отклонение апоцентра и перицентра от высоты целевой орбиты, м
+    margin: float # остаток топлива в момент выхода на круговую скорость, кг
+    apoapsis: float
+    periapsis: float
+    failure: int
+    elapsed: float
+
+
+def is_feasible(
+    guidance: Guidance,
+    rt: Rocket
+)-> bool:
+    # подкоренные выражения законов ветвей 1 и 2 положительны на всем участке
+    t1 = guidance.t1
+    t2 = guidance.get_t2(rt)
+    a = guidance.arc_time
+    if not (t1 / a - guidance.arc_offset > -1 and t2 / a - guidance.arc_offset < 1):
+        return False
+    return 2500 * np.exp(2 * t2 / guidance.exp_time) > guidance.exp_c
+
+
+def evaluate(
+    rt: Rocket,
+    atm: Atmosphere,
+    guidance: Guidance,
+    t_span: tuple[float, float],
+    options: dict
+)-> Evaluation:
+    from main import solver
+
+    if not is_feasible(guidance, rt):
+        return Evaluation(np.inf, 0., np.nan, np.nan, FAILURES.index("error"), 0.)
+
+    start = time.perf_counter()
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            tr = solver(rt, atm, t_span, segmented=True, dense=True, guidance=guidance, **options)
+    except KeyboardInterrupt as e:
+        reason = "crash" if e.args and e.args[0].startswith("Negative H") else "error"
+        return Evaluation(np.inf, 0., np.nan, np.nan, FAILURES.index(reason), time.perf_counter() - start)
+    except (ArithmeticError, ValueError, RuntimeWarning):
+        return Evaluation(np.inf, 0., np.nan, np.nan, FAILURES.index("error"), time.perf_counter() - start)
+    elapsed = time.perf_counter() - start
+    if tr.status < 0:
+        return Evaluation(np.inf, 0., np.nan, np.nan, FAILURES.index("solver"), elapsed)
+
+    h, _, v, tetha, _ = tr(t_span[1])
+    orbit = get_orbit(h, v, tetha)
+    h_t = guidance.h_target
+    error = float(np.hypot(orbit.apoapsis - h_t, orbit.periapsis - h_t))
+
+    # без выключения по условию v > V1(h) + 5 топливо израсходовано до выхода на орбиту
+    margin = 0.
+    for ts, name in tr.switches:
+        if name == "cutoff":
+            margin = float(rt.get_current_total_m(float(tr(ts)[4])) - rt.get_current_total_m(rt.engine_time))
+            break
+    failure = 0 if orbit.periapsis > 0 else FAILURES.index("suborbital")
+    return Evaluation(error, margin, float(orbit.apoapsis), float(orbit.periapsis), failure, elapsed)
+
+
+# контекст процесса пула: ракета, атмосфера и настройки передаются один раз при запуске процесса
+_context = None
+
+
+def init_worker(
+    rt: Rocket,
+    atm: Atmosphere,
+    t_span: tuple[float, float],
+    options: dict
+)-> None:
+    global _context
+    _context = (rt, atm, t_span, options)
+
+
+def evaluate_remote(
+    guidance: Guidance
+)-> Evaluation:
+    rt, atm, t_span, options = _context
+    return evaluate(rt, atm, guidance, t_span, options)
+
+
+class PitchOptimizer:
+    # целевая функция над вектором параметров PARAMS с кешем по значению параметров;
+    # наборы точек (популяция, симплекс) считаются параллельно в пуле процессов
+
+    def __init__(
+        self,
+        rt: Rocket,
+        atm: Atmosphere,
+        t_span: tuple[float, float] = (0., 2000.),
+        names: tuple[str, ...] = PARAMS,
+        bounds: dict = None,
+        base: Guidance = GUIDANCE,
+        objective: str = "accuracy",
+        weight: float = 10.,
+        workers: int = None,
+        **options
+    )-> None:
+        if objective not in OBJECTIVES:
+            raise ValueError(f"unknown objective {objective}, expected one of {OBJECTIVES}")
+        self.rt = rt
+        self.atm = atm
+        self.t_span = t_span
+        self.names = names
+        bounds = BOUNDS if bounds is None else bounds
+        self.bounds = [bounds[name] for name in names]
+        self.base = base
+        self.objective = objective
+        # штраф за ошибку выведения при максимизации остатка топлива, кг/км
+        self.weight = weight
+        self.workers = os.cpu_count() if workers is None else workers
+        self.options = options
+        self.cache = {}
+        self.pool = None
+        self.nrequests = 0
+        self.serial_time = 0.
+        self.batch_time = 0.
+
+
+    def __enter__(
+        self
+    )-> "PitchOptimizer":
+        if self.workers > 1:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                            initargs=(self.rt, self.atm, self.t_span, self.options))
+        return self
+
+
+    def __exit__(
+        self,
+        *exc
+    )-> None:
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+    def get_guidance(
+        self,
+        x: npt.ArrayLike
+    )-> Guidance:
+        return self.base._replace(**{name: float(val) for name, val in zip(self.names, x)})
+
+
+    def get_value(
+        self,
+        ev: Evaluation
+    )-> float:
+        # суборбитальные программы не штрафуются отдельно: ошибка выведения остается непрерывной
+        if not np.isfinite(ev.error):
+            return PENALTY
+        if self.objective == "accuracy":
+            return ev.error
+        return - ev.margin + self.weight * ev.error / 1000
+
+
+    def evaluate_many(
+        self,
+        xs: list[npt.ArrayLike]
+    )-> list[Evaluation]:
+        # повторные точки берутся из кеша, новые без повторов считаются одним пакетом
+        guidances = [self.get_guidance(x) for x in xs]
+        missing = list(dict.fromkeys(gd for gd in guidances if gd not in self.cache))
+        start = time.perf_counter()
+        if self.pool is not None and len(missing) > 1:
+            chunksize = max(1, len(missing) // (4 * self.workers))
+            evs = list(self.pool.map(evaluate_remote, missing, chunksize=chunksize))
+        else:
+            evs = [evaluate(self.rt, self.atm, gd, self.t_span, self.options) for gd in missing]
+        self.batch_time += time.perf_counter() - start
+        self.cache.update(zip(missing, evs))
+
+        res = [self.cache[gd] for gd in guidances]
+        self.nrequests += len(res)
+        self.serial_time += sum(ev.elapsed for ev in res)
+        return res
+
+
+    def __call__(
+        self,
+        x: npt.ArrayLike
+    )-> float:
+        return self.get_value(self.evaluate_many([x])[0])
+
+
+    def map(
+        self,
+        func,
+        xs
+    )-> list[float]:
+        # замена map для scipy.optimize (workers=...): func - обертка над self.__call__
+        return [self.get_value(ev) for ev in self.evaluate_many(list(xs))]
+
+
+    @property
+    def nsolves(
+        self
+    )-> int:
+        return sum(1 for ev in self.cache.values() if ev.elapsed > 0.)
+
+
+    def report(
+        self
+    )-> dict:
+        solve_time = sum(ev.elapsed for ev in self.cache.values())
+        return {
+            "requests": self.nrequests,
+            "solves": self.nsolves,
+            "cache_hits": self.nrequests - len(self.cache),
+            "workers": self.workers,
+            "solve_time": solve_time,
+            "batch_time": self.batch_time,
+            # время последовательного расчета каждой запрошенной точки без кеша и пула
+            "serial_time": self.serial_time,
+            "speedup": self.serial_time / self.batch_time if self.batch_time > 0. else np.nan,
+            "parallel_speedup": solve_time / self.batch_time if self.batch_time > 0. else np.nan,
+        }
+
+
+def optimize(
+    rt: Rocket,
+    atm: Atmosphere,
+    t_span: tuple[float, float] = (0., 2000.),
+    names: tuple[str, ...] = PARAMS,
+    objective: str = "accuracy",
+    maxiter: int = 20,
+    popsize: int = 8,
+    seed: int = 0,
+    polish: bool = True,
+    workers: int = None,
+    **options
+)-> dict:
+    # глобальный поиск дифференциальной эволюцией (поколение - один пакет), затем уточнение Нелдером-Мидом
+    from scipy.optimize import differential_evolution, minimize
+
+    start = time.perf_counter()
+    with PitchOptimizer(rt, atm, t_span, names, objective=objective, workers=workers, **options) as opt:
+        x0 = [getattr(opt.base, name) for name in names]
+        res = differential_evolution(opt, opt.bounds, maxiter=maxiter, popsize=popsize, seed=seed, x0=x0,
+                                     workers=opt.map, updating="deferred", polish=False, init="sobol")
+        x = res.x
+        if polish:
+            local = minimize(opt, x, method="Nelder-Mead", bounds=opt.bounds,
+                             options={"maxfev": 40 * len(names), "xatol": 1e-3, "fatol": 1e-2})
+            if local.fun < res.fun:
+                x = local.x
+        guidance = opt.get_guidance(x)
+        ev = opt.evaluate_many([x])[0]
+        report = opt.report()
+
+    report.update(
+        guidance=guidance,
+        value=opt.get_value(ev),
+        evaluation=ev,
+        elapsed=time.perf_counter() - start,
+    )
+    return report
+
+
+if __name__ == "__main__":
+    rt = Rocket()
+    atm = Atmosphere(fast=True)
+
+    ev = evaluate(rt, atm, GUIDANCE, (0., 2000.), {})
+    print("initial:", ev)
+    elapsed = {}
+    for workers in (1, max(2, os.cpu_count())):
+        report = optimize(rt, atm, maxiter=5, workers=workers)
+        elapsed[workers] = report["elapsed"]
+        print(f"workers = {workers}: solves = {report['solves']}, requests = {report['requests']}, "
+              f"cache hits = {report['cache_hits']}, "
+              f"time = {report['elapsed']:.2f} s, speedup vs serial = {report['speedup']:.2f} "
+              f"(parallel {report['parallel_speedup']:.2f}), measured = {elapsed[1] / elapsed[workers]:.2f}")
+    print(report["guidance"])
+    print(report["evaluation"])
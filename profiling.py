@@ -0,0 +1,240 @@
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import numpy as np
+import scipy.integrate as integrate
+
+import integrators
+
+
+# компоненты правой части: методы экземпляров и функции модуля main
+ATMOSPHERE_METHODS = ("get_flow_vals", "get_state")
+AERO_METHODS = ("get_aero_cf",)
+MASS_METHODS = ("get_current_total_m", "get_thirst_vals", "get_stage", "get_stage_m", "get_stage_thirst_vals")
+FORCES_FUNCS = ("g", "aerodynamic_force", "thirst_force")
+RHS_FUNCS = ("func", "func_phase")
+COMPONENTS = ("atmosphere", "aero", "mass", "forces")
+
+# подмена имен модуля main и методов экземпляров видна всему процессу: профилируемые расчеты выполняются
+# по одному, а обертки в других потоках сразу вызывают исходные функции без учета
+_instrument_lock = threading.Lock()
+
+
+class Profile:
+    # счетчики и таймеры подключаются подменой функций только на время вызова solver(..., profile=Profile());
+    # учитываются только вызовы из потока, запустившего расчет (owner)
+
+    def __init__(
+        self
+    )-> None:
+        self.times = dict.fromkeys(("total", "rhs") + COMPONENTS, 0.)
+        self.nfev = 0
+        self.naccepted = 0
+        self.nrejected = 0
+        self.rejected_known = True
+        self.n_solves = 0
+        self.evals_by_branch = {}
+        self.branch_at = {}
+        self.steps = []
+        self.owner = None
+
+
+    def timed(
+        self,
+        fn,
+        key: str
+    ):
+        times = self.times
+        perf_counter = time.perf_counter
+        get_ident = threading.get_ident
+
+        def wrapper(*args, **kwargs):
+            if get_ident() != self.owner:
+                return fn(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                times[key] += perf_counter() - start
+        return wrapper
+
+
+    def counted_rhs(
+        self,
+        fn
+    ):
+        timed = self.timed(fn, "rhs")
+        get_ident = threading.get_ident
+
+        def wrapper(*args, **kwargs):
+            if get_ident() != self.owner:
+                return fn(*args, **kwargs)
+            self.nfev += 1
+            return timed(*args, **kwargs)
+        return wrapper
+
+
+    def counted_branch(
+        self,
+        fn
+    ):
+        # ветвь тангажа запоминается по моменту вычисления: по ней классифицируются принятые шаги
+        evals = self.evals_by_branch
+        branch_at = self.branch_at
+        get_ident = threading.get_ident
+
+        def wrapper(branch, t, *args, **kwargs):
+            if get_ident() != self.owner:
+                return fn(branch, t, *args, **kwargs)
+            evals[branch] = evals.get(branch, 0) + 1
+            branch_at[t] = branch
+            return fn(branch, t, *args, **kwargs)
+        return wrapper
+
+
+    def get_method(
+        self,
+        method
+    ):
+        # наследник метода scipy, считающий принятые шаги и отброшенные попытки
+        base = getattr(integrate, method) if isinstance(method, str) else method
+        profile = self
+
+        class Profiled(base):
+            def _step_impl(self):
+                before = self.nfev
+                res = super()._step_impl()
+                if res[0]:
+                    profile.naccepted += 1
+                    profile.steps.append(self.t)
+                    n_stages = getattr(self, "n_stages", None)
+                    if n_stages is None:
+                        profile.rejected_known = False
+                    else:
+                        profile.nrejected += (self.nfev - before) // n_stages - 1
+                return res
+
+        Profiled.__name__ = "Profiled" + base.__name__
+        return Profiled
+
+
+    def solve_ivp(
+        self,
+        fun,
+        *args,
+        method = "RK45",
+        **kwargs
+    ):
+        if threading.get_ident() != self.owner:
+            return integrate.solve_ivp(fun, *args, method=method, **kwargs)
+        self.n_solves += 1
+        return integrate.solve_ivp(fun, *args, method=self.get_method(method), **kwargs)
+
+
+    def solve(
+        self,
+        fun,
+        *args,
+        **kwargs
+    ):
+        if threading.get_ident() != self.owner:
+            return integrators.solve(fun, *args, **kwargs)
+        self.n_solves += 1
+        sol = integrators.solve(fun, *args, **kwargs)
+        self.naccepted += sol.naccepted
+        self.nrejected += sol.nrejected
+        self.steps.extend(sol.t[1:].tolist())
+        return sol
+
+
+    @contextmanager
+    def instrument(
+        self,
+        module,
+        rt,
+        atm
+    ):
+        # module - модуль с solver (main), его глобальные имена подменяются и затем восстанавливаются;
+        # профилируемый расчет из другого потока ждет окончания текущего
+        with _instrument_lock:
+            patched = {}
+            for name in RHS_FUNCS:
+                patched[name] = self.counted_rhs(getattr(module, name))
+            for name in FORCES_FUNCS:
+                patched[name] = self.timed(getattr(module, name), "forces")
+            patched["get_dot_tetha"] = self.counted_branch(module.get_dot_tetha)
+            patched["integrate"] = SimpleNamespace(solve_ivp=self.solve_ivp)
+            patched["integrators"] = SimpleNamespace(solve=self.solve)
+
+            methods = []
+            for obj, names, key in ((atm, ATMOSPHERE_METHODS, "atmosphere"), (rt, AERO_METHODS, "aero"),
+                                    (rt, MASS_METHODS, "mass")):
+                for name in names:
+                    methods.append((obj, name, self.timed(getattr(obj, name), key)))
+
+            saved = {name: getattr(module, name) for name in patched}
+            self.owner = threading.get_ident()
+            start = time.perf_counter()
+            try:
+                for name, fn in patched.items():
+                    setattr(module, name, fn)
+                for obj, name, fn in methods:
+                    obj.__dict__[name] = fn
+                yield self
+            finally:
+                for name, fn in saved.items():
+                    setattr(module, name, fn)
+                for obj, name, _ in methods:
+                    obj.__dict__.pop(name, None)
+                self.times["total"] += time.perf_counter() - start
+                self.owner = None
+
+
+    def get_steps_by_branch(
+        self
+    )-> dict[int, int]:
+        # ветвь шага - ветвь ближайшего по времени вычисления правой части (последняя стадия шага)
+        if not self.steps or not self.branch_at:
+            return {}
+        t_ev = np.array(sorted(self.branch_at))
+        b_ev = np.array([self.branch_at[t] for t in t_ev])
+        t = np.array(self.steps)
+        idx = np.clip(np.searchsorted(t_ev, t), 1, len(t_ev) - 1)
+        idx -= np.abs(t - t_ev[idx - 1]) < np.abs(t_ev[idx] - t)
+        branches, counts = np.unique(b_ev[idx], return_counts=True)
+        return {int(b): int(c) for b, c in zip(branches, counts)}
+
+
+    def report(
+        self
+    )-> dict:
+        times = dict(self.times)
+        times["rhs_other"] = times["rhs"] - sum(times[key] for key in COMPONENTS)
+        times["integrator"] = times["total"] - times["rhs"]
+        return {
+            "nfev": self.nfev,
+            "naccepted": self.naccepted,
+            "nrejected": self.nrejected if self.rejected_known else None,
+            "n_solves": self.n_solves,
+            "evals_by_branch": {int(b): c for b, c in sorted(self.evals_by_branch.items())},
+            "steps_by_branch": self.get_steps_by_branch(),
+            "time": times,
+        }
+
+
+def format_report(
+    report: dict
+)-> str:
+    times = report["time"]
+    total = times["total"]
+    lines = [
+        f"nfev = {report['nfev']}, accepted = {report['naccepted']}, rejected = {report['nrejected']}, "
+        f"solves = {report['n_solves']}",
+        f"evals by branch: {report['evals_by_branch']}",
+        f"steps by branch: {report['steps_by_branch']}",
+    ]
+    for key in ("total", "integrator", "rhs") + COMPONENTS + ("rhs_other",):
+        lines.append(f"{key:12s} {times[key]:10.4f} s {100 * times[key] / total if total else 0.:6.1f} %")
+    return "\n".join(lines)
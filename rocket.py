@@ -1,23 +1,27 @@
+import bisect
+from typing import NamedTuple
 
-class StageOne:
-    m = 42000 #kg
+import numpy as np
+import numpy.typing as npt
 
 
-    def __init__(
-        self,
-        fuel_m = None
-    ) -> None:
-        
-        if fuel_m is None:
-            self.fuel_m = 399400 #kg
-        else:
-            self.fuel_m = fuel_m
 
-        self.dot_m = 8 * 346.68 #kg/s
-        self.v_a = 2729.388 # m/s
-        self.F_a = 8 * 0.98 #m^2
-        self.p_a = 4.36 * (10 ** 6) / 69.567
-        self.engine_time = self.fuel_m / self.dot_m
+class Stage(NamedTuple):
+    # ступень или связка боковых блоков: неизменяемая запись без словаря атрибутов
+    m: float # сухая масса, кг
+    fuel_m: float # кг
+    dot_m: float # кг/с
+    v_a: float # м/с
+    F_a: float # м^2
+    p_a: float
+    name: str = None
+
+
+    @property
+    def engine_time(
+        self
+    )-> float:
+        return self.fuel_m / self.dot_m
 
 
     def get_current_total_m(
@@ -25,44 +29,63 @@ class StageOne:
         t: float
     ):
         return self.m + self.fuel_m - self.dot_m * t
-    
+
 
     def get_thirst_vals(
         self
     ):
         return (self.dot_m, self.v_a, self.F_a, self.p_a)
-        
 
-class StageTwo:
-    m = 10600 #kg
 
-    def __init__(
-        self,
-        fuel_m = None
-    ) -> None:
-        if fuel_m is None:
-            self.fuel_m = 103600 #kg
-        else:
-            self.fuel_m = fuel_m
+def get_stage_one(
+    fuel_m = None,
+    dot_m = None,
+    v_a = None
+)-> Stage:
+    # первая ступень базовой ракеты
+    return Stage(
+        m=42000, #kg
+        fuel_m=399400 if fuel_m is None else fuel_m, #kg
+        dot_m=8 * 346.68 if dot_m is None else dot_m, #kg/s
+        v_a=2729.388 if v_a is None else v_a, # m/s
+        F_a=8 * 0.98, #m^2
+        p_a=4.36 * (10 ** 6) / 69.567,
+        name="stage_one",
+    )
 
-        self.dot_m = 246.45 #kg/s
-        self.v_a = 3974.22 # m/s
-        self.F_a = 2.01 #m^2
-        self.p_a = 5.366 * (10 ** 6) / 279.233
-        self.engine_time = self.fuel_m / self.dot_m
 
+def get_stage_two(
+    fuel_m = None,
+    dot_m = None,
+    v_a = None
+)-> Stage:
+    # вторая ступень базовой ракеты
+    return Stage(
+        m=10600, #kg
+        fuel_m=103600 if fuel_m is None else fuel_m, #kg
+        dot_m=246.45 if dot_m is None else dot_m, #kg/s
+        v_a=3974.22 if v_a is None else v_a, # m/s
+        F_a=2.01, #m^2
+        p_a=5.366 * (10 ** 6) / 279.233,
+        name="stage_two",
+    )
 
-    def get_current_total_m(
-        self,
-        t: float
-    ):
-        return self.m + self.fuel_m - self.dot_m * t
 
+# прежние имена фабрик ступеней, оставлены для совместимости
+StageOne = get_stage_one
+StageTwo = get_stage_two
 
-    def get_thirst_vals(
-        self
-    ):
-        return (self.dot_m, self.v_a, self.F_a, self.p_a)
+
+class BurnTimeline(NamedTuple):
+    # участки работы ступеней по накопленному времени работы двигателей;
+    # последний участок - после выгорания топлива, без тяги и расхода
+    t_start: npt.NDArray
+    t_end: npt.NDArray
+    m_start: npt.NDArray
+    dot_m: npt.NDArray
+    v_a: npt.NDArray
+    F_a: npt.NDArray
+    p_a: npt.NDArray
 
 
 class Rocket: 
@@ -206,90 +229,255 @@ class Rocket:
             60:0.4492
         },
     }
-    mach_table = [0.1, 0.3, 0.5, 0.7, 0.8, 0.9, 1.0, 1.1, 1.3, 1.5, 2.0, 3.0, 3.5, 4.0, 4.5, 5.0]
-    h_table = [0, 10, 20, 30, 40, 60]
+    mach_table = [0.1, 0.3, 0.5, 0.7, 0.8, 0.9, 1.0, 1.1, 1.3, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0]
+    h_table = [0, 10, 20, 30, 40, 60] #km
+
+    # сетка Cx[mach, h] для билинейной интерполяции, высота в метрах
+    Cx_grid = np.array([list(row.values()) for row in Cx.values()])
+    mach_grid = np.array(mach_table)
+    h_grid = np.array(h_table) * 1000.
+    _Cx = Cx_grid.tolist()
+    _mach = mach_grid.tolist()
+    _h = h_grid.tolist()
     
     def __init__(
         self,
-        stage_one: StageOne = None,
-        stage_two: StageTwo = None,
+        stage_one: Stage = None,
+        stage_two: Stage = None,
         payload: bool = False,
+        cx_scale: float = 1.,
+        stages: list[Stage] = None,
+        boosters: list[tuple[int, Stage]] = (),
+        payload_m: float = None,
+        m: float = None,
+        S: float = None
     )-> None:
-        if stage_one is None:
-            stage_one = StageOne()
-        if stage_two is None:
-            stage_two = StageTwo()
-        if payload:
+        # stages - ступени в порядке работы; boosters - пары (номер ступени, боковые блоки),
+        # блоки запускаются вместе со своей ступенью
+        if stages is None:
+            stages = (get_stage_one() if stage_one is None else stage_one,
+                      get_stage_two() if stage_two is None else stage_two)
+        elif stage_one is not None or stage_two is not None:
+            raise ValueError("stages cannot be combined with stage_one and stage_two")
+        if not stages:
+            raise ValueError("vehicle has no stages")
+        for k, _ in boosters:
+            if not 0 <= k < len(stages):
+                raise ValueError(f"booster attached to missing stage {k}")
+        if payload_m is not None:
+            self.payload_m = payload_m
+        elif payload:
             self.payload_m = 21000 #kg
         else:
             self.payload_m = 0
-        self.stage_one = stage_one
-        self.stage_two = stage_two
-        self.engine_time = self.stage_one.engine_time + self.stage_two.engine_time
-        self.is_active = True
-        self.inactive_time = 0.
+        if m is not None:
+            self.m = m
+        if S is not None:
+            self.S = S
+        self.stages = tuple(stages)
+        self.boosters = tuple(boosters)
+        self.cx_scale = cx_scale
+        self.timeline = self.get_timeline()
+        self.engine_time = float(self.timeline.t_start[-1])
+        # число участков работы двигателей; участок с номером nburns - полет без тяги
+        self.nburns = len(self.timeline.t_end) - 1
+        # списки для скалярного поиска через bisect
+        self._t_end = self.timeline.t_end[:-1].tolist()
+        self._m_start = self.timeline.m_start.tolist()
+        self._t_start = self.timeline.t_start.tolist()
+        self._dot_m = self.timeline.dot_m.tolist()
+        self._thirst_vals = list(zip(*(col.tolist() for col in self.timeline[3:])))
+
+
+    @property
+    def stage_one(
+        self
+    )-> Stage:
+        return self.stages[0]
+
+
+    @property
+    def stage_two(
+        self
+    )-> Stage:
+        return self.stages[1]
+
+
+    def get_timeline(
+        self
+    )-> BurnTimeline:
+        # ступени работают последовательно, боковые блоки - вместе со своей ступенью;
+        # блок сбрасывается при выгорании топлива, участки разделены моментами запуска и выгорания блоков
+        t_ignition = [0.]
+        for st in self.stages[:-1]:
+            t_ignition.append(t_ignition[-1] + st.engine_time)
+        blocks = []
+        for k, st in enumerate(self.stages):
+            blocks.append((t_ignition[k], st))
+            blocks.extend((t_ignition[k], bst) for j, bst in self.boosters if j == k)
+        times = sorted({t for t0, st in blocks for t in (t0, t0 + st.engine_time)})
+
+        m_end = self.payload_m + self.m
+        # строки участков: t_start, t_end, m_start, dot_m, v_a, F_a, p_a
+        cols = []
+        for t_start, t_end in zip(times[:-1], times[1:]):
+            m_start = m_end
+            active = []
+            for t0, st in blocks:
+                if t0 + st.engine_time <= t_start:
+                    continue
+                m_start += st.m
+                m_start += st.fuel_m if t_start <= t0 else st.fuel_m - st.dot_m * (t_start - t0)
+                if t0 <= t_start:
+                    active.append(st)
+            if len(active) == 1:
+                vals = active[0].get_thirst_vals()
+            else:
+                # параллельная работа: сумма тяг dot_m v_a + F_a (p_a - p) в виде тяги одного двигателя
+                dot_m = sum(st.dot_m for st in active)
+                F_a = sum(st.F_a for st in active)
+                vals = (dot_m, sum(st.dot_m * st.v_a for st in active) / dot_m, F_a,
+                        sum(st.F_a * st.p_a for st in active) / F_a if F_a > 0. else 0.)
+            cols.append([t_start, t_end, m_start, *vals])
+        cols.append([times[-1], np.inf, m_end, 0., 0., 0., 0.])
+        arrays = []
+        for col in zip(*cols):
+            arr = np.array(col, dtype=float)
+            arr.flags.writeable = False
+            arrays.append(arr)
+        return BurnTimeline(*arrays)
+
+
+    def get_segment(
+        self,
+        t: npt.ArrayLike,
+        right: bool = False
+    ):
+        # номер участка: при right=False граница относится к предыдущему участку (t <= t_end)
+        if not isinstance(t, np.ndarray):
+            return (bisect.bisect_right if right else bisect.bisect_left)(self._t_end, t)
+        return np.searchsorted(self.timeline.t_end[:-1], t, side="right" if right else "left")
     
 
     def get_current_total_m(
         self,
-        t: float
-    )-> float:
-        if self.inactive_time < 0.:
-            t = -self.inactive_time
-        else:
-            t -= self.inactive_time
-
-        if t <= self.stage_one.engine_time:
-            fsm = self.stage_one.get_current_total_m(t)
-            ssm = self.stage_two.m + self.stage_two.fuel_m
-        elif t <= self.engine_time:
-            fsm = 0
-            ssm = self.stage_two.get_current_total_m(t - self.stage_one.engine_time)
-        else:
-            fsm = 0
-            ssm = 0
+        t: npt.ArrayLike
+    )-> float | npt.NDArray:
+        # t - время работы двигателей, а не полетное время
+        if not isinstance(t, np.ndarray):
+            k = bisect.bisect_left(self._t_end, t)
+            return self._m_start[k] - self._dot_m[k] * (t - self._t_start[k])
+        k = self.get_segment(t)
+        tl = self.timeline
+        return tl.m_start[k] - tl.dot_m[k] * (t - tl.t_start[k])
+
+
+    def get_stage(
+        self,
+        t: npt.ArrayLike
+    )-> int | npt.NDArray:
+        return self.get_segment(t, right=True)
+
 
-        return self.payload_m + self.m + fsm + ssm
+    def get_stage_m(
+        self,
+        stage: int,
+        t: npt.ArrayLike
+    )-> float | npt.NDArray:
+        # масса на участке работы ступени stage, продолженная гладко за его границы
+        return self._m_start[stage] - self._dot_m[stage] * (t - self._t_start[stage])
+
+
+    def get_stage_thirst_vals(
+        self,
+        stage: int
+    )-> tuple[float, float, float, float]:
+        return self._thirst_vals[stage]
     
 
     def get_aero_cf(
         self,
         mach: float,
-        h
+        h: float
     )-> float:
-        buffer = []
-        dmax = 1e+15
-        for i in self.h_table:
-            s = abs(h-i)
-            if s < dmax:
-                dmax = s
-                table_h = i
-
-        for i in range(len(self.mach_table) - 1):
-            buffer.append((self.Cx[self.mach_table[i+1]][table_h] - self.Cx[self.mach_table[i]][table_h])/((self.mach_table[i+1] - self.mach_table[i]) * 1000))
-        buffer.append(buffer[-1])
-        for i in range(len(self.mach_table) - 1):
-            if (self.mach_table[i] <= mach and mach < self.mach_table[i+1]):
-                return self.Cx[self.mach_table[i]][table_h] + buffer[i] * (mach - self.mach_table[i])
-        return self.Cx[self.mach_table[-1]][table_h]
+        mt = self._mach
+        ht = self._h
+        x = min(max(mach, mt[0]), mt[-1])
+        y = min(max(h, ht[0]), ht[-1])
+        i = min(bisect.bisect_right(mt, x), len(mt) - 1) - 1
+        j = min(bisect.bisect_right(ht, y), len(ht) - 1) - 1
+        tx = (x - mt[i]) / (mt[i+1] - mt[i])
+        ty = (y - ht[j]) / (ht[j+1] - ht[j])
+        c0 = self._Cx[i]
+        c1 = self._Cx[i+1]
+        return self.cx_scale * ((1 - tx) * (c0[j] + ty * (c0[j+1] - c0[j])) +
+                                tx * (c1[j] + ty * (c1[j+1] - c1[j])))
+
+
+    def get_aero_cf_grad(
+        self,
+        mach: float,
+        h: float
+    )-> tuple[float, float, float]:
+        # Cx и производные билинейной интерполяции по числу Маха и высоте (вне таблицы - нулевые)
+        mt = self._mach
+        ht = self._h
+        x = min(max(mach, mt[0]), mt[-1])
+        y = min(max(h, ht[0]), ht[-1])
+        i = min(bisect.bisect_right(mt, x), len(mt) - 1) - 1
+        j = min(bisect.bisect_right(ht, y), len(ht) - 1) - 1
+        wx = mt[i+1] - mt[i]
+        wy = ht[j+1] - ht[j]
+        tx = (x - mt[i]) / wx
+        ty = (y - ht[j]) / wy
+        c0 = self._Cx[i]
+        c1 = self._Cx[i+1]
+        a = c0[j] + ty * (c0[j+1] - c0[j])
+        b = c1[j] + ty * (c1[j+1] - c1[j])
+        dx = (b - a) / wx if mt[0] < mach < mt[-1] else 0.
+        dy = ((1 - tx) * (c0[j+1] - c0[j]) + tx * (c1[j+1] - c1[j])) / wy if ht[0] < h < ht[-1] else 0.
+        return (self.cx_scale * ((1 - tx) * a + tx * b), self.cx_scale * dx, self.cx_scale * dy)
+
+
+    def get_aero_cf_array(
+        self,
+        mach: npt.ArrayLike,
+        h: npt.ArrayLike
+    )-> npt.NDArray:
+        return self.cx_scale * self.get_base_cf_array(mach, h)
+
+
+    @classmethod
+    def get_base_cf_array(
+        cls,
+        mach: npt.ArrayLike,
+        h: npt.ArrayLike
+    )-> npt.NDArray:
+        mt = cls.mach_grid
+        ht = cls.h_grid
+        # np.minimum/np.maximum вместо np.clip: в ансамбле функция вызывается на каждой стадии шага
+        x = np.minimum(np.maximum(mach, mt[0]), mt[-1])
+        y = np.minimum(np.maximum(h, ht[0]), ht[-1])
+        i = np.minimum(np.searchsorted(mt, x, side="right") - 1, len(mt) - 2)
+        j = np.minimum(np.searchsorted(ht, y, side="right") - 1, len(ht) - 2)
+        tx = (x - mt[i]) / (mt[i+1] - mt[i])
+        ty = (y - ht[j]) / (ht[j+1] - ht[j])
+        c = cls.Cx_grid
+        return ((1 - tx) * (c[i, j] + ty * (c[i, j+1] - c[i, j])) +
+                tx * (c[i+1, j] + ty * (c[i+1, j+1] - c[i+1, j])))
 
     def get_thirst_vals(
         self, 
-        t: float
-    ) -> float:
-        
-        t -= self.inactive_time
-
-        if t < self.stage_one.engine_time and self.is_active:
-            return self.stage_one.get_thirst_vals()
-        elif t < self.engine_time and self.is_active: 
-            return self.stage_two.get_thirst_vals()
-        else: 
-            return (0, 0, 0, 0)
+        t: npt.ArrayLike
+    ) -> tuple[float, float, float, float]:
+        if not isinstance(t, np.ndarray):
+            return self._thirst_vals[bisect.bisect_right(self._t_end, t)]
+        k = self.get_segment(t, right=True)
+        return tuple(col[k] for col in self.timeline[3:])
         
 
 if __name__ == "__main__":
-    st = StageOne()
-    st2 = StageTwo()
+    st = get_stage_one()
+    st2 = get_stage_two()
     print(st.engine_time + st2.engine_time / 5)
-        
\ No newline at end of file
+        
\ No newline at end of file
@@ -0,0 +1,437 @@
+import numpy as np
+import numpy.typing as npt
+import scipy.integrate as integrate
+from scipy.optimize import OptimizeResult
+
+from atmosphere import Atmosphere
+from rocket import Rocket
+from guidance import Guidance, GUIDANCE
+from forces import (g, dg_dh, aerodynamic_force, aerodynamic_force_partials, thirst_force, thirst_force_partials,
+                    G, M, r0)
+
+
+VEHICLE_PARAMS = ("fuel_m_1", "fuel_m_2", "dot_m_1", "dot_m_2", "v_a_1", "v_a_2", "S", "cx_scale")
+
+PARAMS = VEHICLE_PARAMS + ("t1", "arc_time", "arc_offset", "exp_rate", "exp_time", "t3_fraction")
+
+def get_params(
+    rt: Rocket,
+    guidance: Guidance,
+    names: tuple[str, ...] = PARAMS
+)-> npt.NDArray:
+    vals = {
+        "fuel_m_1": rt.stage_one.fuel_m, "fuel_m_2": rt.stage_two.fuel_m,
+        "dot_m_1": rt.stage_one.dot_m, "dot_m_2": rt.stage_two.dot_m,
+        "v_a_1": rt.stage_one.v_a, "v_a_2": rt.stage_two.v_a,
+        "S": rt.S, "cx_scale": rt.cx_scale,
+    }
+    return np.array([vals[name] if name in vals else getattr(guidance, name) for name in names], dtype=float)
+
+
+def build(
+    rt: Rocket,
+    guidance: Guidance,
+    names: tuple[str, ...],
+    p: npt.ArrayLike
+)-> tuple[Rocket, Guidance]:
+    # ракета и программа тангажа с параметрами p, остальные значения берутся из rt и guidance
+    vals = dict(zip(names, map(float, p)))
+    st1 = rt.stage_one._replace(fuel_m=vals.get("fuel_m_1", rt.stage_one.fuel_m),
+                                dot_m=vals.get("dot_m_1", rt.stage_one.dot_m), v_a=vals.get("v_a_1", rt.stage_one.v_a))
+    st2 = rt.stage_two._replace(fuel_m=vals.get("fuel_m_2", rt.stage_two.fuel_m),
+                                dot_m=vals.get("dot_m_2", rt.stage_two.dot_m), v_a=vals.get("v_a_2", rt.stage_two.v_a))
+    res = Rocket(st1, st2, cx_scale=vals.get("cx_scale", rt.cx_scale), payload_m=rt.payload_m, m=rt.m,
+                 S=vals.get("S", rt.S))
+    guidance = guidance._replace(**{name: val for name, val in vals.items() if name in Guidance._fields})
+    return (res, guidance)
+
+
+class Sensitivity:
+    # правая часть func_phase вместе с производными по состоянию и параметрам;
+    # градиенты - строки длины 5 + len(names): сначала по (h, s, v, tetha, tau), затем по параметрам
+
+    def __init__(
+        self,
+        rt: Rocket,
+        atm: Atmosphere,
+        guidance: Guidance = GUIDANCE,
+        names: tuple[str, ...] = PARAMS
+    )-> None:
+        if len(rt.stages) != 2 or rt.boosters:
+            raise ValueError("sensitivities are derived for a two-stage vehicle without boosters")
+        self.rt = rt
+        self.atm = atm
+        self.guidance = guidance
+        self.names = names
+        self.n = 5 + len(names)
+        self.zero = np.zeros(self.n)
+        self.e = np.eye(self.n)
+        self.index = {name: 5 + k for k, name in enumerate(names)}
+
+        # постоянные части градиентов: моменты выгорания, смены ветвей, масса и тяга по ступеням
+        st1 = rt.stage_one
+        st2 = rt.stage_two
+        unit = self.unit
+        e = self.e
+        d1 = unit("fuel_m_1") / st1.dot_m - st1.fuel_m / st1.dot_m ** 2 * unit("dot_m_1")
+        d2 = unit("fuel_m_2") / st2.dot_m - st2.fuel_m / st2.dot_m ** 2 * unit("dot_m_2")
+        self.burnout_grads = (d1, d1 + d2)
+        self.switch_grads = (unit("t1"), d1, d1 + guidance.t3_fraction * d2 + st2.engine_time * unit("t3_fraction"))
+        # масса ступени stage: m = m_start - dot_m (tau - t_start), градиент dm = mass_grads[0] - tau mass_grads[1]
+        self.mass_grads = (
+            (unit("fuel_m_1") + unit("fuel_m_2") - st1.dot_m * e[4], unit("dot_m_1")),
+            (unit("fuel_m_2") + st1.engine_time * unit("dot_m_2") - st2.dot_m * (e[4] - d1), unit("dot_m_2")),
+            (self.zero, self.zero),
+        )
+        grads = []
+        for k, st in enumerate((st1, st2)):
+            F_dot_m, F_v_a = thirst_force_partials(*st.get_thirst_vals(), 0.)[:2]
+            grads.append(F_dot_m * unit(f"dot_m_{k + 1}") + F_v_a * unit(f"v_a_{k + 1}"))
+        self.thirst_grads = (*grads, self.zero)
+        self.cx_grad = unit("cx_scale") / rt.cx_scale
+        self.S_grad = unit("S")
+
+
+    def unit(
+        self,
+        name: str
+    )-> npt.NDArray:
+        # производная параметра по самому себе; параметры вне names считаются постоянными
+        return self.e[self.index[name]] if name in self.index else self.zero
+
+
+    def get_forces(
+        self,
+        vals: npt.NDArray,
+        stage: int
+    )-> tuple[tuple[float, npt.NDArray], tuple[float, npt.NDArray], tuple[float, npt.NDArray]]:
+        # масса, полная тяга ступени и сила сопротивления с градиентами
+        h = vals[0]
+        v = vals[2]
+        e = self.e
+        rt = self.rt
+        if h < 0.0:
+            raise KeyboardInterrupt("Negative H, error", h)
+
+        if h <= 1200000.:
+            P, rho, Vs, dP, drho, dVs = self.atm.get_flow_grad(h)
+            mach = v / Vs
+            Cx, Cx_mach, Cx_h = rt.get_aero_cf_grad(mach, h)
+            D = aerodynamic_force(Cx, rho, v, rt.S)
+            D_Cx, D_rho, D_v, D_S = aerodynamic_force_partials(Cx, rho, v, rt.S)
+            # Cx зависит от h через число Маха v / Vs(h) и напрямую
+            D_h = D_Cx * (Cx_h - Cx_mach * mach / Vs * dVs) + D_rho * drho
+            dD = D_h * e[0] + (D_v + D_Cx * Cx_mach / Vs) * e[2] + D_Cx * Cx * self.cx_grad + D_S * self.S_grad
+        else:
+            P = dP = D = 0.
+            dD = self.zero
+
+        tau = vals[4]
+        m = rt.get_stage_m(stage, tau)
+        grad_m, grad_dot_m = self.mass_grads[stage]
+        dm = grad_m - tau * grad_dot_m
+        vals_th = rt.get_stage_thirst_vals(stage)
+        F = thirst_force(*vals_th, P)
+        F_p = thirst_force_partials(*vals_th, P)[4]
+        dF = self.thirst_grads[stage] + F_p * dP * e[0]
+        return ((m, dm), (F, dF), (D, dD))
+
+
+    def get_throttle(
+        self,
+        vals: npt.NDArray,
+        m: tuple[float, npt.NDArray],
+        F: tuple[float, npt.NDArray],
+        D: tuple[float, npt.NDArray]
+    )-> tuple[float, npt.NDArray]:
+        # доля тяги скользящего режима (main.get_throttle) и ее градиент
+        h = vals[0]
+        v = vals[2]
+        tetha = vals[3]
+        (m, dm), (F, dF), (D, dD) = m, F, D
+        if F <= 0.:
+            return (0., self.zero)
+        e = self.e
+        r = r0 + h
+        sin = np.sin(tetha)
+        cos = np.cos(tetha)
+        V1 = np.sqrt(G * M / r)
+        W = V1 / (2 * r)
+        dot_V1 = - W * v * sin
+        d_dot_V1 = - (-3 * V1 / (4 * r ** 2) * v * sin * e[0] + W * sin * e[2] + W * v * cos * e[3])
+        gh = g(h)
+        N = m * (dot_V1 + gh * sin) + D
+        dN = dm * (dot_V1 + gh * sin) + m * (d_dot_V1 + dg_dh(h) * sin * e[0] + gh * cos * e[3]) + dD
+        u = N / F
+        return (u, (dN - u * dF) / F)
+
+
+    def get_dot_tetha(
+        self,
+        branch: int,
+        t: float,
+        vals: npt.NDArray
+    )-> tuple[float, npt.NDArray]:
+        h = vals[0]
+        v = vals[2]
+        tetha = vals[3]
+        gd = self.guidance
+        e = self.e
+        if branch == 0:
+            return (0., self.zero)
+        elif branch == 1:
+            a = gd.arc_time
+            q = t / a - gd.arc_offset
+            root = np.sqrt(1 - q ** 2)
+            f_q = - q / (a * root ** 3)
+            grad = (1 / (a ** 2 * root) - f_q * t / a ** 2) * self.unit("arc_time") - f_q * self.unit("arc_offset")
+            return (-1 / a / root, grad)
+        elif branch == 2:
+            ex = 2500 * np.exp(2 * t / gd.exp_time)
+            Q = ex - gd.exp_c
+            root = np.sqrt(Q)
+            f_Q = gd.exp_rate / (2 * Q * root)
+            dQ = - ex * 2 * t / gd.exp_time ** 2 * self.unit("exp_time") - self.unit("exp_c")
+            return (- gd.exp_rate / root, - self.unit("exp_rate") / root + f_Q * dQ)
+        elif branch == 3:
+            r_t = r0 + gd.h_target
+            K = np.sqrt(G * M / r_t) / r_t
+            dK = - 1.5 * K / r_t * self.unit("h_target")
+            gh = g(h)
+            cos = np.cos(tetha)
+            base = gh / v - K
+            d_base = dg_dh(h) / v * e[0] - gh / v ** 2 * e[2] - dK
+            return (- base * cos, - (d_base * cos - base * np.sin(tetha) * e[3]))
+        return (- tetha / 10, - e[3] / 10)
+
+
+    def get_rhs(
+        self,
+        t: float,
+        vals: npt.NDArray,
+        phase
+    )-> tuple[npt.NDArray, npt.NDArray]:
+        # правая часть func_phase и матрица ее производных размера 5 x (5 + len(names))
+        h = vals[0]
+        v = vals[2]
+        tetha = vals[3]
+        e = self.e
+        m, F, D = self.get_forces(vals, phase.stage)
+        if phase.is_sliding:
+            u, du = self.get_throttle(vals, m, F, D)
+        elif phase.is_active:
+            u, du = 1., self.zero
+        else:
+            u, du = 0., self.zero
+        (m, dm), (F, dF), (D, dD) = m, F, D
+
+        r = r0 + h
+        sin = np.sin(tetha)
+        cos = np.cos(tetha)
+        gh = g(h)
+        acc = (u * F - D) / m
+        dot_tetha, d_dot_tetha = self.get_dot_tetha(phase.branch, t, vals)
+
+        f = np.array([v * sin, r0 / r * v * cos, acc - gh * sin, dot_tetha, u])
+        jac = np.empty((5, self.n))
+        jac[0] = sin * e[2] + v * cos * e[3]
+        jac[1] = - r0 / r ** 2 * v * cos * e[0] + r0 / r * cos * e[2] - r0 / r * v * sin * e[3]
+        jac[2] = (u * dF + F * du - dD) / m - acc / m * dm - dg_dh(h) * sin * e[0] - gh * cos * e[3]
+        jac[3] = d_dot_tetha
+        jac[4] = du
+        return (f, jac)
+
+
+    def func(
+        self,
+        t: float,
+        z: npt.NDArray,
+        phase
+    )-> npt.NDArray:
+        # z = (y, S), S = dy/dp по строкам: dS/dt = J_y S + J_p
+        f, jac = self.get_rhs(t, z, phase)
+        S = z[5:].reshape(5, -1)
+        return np.concatenate((f, (jac[:, :5] @ S + jac[:, 5:]).ravel()))
+
+
+    def get_event_grad(
+        self,
+        vals: npt.NDArray,
+        name: str,
+        phase
+    )-> npt.NDArray:
+        # градиент функции события по состоянию и параметрам
+        e = self.e
+        if name in ("cutoff", "ignition"):
+            h = vals[0]
+            V1 = np.sqrt(G * M / (r0 + h))
+            return e[2] + V1 / (2 * (r0 + h)) * e[0]
+        elif name in ("saturate", "release"):
+            return self.get_throttle(vals, *self.get_forces(vals, phase.stage))[1]
+        elif name == "burnout":
+            return e[4] - self.burnout_grads[phase.stage]
+        elif name in ("circular", "noncircular"):
+            return e[3]
+        raise ValueError(f"no sensitivity jump for event {name}")
+
+
+    def get_switch_grad(
+        self,
+        t: float,
+        vals: npt.NDArray,
+        S: npt.NDArray,
+        name: str,
+        phase
+    )-> npt.NDArray:
+        # производная момента переключения по параметрам
+        if name == "pitch":
+            return self.switch_grads[min(phase.branch, 2)][5:]
+        f, _ = self.get_rhs(t, vals, phase)
+        grad = self.get_event_grad(vals, name, phase)
+        return - (grad[:5] @ S + grad[5:]) / (grad[:5] @ f)
+
+
+def solve_sensitivity(
+    rt: Rocket,
+    atm: Atmosphere,
+    t_span: tuple[float, float] = (0., 2000.),
+    names: tuple[str, ...] = PARAMS,
+    guidance: Guidance = GUIDANCE,
+    stop: str = "cutoff",
+    rtol: float = 1e-8,
+    atol: float = 1e-6,
+    method: str = "RK45",
+    sens_atol: float = None
+)-> OptimizeResult:
+    # один проход по участкам main.integrate_phases с уравнениями в вариациях;
+    # в точках переключения S терпит скачок S+ = S- + (f- - f+) dt/dp
+    from main import get_initial_phase, get_phase_end, get_phase_events, get_next_phase
+
+    sens = Sensitivity(rt, atm, guidance, names)
+    n_p = len(names)
+    t = t_span[0]
+    y = np.array([0, 0, 0, np.pi / 2, 0], dtype=float)
+    S = np.zeros((5, n_p))
+    phase = get_initial_phase(t, y, rt, guidance)
+    switches = []
+    nfev = 0
+    status = 0
+    message = "The solver successfully reached the end of the integration interval."
+    name = None
+    dt_dp = np.zeros(n_p)
+    # при sens_atol=None шаг выбирается только по состоянию, как в обычном решателе,
+    # а чувствительности интегрируются на тех же шагах
+    tol = np.concatenate((np.full(5, atol), np.full(5 * n_p, np.inf if sens_atol is None else sens_atol)))
+
+    while t < t_span[1]:
+        t_end = min(get_phase_end(phase, rt, guidance), t_span[1])
+        events = get_phase_events(rt, atm, phase)
+        sol = integrate.solve_ivp(
+            sens.func, t_span=(t, t_end), y0=np.concatenate((y, S.ravel())), method=method, rtol=rtol, atol=tol,
+            args=(phase,), events=[e for e, _ in events]
+        )
+        nfev += sol.nfev
+        if sol.status < 0:
+            status = sol.status
+            message = sol.message
+            break
+
+        fired = [k for k, te in enumerate(sol.t_events) if te.size]
+        if sol.status == 1 and fired:
+            k = fired[0]
+            t_next = sol.t_events[k][0]
+            z = sol.y_events[k][0]
+            name = events[k][1]
+        else:
+            t_next = t_end
+            z = sol.y[:, -1]
+            name = "pitch" if t_end < t_span[1] else "end"
+        y = z[:5].copy()
+        S = z[5:].reshape(5, n_p)
+        t = t_next
+        switches.append((t, name))
+        if name == "end":
+            break
+
+        dt_dp = sens.get_switch_grad(t, y, S, name, phase)
+        f_minus, _ = sens.get_rhs(t, y, phase)
+        if name == stop:
+            # состояние в момент события: dy/dp = S- + f- dt/dp
+            S = S + np.outer(f_minus, dt_dp)
+            break
+        phase = get_next_phase(t, y, name, phase, rt, atm, guidance)
+        f_plus, _ = sens.get_rhs(t, y, phase)
+        S = S + np.outer(f_minus - f_plus, dt_dp)
+
+    return OptimizeResult(
+        t=t, y=y, jac=S, dt_dp=dt_dp if name == stop else np.zeros(n_p), names=names, event=name,
+        switches=switches, nfev=nfev, status=status, message=message, success=status >= 0,
+    )
+
+
+def get_event_state(
+    rt: Rocket,
+    atm: Atmosphere,
+    guidance: Guidance,
+    t_span: tuple[float, float],
+    stop: str = "cutoff",
+    **options
+)-> tuple[float, npt.NDArray]:
+    # момент и состояние первого события stop обычным решателем по участкам
+    from main import solver
+
+    tr = solver(rt, atm, t_span, segmented=True, dense=True, guidance=guidance, **options)
+    for ts, name in tr.switches:
+        if name == stop:
+            return (ts, tr(ts))
+    return (t_span[1], tr(t_span[1]))
+
+
+def finite_difference(
+    rt: Rocket,
+    atm: Atmosphere,
+    t_span: tuple[float, float] = (0., 2000.),
+    names: tuple[str, ...] = PARAMS,
+    guidance: Guidance = GUIDANCE,
+    stop: str = "cutoff",
+    rel_step: float = 1e-4,
+    **options
+)-> tuple[npt.NDArray, npt.NDArray]:
+    # центральные разности по 2 len(names) полным расчетам: якобиан состояния и производные момента события
+    p0 = get_params(rt, guidance, names)
+    jac = np.empty((5, len(names)))
+    dt_dp = np.empty(len(names))
+    for k in range(len(names)):
+        dp = rel_step * max(abs(p0[k]), 1.)
+        res = []
+        for sign in (1, -1):
+            p = p0.copy()
+            p[k] += sign * dp
+            rt_k, guidance_k = build(rt, guidance, names, p)
+            res.append(get_event_state(rt_k, atm, guidance_k, t_span, stop, **options))
+        dt_dp[k] = (res[0][0] - res[1][0]) / (2 * dp)
+        jac[:, k] = (res[0][1] - res[1][1]) / (2 * dp)
+    return (jac, dt_dp)
+
+
+if __name__ == "__main__":
+    import time
+
+    rt = Rocket()
+    atm = Atmosphere(fast=True)
+    t_span = (0., 2000.)
+
+    start = time.time()
+    res = solve_sensitivity(rt, atm, t_span, rtol=1e-10, atol=1e-8)
+    t_sens = time.time() - start
+    start = time.time()
+    jac_fd, dt_fd = finite_difference(rt, atm, t_span, rtol=1e-10, atol=1e-8)
+    t_fd = time.time() - start
+
+    print(f"{res.event} at t = {res.t:.3f} s, y = {res.y}")
+    print(f"sensitivity: {t_sens:.2f} s, nfev = {res.nfev}; finite differences ({2 * len(PARAMS)} runs): "
+          f"{t_fd:.2f} s, ratio = {t_fd / t_sens:.1f}")
+    for k, name in enumerate(res.names):
+        err = np.abs(res.jac[:3, k] - jac_fd[:3, k]) / np.maximum(np.abs(jac_fd[:3, k]), 1e-12)
+        print(f"{name:12s} dh = {res.jac[0, k]: .4e} ({jac_fd[0, k]: .4e}), dv = {res.jac[2, k]: .4e} "
+              f"({jac_fd[2, k]: .4e}), dt = {res.dt_dp[k]: .4e} ({dt_fd[k]: .4e}), max rel. err h, s, v = {err.max():.1e}")
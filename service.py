@@ -0,0 +1,359 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import cli
+from cache import describe
+from vehicle import read_spec
+
+
+HOST = "127.0.0.1"
+PORT = 8765
+# число хранимых завершенных заданий: по ним отвечают status и повторные отправки
+RETAIN = 1000
+
+# поля задания - параметры ракеты и решателя из групп vehicle и solver командной строки
+SPEC_FIELDS = ("vehicle", "fuel_m1", "fuel_m2", "dot_m1", "dot_m2", "v_a1", "v_a2", "payload", "cx_scale",
+               "rho_scale", "t_start", "t_end", "direct", "backend", "method", "rtol", "atol", "step", "fast_atm",
+               "coast")
+
+
+def normalize_spec(
+    spec: dict
+)-> dict:
+    # полное задание со значениями по умолчанию: одинаковые расчеты дают одинаковый ключ
+    unknown = set(spec) - set(SPEC_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown job fields: {sorted(unknown)}")
+    defaults = vars(cli.get_parser().parse_args([]))
+    res = {name: spec.get(name, defaults[name]) for name in SPEC_FIELDS}
+    for name in ("fuel_m1", "fuel_m2", "dot_m1", "dot_m2", "v_a1", "v_a2", "cx_scale", "rho_scale", "t_start",
+                 "t_end", "rtol", "atol", "step"):
+        if res[name] is not None:
+            res[name] = float(res[name])
+    for name in ("payload", "direct", "fast_atm", "coast"):
+        res[name] = bool(res[name])
+    if not res["direct"]:
+        res.update({name: val for name, val in cli.SEGMENTED_DEFAULTS.items() if res[name] is None})
+    return res
+
+
+def get_job_id(
+    spec: dict,
+    description: dict = None
+)-> str:
+    # в ключ входит содержимое описания ракеты, а не только его имя: после правки файла задание считается заново
+    data = json.dumps([spec, describe(description)], sort_keys=True)
+    return hashlib.sha1(data.encode()).hexdigest()[:16]
+
+
+def run_job(
+    job_id: str,
+    spec: dict,
+    progress: "multiprocessing.Queue" = None,
+    description: dict = None
+)-> dict:
+    # выполняется в процессе пула; промежуточные сообщения уходят в очередь progress
+    from main import solver
+
+    args = argparse.Namespace(**spec)
+    rt, atm = cli.build_vehicle(args, description)
+    t_end = args.t_end if args.t_end is not None else 32900 + int(np.ceil(rt.engine_time))
+    t_span = (args.t_start, t_end)
+    options = cli.get_options(args)
+    if progress is not None:
+        progress.put((job_id, {"t": t_span[0], "switch": "start", "phase": None}))
+    if progress is not None and not args.direct:
+        def report(t, y, phase, name):
+            progress.put((job_id, {"t": float(t), "h": float(y[0]), "v": float(y[2]), "switch": name,
+                                   "phase": {k: int(v) for k, v in phase._asdict().items()}}))
+        options["progress"] = report
+
+    start = time.perf_counter()
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            tr = solver(rt, atm, t_span, segmented=not args.direct, dense=True, **options)
+    except (KeyboardInterrupt, ArithmeticError, ValueError, RuntimeWarning) as e:
+        return {"status": -2, "message": f"{type(e).__name__}: {e}", "elapsed": time.perf_counter() - start}
+
+    return {
+        "status": int(tr.status),
+        "message": tr.message,
+        "elapsed": time.perf_counter() - start,
+        "t_span": list(t_span),
+        "nfev": int(tr.nfev),
+        "switches": [(float(t), name) for t, name in tr.switches],
+        "result": cli.get_summary(tr),
+        "analytics": cli.get_analytics(tr, rt, atm),
+        "final_state": dict(zip(tr.names, map(float, tr(t_span[1])))),
+    }
+
+
+class Job:
+
+    def __init__(
+        self,
+        job_id: str,
+        spec: dict,
+        description: dict = None
+    )-> None:
+        self.id = job_id
+        self.spec = spec
+        self.description = description
+        self.state = "queued"
+        self.progress = None
+        self.result = None
+        self.submitted = time.time()
+        self.subscribers = []
+        self.task = None
+
+
+    def get_status(
+        self
+    )-> dict:
+        return {"type": "status", "job": self.id, "state": self.state, "progress": self.progress,
+                "result": self.result}
+
+
+    def publish(
+        self,
+        msg: dict
+    )-> None:
+        for q in self.subscribers:
+            q.put_nowait(msg)
+
+
+class JobService:
+    # задания принимаются по TCP на локальном адресе, по одному JSON-сообщению на строку;
+    # одинаковые задания (по ключу нормализованного задания) считаются один раз
+
+    def __init__(
+        self,
+        workers: int = None,
+        host: str = HOST,
+        port: int = PORT,
+        retain: int = RETAIN
+    )-> None:
+        self.workers = os.cpu_count() if workers is None else workers
+        self.host = host
+        self.port = port
+        self.retain = retain
+        self.jobs = {}
+        # завершенные задания в порядке завершения
+        self.finished = {}
+        self.nsubmitted = 0
+        self.pool = None
+        self.manager = None
+        self.progress = None
+        self.server = None
+        # открытые соединения: writer -> задача обработчика
+        self.clients = {}
+
+
+    async def start(
+        self
+    )-> None:
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.manager = multiprocessing.Manager()
+        self.progress = self.manager.Queue()
+        self.progress_task = asyncio.create_task(self.forward_progress())
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+
+    async def close(
+        self
+    )-> None:
+        # подписчики сначала получают результат отмененных заданий, затем соединения закрываются:
+        # чтение из закрытого соединения возвращает конец потока и обработчики завершаются сами
+        self.server.close()
+        tasks = [job.task for job in self.jobs.values() if job.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for writer in self.clients:
+            writer.close()
+        await asyncio.gather(*self.clients.values(), return_exceptions=True)
+        await self.server.wait_closed()
+        self.progress_task.cancel()
+        # ожидание выполняемого расчета не останавливает цикл событий
+        await asyncio.to_thread(self.pool.shutdown, cancel_futures=True)
+        self.manager.shutdown()
+
+
+    async def forward_progress(
+        self
+    )-> None:
+        # очередь процессов пула читается в потоке, сообщения раздаются подписчикам задания
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                job_id, info = await loop.run_in_executor(None, self.progress.get, True, 0.5)
+            except queue.Empty:
+                continue
+            job = self.jobs.get(job_id)
+            # сообщения из очереди могут прийти позже результата
+            if job is None or job.state in ("done", "failed"):
+                continue
+            job.state = "running"
+            job.progress = info
+            job.publish({"type": "progress", "job": job_id, **info})
+
+
+    def submit(
+        self,
+        spec: dict
+    )-> tuple[Job, bool]:
+        spec = normalize_spec(spec)
+        try:
+            description = None if spec["vehicle"] is None else read_spec(spec["vehicle"])
+        except OSError as e:
+            raise ValueError(f"vehicle {spec['vehicle']!r}: {e}") from e
+        job_id = get_job_id(spec, description)
+        self.nsubmitted += 1
+        job = self.jobs.get(job_id)
+        if job is not None and job.state != "failed":
+            return (job, True)
+        job = Job(job_id, spec, description)
+        self.jobs[job_id] = job
+        job.task = asyncio.create_task(self.run(job))
+        return (job, False)
+
+
+    async def run(
+        self,
+        job: Job
+    )-> None:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.pool, run_job, job.id, job.spec, self.progress, job.description)
+        try:
+            job.result = await future
+            job.state = "done"
+        except asyncio.CancelledError:
+            job.result = {"status": -3, "message": "service stopped"}
+            job.state = "failed"
+            raise
+        except Exception as e:
+            job.result = {"status": -3, "message": f"{type(e).__name__}: {e}"}
+            job.state = "failed"
+        finally:
+            job.publish({"type": "result", "job": job.id, "state": job.state, "result": job.result})
+            self.retire(job)
+
+
+    def retire(
+        self,
+        job: Job
+    )-> None:
+        # хранятся последние retain завершенных заданий; задание, отправленное заново под тем же ключом
+        # после ошибки, не удаляется вместе со старым
+        self.finished.pop(job.id, None)
+        self.finished[job.id] = job
+        while len(self.finished) > self.retain:
+            job_id = next(iter(self.finished))
+            old = self.finished.pop(job_id)
+            if self.jobs.get(job_id) is old:
+                del self.jobs[job_id]
+
+
+    def get_stats(
+        self
+    )-> dict:
+        states = {}
+        for job in self.jobs.values():
+            states[job.state] = states.get(job.state, 0) + 1
+        return {"type": "stats", "workers": self.workers, "submitted": self.nsubmitted, "jobs": len(self.jobs),
+                "states": states}
+
+
+    async def handle(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter
+    )-> None:
+        # запросы: submit (с подпиской на ход расчета), status, stats
+        async def send(msg):
+            writer.write(json.dumps(msg).encode() + b"\n")
+            await writer.drain()
+
+        self.clients[writer] = asyncio.current_task()
+        try:
+            while line := await reader.readline():
+                try:
+                    req = json.loads(line)
+                    op = req.get("op")
+                    if op == "submit":
+                        job, duplicate = self.submit(req.get("spec", {}))
+                        await send({"type": "accepted", "job": job.id, "duplicate": duplicate, "state": job.state})
+                        if not req.get("wait", True):
+                            continue
+                        if job.state in ("done", "failed"):
+                            await send({"type": "result", "job": job.id, "state": job.state, "result": job.result})
+                            continue
+                        q = asyncio.Queue()
+                        job.subscribers.append(q)
+                        if job.progress is not None:
+                            await send({"type": "progress", "job": job.id, **job.progress})
+                        try:
+                            while True:
+                                msg = await q.get()
+                                await send(msg)
+                                if msg["type"] == "result":
+                                    break
+                        finally:
+                            job.subscribers.remove(q)
+                    elif op == "status":
+                        job = self.jobs.get(req.get("job"))
+                        if job is None:
+                            await send({"type": "error", "message": f"unknown job {req.get('job')}"})
+                        else:
+                            await send(job.get_status())
+                    elif op == "stats":
+                        await send(self.get_stats())
+                    else:
+                        await send({"type": "error", "message": f"unknown op {op}"})
+                except (ValueError, TypeError) as e:
+                    await send({"type": "error", "message": f"{type(e).__name__}: {e}"})
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.pop(writer, None)
+            writer.close()
+
+
+async def serve(
+    workers: int = None,
+    host: str = HOST,
+    port: int = PORT,
+    retain: int = RETAIN
+)-> None:
+    service = JobService(workers, host, port, retain)
+    await service.start()
+    print(f"serving on {service.host}:{service.port}, workers = {service.workers}")
+    try:
+        await service.server.serve_forever()
+    finally:
+        await service.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальный сервис расчетов выведения")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--retain", type=int, default=RETAIN, help="число хранимых завершенных заданий")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.workers, args.host, args.port, args.retain))
+    except KeyboardInterrupt:
+        pass
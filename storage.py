@@ -0,0 +1,289 @@
+import json
+import os
+import struct
+
+import numpy as np
+import numpy.typing as npt
+
+from atmosphere import Atmosphere
+from rocket import Rocket
+from trajectory import Trajectory
+from forces import g, thirst_force, G, M, r0
+
+
+COLUMNS = ("t", "h", "s", "v", "tetha", "mass", "thrust", "drag", "mach", "rho")
+
+HEADER = "header.json"
+
+# заголовок .npy версии 1.0 фиксированной длины: размер столбца дописывается при закрытии
+NPY_HEADER_LEN = 128
+
+
+def get_npy_header(
+    dtype: np.dtype,
+    n: int
+)-> bytes:
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (dtype.str, n)
+    header = header.ljust(NPY_HEADER_LEN - 10 - 1) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+def get_throttle_array(
+    trajectory: Trajectory,
+    t: npt.NDArray,
+    y: npt.NDArray,
+    m: npt.NDArray,
+    F: npt.NDArray,
+    D: npt.NDArray
+)-> npt.NDArray:
+    # режим двигателя берется с участков траектории, без участков - по условию v > V1(h) + 5
+    h, _, v, tetha, _ = y
+    V1 = np.sqrt(G * M / (r0 + h))
+    u = (~(v > V1 + 5)).astype(float)
+    if trajectory is None:
+        return u
+
+    ids = trajectory.get_segment_ids(t)
+    for k in np.unique(ids):
+        phase = trajectory.segments[k][2]
+        if phase is None:
+            continue
+        mask = ids == k
+        if phase.is_sliding:
+            dot_V1 = - V1[mask] / (2 * (r0 + h[mask])) * v[mask] * np.sin(tetha[mask])
+            Fk = F[mask]
+            u[mask] = np.where(Fk > 0., (m[mask] * (dot_V1 + g(h[mask]) * np.sin(tetha[mask])) + D[mask]) /
+                               np.where(Fk > 0., Fk, 1.), 0.)
+        else:
+            u[mask] = 1. if phase.is_active else 0.
+    return u
+
+
+def get_columns(
+    t: npt.NDArray,
+    y: npt.NDArray,
+    rt: Rocket,
+    atm: Atmosphere,
+    trajectory: Trajectory = None
+)-> dict[str, npt.NDArray]:
+    h, s, v, tetha, tau = y
+
+    P = np.zeros(h.shape)
+    rho = np.zeros(h.shape)
+    mach = np.full(h.shape, np.nan)
+    air = h <= 1200000.
+    if air.any():
+        if atm.fast:
+            Pa, rho_a, Vs = atm.get_table().get_state(h[air])
+            rho_a = atm.rho_scale * rho_a
+        else:
+            _, Pa, rho_a, _, Vs = atm.get_state(h[air])
+        P[air] = Pa
+        rho[air] = rho_a
+        mach[air] = v[air] / Vs
+    Cx = np.zeros(h.shape)
+    Cx[air] = rt.get_aero_cf_array(mach[air], h[air])
+    drag = Cx * rho * (v ** 2) * rt.S / 2
+
+    # масса и тяга по накопленному времени работы двигателей
+    mass = rt.get_current_total_m(tau)
+    F = thirst_force(*rt.get_thirst_vals(tau), P)
+    thrust = get_throttle_array(trajectory, t, y, mass, F, drag) * F
+
+    return {
+        "t": t, "h": h, "s": s, "v": v, "tetha": tetha,
+        "mass": mass, "thrust": thrust, "drag": drag, "mach": mach, "rho": rho,
+    }
+
+
+class TrajectoryWriter:
+    # столбцы пишутся порциями в отдельные .npy файлы каталога, описание - в header.json
+
+    def __init__(
+        self,
+        path: str,
+        dtype: npt.DTypeLike = np.float64,
+        columns: tuple[str, ...] = COLUMNS,
+        attrs: dict = None
+    )-> None:
+        self.path = path
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        self.columns = columns
+        self.attrs = {} if attrs is None else attrs
+        self.n = 0
+        os.makedirs(path, exist_ok=True)
+        self.files = {}
+        for name in columns:
+            f = open(os.path.join(path, name + ".npy"), "wb")
+            f.write(get_npy_header(self.dtype, 0))
+            self.files[name] = f
+
+
+    def __enter__(
+        self
+    )-> "TrajectoryWriter":
+        return self
+
+
+    def __exit__(
+        self,
+        *exc
+    )-> None:
+        self.close()
+
+
+    def write(
+        self,
+        chunk: dict[str, npt.NDArray]
+    )-> None:
+        n = len(chunk["t"])
+        for name in self.columns:
+            col = np.asarray(chunk[name], dtype=self.dtype)
+            if col.shape != (n,):
+                raise ValueError(f"column {name} has shape {col.shape}, expected ({n},)")
+            self.files[name].write(col.tobytes())
+        self.n += n
+
+
+    def write_trajectory(
+        self,
+        rt: Rocket,
+        atm: Atmosphere,
+        trajectory: Trajectory = None,
+        t: npt.NDArray = None,
+        y: npt.NDArray = None,
+        chunk_size: int = 65536
+    )-> None:
+        # при заданном t значения берутся из плотного вывода порциями, вся сетка в памяти не собирается
+        if t is None:
+            t = trajectory.t
+            y = trajectory.y
+        for lo in range(0, len(t), chunk_size):
+            t_chunk = t[lo:lo + chunk_size]
+            y_chunk = trajectory(t_chunk) if y is None else y[:, lo:lo + chunk_size]
+            self.write(get_columns(t_chunk, y_chunk, rt, atm, trajectory))
+        if trajectory is not None:
+            self.attrs.setdefault("switches", [(float(ts), name) for ts, name in trajectory.switches])
+            self.attrs.setdefault("status", int(trajectory.status))
+
+
+    def close(
+        self
+    )-> None:
+        if not self.files:
+            return
+        for f in self.files.values():
+            f.seek(0)
+            f.write(get_npy_header(self.dtype, self.n))
+            f.close()
+        self.files = {}
+        header = {
+            "length": self.n,
+            "dtype": self.dtype.str,
+            "columns": list(self.columns),
+            "attrs": self.attrs,
+        }
+        with open(os.path.join(self.path, HEADER), "w") as f:
+            json.dump(header, f, indent=1)
+
+
+def save_trajectory(
+    path: str,
+    rt: Rocket,
+    atm: Atmosphere,
+    solution,
+    t: npt.NDArray = None,
+    dtype: npt.DTypeLike = np.float64,
+    chunk_size: int = 65536,
+    attrs: dict = None
+)-> None:
+    with TrajectoryWriter(path, dtype, attrs=attrs) as writer:
+        if isinstance(solution, Trajectory):
+            writer.write_trajectory(rt, atm, solution, t, chunk_size=chunk_size)
+        else:
+            writer.write_trajectory(rt, atm, None, solution.t, solution.y, chunk_size)
+
+
+class TrajectoryArchive:
+    # чтение без копирования: столбцы открываются как np.memmap при первом обращении
+
+    def __init__(
+        self,
+        path: str
+    )-> None:
+        self.path = path
+        with open(os.path.join(path, HEADER)) as f:
+            header = json.load(f)
+        self.n = header["length"]
+        self.dtype = np.dtype(header["dtype"])
+        self.columns = tuple(header["columns"])
+        self.attrs = header["attrs"]
+        self._cols = {}
+
+
+    def __len__(
+        self
+    )-> int:
+        return self.n
+
+
+    def __getitem__(
+        self,
+        name: str
+    )-> np.memmap:
+        if name not in self._cols:
+            if name not in self.columns:
+                raise KeyError(name)
+            self._cols[name] = np.memmap(os.path.join(self.path, name + ".npy"), dtype=self.dtype, mode="r",
+                                         offset=NPY_HEADER_LEN, shape=(self.n,))
+        return self._cols[name]
+
+
+    def get_slice(
+        self,
+        t0: float,
+        t1: float
+    )-> slice:
+        t = self["t"]
+        return slice(int(np.searchsorted(t, t0, side="left")), int(np.searchsorted(t, t1, side="right")))
+
+
+    def between(
+        self,
+        t0: float,
+        t1: float,
+        columns: tuple[str, ...] = None
+    )-> dict[str, np.memmap]:
+        sl = self.get_slice(t0, t1)
+        return {name: self[name][sl] for name in (self.columns if columns is None else columns)}
+
+
+def open_archives(
+    root: str
+)-> list[TrajectoryArchive]:
+    return [TrajectoryArchive(os.path.join(root, name)) for name in sorted(os.listdir(root))
+            if os.path.isfile(os.path.join(root, name, HEADER))]
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+    from main import solver
+
+    rt = Rocket()
+    atm = Atmosphere(fast=True)
+    t_span = (0, 2000)
+    tr = solver(rt, atm, t_span, segmented=True, dense=True)
+    t = np.linspace(t_span[0], t_span[1], 1000000)
+
+    with tempfile.TemporaryDirectory() as root:
+        for dtype in (np.float64, np.float32):
+            path = os.path.join(root, np.dtype(dtype).name)
+            start = time.time()
+            save_trajectory(path, rt, atm, tr, t, dtype=dtype)
+            print(f"{np.dtype(dtype).name}: write time = {time.time() - start:.2f} s")
+
+        for arc in open_archives(root):
+            cols = arc.between(500., 600., ("t", "h", "thrust"))
+            print(arc.path, len(arc), np.asarray(arc["h"]).max(), cols["t"].shape, np.load(
+                os.path.join(arc.path, "v.npy"), mmap_mode="r")[-1])
@@ -0,0 +1,205 @@
+import itertools
+from typing import NamedTuple
+
+import numpy as np
+import numpy.typing as npt
+
+from atmosphere import Atmosphere
+from rocket import Rocket
+from guidance import Guidance, GUIDANCE
+from trajectory import Trajectory
+
+
+# параметры программы тангажа в порядке вступления в силу: ветви 0, 1, 2, 3-4
+LEVELS = (
+    ("t1",),
+    ("arc_time", "arc_offset"),
+    ("exp_rate", "exp_time", "exp_c", "t3_fraction"),
+    ("h_target",),
+)
+
+
+class Checkpoint(NamedTuple):
+    t: float
+    y: npt.NDArray
+    phase: tuple
+    segments: list
+    switches: list
+    ts: list
+    ys: list
+    nfev: int
+
+
+def get_grid(
+    grid: dict[str, list[float]],
+    base: Guidance = GUIDANCE
+)-> list[Guidance]:
+    names = list(grid)
+    return [base._replace(**dict(zip(names, vals))) for vals in itertools.product(*(grid[n] for n in names))]
+
+
+def get_key(
+    guidance: Guidance,
+    level: int,
+    exclude: tuple[str, ...] = ()
+)-> tuple:
+    names = [n for lv in LEVELS[:level + 1] for n in lv if n not in exclude]
+    return tuple(getattr(guidance, n) for n in names)
+
+
+def extend(
+    cp: Checkpoint,
+    run
+)-> Checkpoint:
+    return Checkpoint(
+        run.t_last, run.y_last, run.phase_last,
+        cp.segments + run.segments, cp.switches + run.switches,
+        cp.ts + [run.t[1:]], cp.ys + [run.y[:, 1:]], cp.nfev + run.nfev,
+    )
+
+
+def split(
+    cp: Checkpoint,
+    run,
+    t_split: float,
+    rt: Rocket,
+    guidance: Guidance
+)-> Checkpoint:
+    # состояние общего участка в момент t_split, после которого траектории расходятся
+    from main import get_phase
+
+    if t_split >= run.t_last:
+        ph = run.phase_last
+        phase = get_phase(run.t_last, ph.stage, ph.is_active, ph.is_sliding, ph.is_circular, rt, guidance)
+        return extend(cp, run)._replace(phase=phase)
+
+    segments = []
+    for seg in run.segments:
+        if seg[1] < t_split:
+            segments.append(seg)
+        else:
+            segments.append((seg[0], t_split, seg[2], seg[3]))
+            break
+    ph = segments[-1][2]
+    y = segments[-1][3](t_split)
+    phase = get_phase(t_split, ph.stage, ph.is_active, ph.is_sliding, ph.is_circular, rt, guidance)
+
+    mask = (run.t > cp.t) & (run.t < t_split)
+    return Checkpoint(
+        t_split, y, phase,
+        cp.segments + segments, cp.switches + [sw for sw in run.switches if sw[0] < t_split] + [(t_split, "pitch")],
+        cp.ts + [run.t[mask], np.array([t_split])], cp.ys + [run.y[:, mask], y[:, None]], cp.nfev + run.nfev,
+    )
+
+
+def refresh_phase(
+    cp: Checkpoint,
+    rt: Rocket,
+    guidance: Guidance
+)-> tuple:
+    from main import get_phase
+
+    ph = cp.phase
+    return get_phase(cp.t, ph.stage, ph.is_active, ph.is_sliding, ph.is_circular, rt, guidance)
+
+
+def run_sweep(
+    rt: Rocket,
+    atm: Atmosphere,
+    t_span: tuple[float, float],
+    grid: dict[str, list[float]],
+    base: Guidance = GUIDANCE,
+    **options
+)-> dict:
+    # общие начальные участки траекторий интегрируются один раз и переиспользуются из контрольных точек
+    from main import integrate_phases, get_initial_phase
+
+    guidances = get_grid(grid, base)
+    t_final = t_span[1]
+    nfev = 0
+
+    y0 = np.array([0, 0, 0, np.pi / 2, 0], dtype=float)
+    start = Checkpoint(t_span[0], y0, None, [], [], [np.array([t_span[0]], dtype=float)], [y0[:, None]], 0)
+
+    def advance(cp, guidance, branches):
+        nonlocal nfev
+        phase = cp.phase if cp.phase is not None else get_initial_phase(cp.t, cp.y, rt, guidance)
+        run = integrate_phases(rt, atm, cp.t, cp.y, phase, t_final, guidance, branches, **options)
+        nfev += run.nfev
+        return run
+
+    # ветвь 0 не зависит от параметров: один прогон до наибольшего t1, затем разбиение
+    level0 = {}
+    t1s = sorted({gd.t1 for gd in guidances})
+    run = advance(start, base._replace(t1=t1s[-1]), {0})
+    for t1 in t1s:
+        level0[(t1,)] = split(start, run, t1, rt, base._replace(t1=t1))
+
+    level1 = {}
+    for gd in guidances:
+        key = get_key(gd, 1)
+        if key not in level1:
+            cp = level0[get_key(gd, 0)]
+            cp = cp._replace(phase=refresh_phase(cp, rt, gd))
+            level1[key] = extend(cp, advance(cp, gd, {1}))
+
+    # на ветви 2 разные t3 различаются только моментом окончания ветви
+    level2 = {}
+    groups = {}
+    for gd in guidances:
+        groups.setdefault(get_key(gd, 2, exclude=("t3_fraction",)), []).append(gd)
+    for key, gds in groups.items():
+        cp = level1[get_key(gds[0], 1)]
+        fractions = sorted({gd.t3_fraction for gd in gds})
+        gd_max = gds[0]._replace(t3_fraction=fractions[-1])
+        run = advance(cp._replace(phase=refresh_phase(cp, rt, gd_max)), gd_max, {2})
+        for fr in fractions:
+            gd = gds[0]._replace(t3_fraction=fr)
+            level2[get_key(gd, 2)] = split(cp, run, gd.get_t3(rt), rt, gd)
+
+    trajectories = []
+    naive_nfev = 0
+    for gd in guidances:
+        cp = level2[get_key(gd, 2)]
+        cp = cp._replace(phase=refresh_phase(cp, rt, gd))
+        run = advance(cp, gd, None)
+        leaf = extend(cp, run)
+        naive_nfev += leaf.nfev
+        trajectories.append(Trajectory(
+            np.concatenate(leaf.ts), np.concatenate(leaf.ys, axis=1), leaf.segments, leaf.switches,
+            leaf.nfev, run.status, run.message,
+        ))
+
+    return {
+        "guidance": guidances,
+        "trajectories": trajectories,
+        "nfev": nfev,
+        "naive_nfev": naive_nfev,
+    }
+
+
+if __name__ == "__main__":
+    import time
+    from main import solver
+
+    rt = Rocket()
+    atm = Atmosphere()
+    t_span = (0, 1000)
+    grid = {
+        "t1": [30.2, 31.0, 32.0],
+        "exp_rate": [0.68, 77 / 109],
+        "t3_fraction": [0.15, 0.2, 0.25],
+        "h_target": [250000., 270000., 290000.],
+    }
+
+    start = time.time()
+    res = run_sweep(rt, atm, t_span, grid)
+    elapsed = time.time() - start
+    print(f"{len(res['trajectories'])} runs, time = {elapsed:.2f} s, nfev = {res['nfev']}, "
+          f"naive nfev = {res['naive_nfev']}, ratio = {res['nfev'] / res['naive_nfev']:.3f}")
+
+    start = time.time()
+    for gd, tr in zip(res["guidance"][:3], res["trajectories"][:3]):
+        ref = solver(rt, atm, t_span, segmented=True, dense=True, guidance=gd)
+        print(gd.t1, gd.t3_fraction, gd.h_target, np.abs(ref(t_span[1]) - tr(t_span[1])))
+    print(f"3 direct runs, time = {time.time() - start:.2f} s")
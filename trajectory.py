@@ -0,0 +1,140 @@
+import numpy as np
+import numpy.typing as npt
+from scipy.optimize import brentq
+
+
+class Trajectory:
+    # траектория как набор участков с плотным выводом solve_ivp;
+    # хранятся только принятые шаги интегратора, значения в остальных точках считаются по запросу
+    names = ("h", "s", "v", "tetha", "tau")
+
+    def __init__(
+        self,
+        t: npt.NDArray,
+        y: npt.NDArray,
+        segments: list,
+        switches: list = None,
+        nfev: int = 0,
+        status: int = 0,
+        message: str = ""
+    )-> None:
+        self.t = t
+        self.y = y
+        self.segments = segments
+        self.switches = switches if switches is not None else []
+        self.nfev = nfev
+        self.status = status
+        self.message = message
+        self.success = status >= 0
+        self.t_start = np.array([seg[0] for seg in segments])
+        self.t_end = np.array([seg[1] for seg in segments])
+
+
+    @classmethod
+    def from_result(
+        cls,
+        sol
+    )-> "Trajectory":
+        return cls(sol.t, sol.y, sol.segments, sol.get("switches"), sol.nfev, sol.status, sol.message)
+
+
+    @property
+    def t_span(
+        self
+    )-> tuple[float, float]:
+        return (self.t[0], self.t[-1])
+
+
+    @property
+    def phases(
+        self
+    )-> list:
+        return [seg[:3] for seg in self.segments]
+
+
+    def get_segment_ids(
+        self,
+        t: npt.NDArray
+    )-> npt.NDArray:
+        # на границе участков значение берется с предыдущего участка
+        ids = np.searchsorted(self.t_end, t, side="left")
+        return np.clip(ids, 0, len(self.segments) - 1)
+
+
+    def __call__(
+        self,
+        t: npt.ArrayLike
+    )-> npt.NDArray:
+        t = np.asarray(t, dtype=float)
+        if t.ndim == 0:
+            return self.segments[int(self.get_segment_ids(t))][3](t)
+
+        res = np.empty((self.y.shape[0], t.size))
+        ids = self.get_segment_ids(t)
+        for k in np.unique(ids):
+            mask = ids == k
+            res[:, mask] = self.segments[k][3](t[mask])
+        return res
+
+
+    def resample(
+        self,
+        n: int = None,
+        dt: float = None
+    )-> tuple[npt.NDArray, npt.NDArray]:
+        t0, t1 = self.t_span
+        if dt is not None:
+            t = np.arange(t0, t1, dt)
+            t = np.append(t, t1)
+        else:
+            t = np.linspace(t0, t1, 1000 if n is None else n)
+        return (t, self(t))
+
+
+    def time_at_altitude(
+        self,
+        h: float
+    )-> npt.NDArray:
+        # все пересечения высоты h между соседними принятыми шагами
+        d = self.y[0] - h
+        idx = np.nonzero(np.sign(d[:-1]) * np.sign(d[1:]) < 0)[0]
+        times = [brentq(lambda t: self(t)[0] - h, self.t[i], self.t[i+1], xtol=1e-10) for i in idx]
+        times.extend(self.t[d == 0].tolist())
+        return np.sort(np.array(times, dtype=float))
+
+
+    def at_altitude(
+        self,
+        h: float
+    )-> tuple[npt.NDArray, npt.NDArray]:
+        t = self.time_at_altitude(h)
+        return (t, self(t))
+
+
+    def get_column(
+        self,
+        name: str,
+        t: npt.ArrayLike = None
+    )-> npt.NDArray:
+        i = self.names.index(name)
+        if t is None:
+            return self.y[i]
+        return self(t)[i]
+
+
+    @property
+    def nbytes(
+        self
+    )-> int:
+        size = self.t.nbytes + self.y.nbytes
+        for seg in self.segments:
+            sol = seg[3]
+            if hasattr(sol, "nbytes"):
+                # integrators.DenseSolution хранит шаги в общих массивах
+                size += sol.nbytes
+                continue
+            size += sol.ts.nbytes
+            for interp in sol.interpolants:
+                size += sum(getattr(interp, name).nbytes for name in ("Q", "y_old", "h")
+                            if isinstance(getattr(interp, name, None), np.ndarray))
+        return size
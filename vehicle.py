@@ -0,0 +1,168 @@
+import json
+import os
+
+try:
+    import tomllib
+except ImportError:
+    # Python < 3.11: описания в TOML не читаются, JSON доступен всегда
+    tomllib = None
+
+from rocket import Rocket, Stage
+
+
+VEHICLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vehicles")
+
+# обязательные поля ступени и бокового блока (блока - для одного экземпляра, count - число блоков)
+STAGE_FIELDS = ("m", "fuel_m", "dot_m", "v_a", "F_a", "p_a")
+
+# прочитанные описания по (путь, время изменения, размер): повторные загрузки в серии расчетов не читают файл
+_specs = {}
+
+
+def get_stage(
+    spec: dict,
+    count: int = 1
+)-> Stage:
+    missing = [name for name in STAGE_FIELDS if name not in spec]
+    if missing:
+        raise ValueError(f"stage {spec.get('name')!r} is missing {missing}")
+    vals = {name: float(spec[name]) for name in STAGE_FIELDS}
+    if vals["fuel_m"] <= 0. or vals["dot_m"] <= 0.:
+        raise ValueError(f"stage {spec.get('name')!r}: fuel_m and dot_m must be positive")
+    if count != 1:
+        # count одинаковых блоков - один блок с суммарными массами, расходом и площадью среза
+        for name in ("m", "fuel_m", "dot_m", "F_a"):
+            vals[name] *= count
+    return Stage(**vals, name=spec.get("name"))
+
+
+def build_rocket(
+    spec: dict,
+    **overrides
+)-> Rocket:
+    # spec: stages (список ступеней, у ступени - список boosters), payload, m, S, cx_scale;
+    # overrides заменяют поля верхнего уровня
+    spec = {**spec, **overrides}
+    if not spec.get("stages"):
+        raise ValueError(f"vehicle {spec.get('name')!r} has no stages")
+    unknown = set(spec) - {"name", "stages", "payload", "m", "S", "cx_scale"}
+    if unknown:
+        raise ValueError(f"unknown vehicle fields: {sorted(unknown)}")
+
+    stages = []
+    boosters = []
+    for k, st in enumerate(spec["stages"]):
+        stages.append(get_stage(st))
+        for bst in st.get("boosters", ()):
+            boosters.append((k, get_stage(bst, int(bst.get("count", 1)))))
+    return Rocket(
+        stages=stages,
+        boosters=boosters,
+        payload_m=float(spec.get("payload", 0.)),
+        cx_scale=float(spec.get("cx_scale", 1.)),
+        m=spec.get("m"),
+        S=spec.get("S"),
+    )
+
+
+def get_spec(
+    rt: Rocket
+)-> dict:
+    # описание ракеты в формате build_rocket
+    def stage_spec(st, boosters=()):
+        res = {} if st.name is None else {"name": st.name}
+        res.update((name, getattr(st, name)) for name in STAGE_FIELDS)
+        if boosters:
+            res["boosters"] = [stage_spec(bst) for bst in boosters]
+        return res
+
+    return {
+        "stages": [stage_spec(st, [bst for j, bst in rt.boosters if j == k]) for k, st in enumerate(rt.stages)],
+        "payload": rt.payload_m,
+        "m": rt.m,
+        "S": rt.S,
+        "cx_scale": rt.cx_scale,
+    }
+
+
+def find_vehicle(
+    path: str
+)-> str:
+    # имя без каталога и расширения ищется среди описаний в vehicles/
+    if os.path.exists(path):
+        return path
+    for ext in (".json", ".toml"):
+        candidate = os.path.join(VEHICLE_DIR, path + ext)
+        if os.path.exists(candidate):
+            return candidate
+    raise FileNotFoundError(f"vehicle description {path!r} not found")
+
+
+def read_spec(
+    path: str
+)-> dict:
+    path = find_vehicle(path)
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    spec = _specs.get(key)
+    if spec is None:
+        if path.endswith(".toml"):
+            if tomllib is None:
+                raise ValueError(f"{path}: TOML requires Python 3.11+, use JSON")
+            with open(path, "rb") as f:
+                spec = tomllib.load(f)
+        else:
+            with open(path) as f:
+                spec = json.load(f)
+        _specs[key] = spec
+    return spec
+
+
+def load_vehicle(
+    path: str,
+    **overrides
+)-> Rocket:
+    try:
+        return build_rocket(read_spec(path), **overrides)
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}") from None
+
+
+def load_vehicles(
+    paths: list[str],
+    **overrides
+)-> list[Rocket]:
+    return [load_vehicle(path, **overrides) for path in paths]
+
+
+def save_vehicle(
+    rt: Rocket,
+    path: str
+)-> None:
+    with open(path, "w") as f:
+        json.dump(get_spec(rt), f, indent=1)
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    import time
+
+    for path in sys.argv[1:] or sorted(os.listdir(VEHICLE_DIR)):
+        rt = load_vehicle(path if os.path.exists(path) else os.path.join(VEHICLE_DIR, path))
+        print(path, f"stages = {len(rt.stages)}, boosters = {len(rt.boosters)}, burns = {rt.nburns}, "
+              f"engine time = {rt.engine_time:.2f} s, m0 = {rt.get_current_total_m(0.):.0f} kg")
+
+    # серия из сотен описаний
+    with tempfile.TemporaryDirectory() as root:
+        base = get_spec(Rocket())
+        paths = []
+        for k in range(500):
+            spec = {**base, "cx_scale": 0.8 + 0.4 * k / 500}
+            paths.append(os.path.join(root, f"vehicle_{k}.json"))
+            with open(paths[-1], "w") as f:
+                json.dump(spec, f)
+        for label in ("cold", "warm"):
+            start = time.perf_counter()
+            rockets = load_vehicles(paths)
+            print(f"{label}: {len(rockets)} vehicles in {1e3 * (time.perf_counter() - start):.1f} ms")